@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Архивирование старых инсайтов в Parquet
+
+Месяцы старше ARCHIVE_KEEP_MONTHS выгружаются в ARCHIVE_DIR/insights_YYYY_MM.parquet
+(сжатие zstd), после чего секция месяца удаляется из БД. Экспорт продолжает
+читать архивные месяцы через read_archived_insights().
+
+Запуск (нужен DATABASE_URL, см. migrate.py, и pyarrow):
+    python archive.py list                    # архивные файлы
+    python archive.py run                     # архивировать старые месяцы
+    python archive.py run --keep-months 6
+"""
+
+import os
+import sys
+import logging
+import argparse
+from datetime import date, datetime
+from decouple import config
+
+from migrate import connect, get_dialect
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = config('ARCHIVE_DIR', default='archive')
+ARCHIVE_KEEP_MONTHS = config('ARCHIVE_KEEP_MONTHS', default=12, cast=int)
+
+COLUMNS = ['id', 'created_at', 'theme', 'description', 'macro_region',
+           'industry', 'file_id', 'filename', 'user_id',
+           'file_type', 'file_size', 'file_unique_id', 'file_hash']
+
+# Поля, по которым можно фильтровать архив (есть во всех архивных файлах)
+ARCHIVE_FILTERS = ('macro_region', 'industry', 'user_id')
+
+
+def month_start(value) -> date:
+    """Первое число месяца для даты/datetime/ISO-строки"""
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archive_path(month: date) -> str:
+    return os.path.join(ARCHIVE_DIR, f"insights_{month:%Y_%m}.parquet")
+
+
+def archived_months() -> list:
+    """Месяцы, для которых есть архивный файл"""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+
+    months = []
+    for filename in os.listdir(ARCHIVE_DIR):
+        if filename.startswith('insights_') and filename.endswith('.parquet'):
+            year, month = filename[len('insights_'):-len('.parquet')].split('_')
+            months.append(date(int(year), int(month), 1))
+    return sorted(months)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("pyarrow is required for archiving: pip install pyarrow")
+    return pa, pq
+
+
+def _iso(value) -> str:
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def read_archived_insights(date_from=None, date_to=None, filters: dict = None) -> list:
+    """
+    Чтение инсайтов из архива
+
+    Args:
+        date_from: начало периода включительно (None - без ограничения)
+        date_to: конец периода не включительно (None - без ограничения)
+        filters: равенства по полям (macro_region, industry, user_id)
+
+    Условия передаются в pyarrow и проверяются по статистике групп строк,
+    поэтому неподходящие части файла не читаются.
+
+    Returns:
+        список записей в том же формате, что и из БД (новые сначала)
+    """
+    months = archived_months()
+    if date_from is not None:
+        months = [m for m in months if m >= month_start(date_from)]
+    if date_to is not None:
+        months = [m for m in months if m <= month_start(date_to)]
+    if not months:
+        return []
+
+    _, pq = _import_pyarrow()
+
+    conditions = [
+        (field, '=', value)
+        for field, value in (filters or {}).items()
+        if field in ARCHIVE_FILTERS and value is not None
+    ]
+    if date_from is not None:
+        conditions.append(('created_at', '>=', _iso(date_from)))
+    if date_to is not None:
+        conditions.append(('created_at', '<', _iso(date_to)))
+
+    rows = []
+    for month in months:
+        rows += pq.read_table(archive_path(month), filters=conditions or None).to_pylist()
+
+    rows.sort(key=lambda r: r['created_at'], reverse=True)
+    logger.info(f"Read {len(rows)} archived insights from {len(months)} file(s)")
+    return rows
+
+
+def write_parquet(rows: list, path: str):
+    """Атомарная запись строк в Parquet (через временный файл)"""
+    pa, pq = _import_pyarrow()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    table = pa.Table.from_pylist(
+        [{column: row.get(column) for column in COLUMNS} for row in rows],
+        schema=pa.schema([
+            ('id', pa.int64()),
+            ('created_at', pa.string()),
+            ('theme', pa.string()),
+            ('description', pa.string()),
+            ('macro_region', pa.string()),
+            ('industry', pa.string()),
+            ('file_id', pa.string()),
+            ('filename', pa.string()),
+            ('user_id', pa.int64()),
+            ('file_type', pa.string()),
+            ('file_size', pa.int64()),
+            ('file_unique_id', pa.string()),
+            ('file_hash', pa.string()),
+        ])
+    )
+
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, path)
+
+
+def _fetch_month(conn, dialect: str, month: date) -> list:
+    p = '?' if dialect == 'sqlite' else '%s'
+    start, end = month, add_months(month, 1)
+    if dialect == 'sqlite':
+        start, end = start.isoformat(), end.isoformat()
+
+    cursor = conn.execute(
+        f"SELECT {', '.join(COLUMNS)} FROM insights "
+        f"WHERE created_at >= {p} AND created_at < {p} ORDER BY created_at DESC",
+        (start, end)
+    )
+    return [
+        {column: _iso(value) for column, value in zip(COLUMNS, row)}
+        for row in cursor.fetchall()
+    ]
+
+
+# Архивированные записи остаются в статистике (миграция 0007): в SQLite нет
+# секций, и триггеры вычитают удаляемые строки - заранее возвращаем их счетчики
+_SQLITE_KEEP_STATS = (
+    "INSERT INTO insight_stats_daily (day, macro_region, industry, total) "
+    "SELECT substr(created_at, 1, 10), macro_region, industry, count(*) FROM insights "
+    "WHERE created_at >= ? AND created_at < ? GROUP BY 1, 2, 3 "
+    "ON CONFLICT (day, macro_region, industry) DO UPDATE SET total = total + excluded.total",
+    "INSERT INTO insight_stats_users (user_id, total) "
+    "SELECT user_id, count(*) FROM insights "
+    "WHERE created_at >= ? AND created_at < ? GROUP BY user_id "
+    "ON CONFLICT (user_id) DO UPDATE SET total = total + excluded.total",
+)
+
+
+def _drop_month(conn, dialect: str, month: date):
+    if dialect == 'sqlite':
+        bounds = (month.isoformat(), add_months(month, 1).isoformat())
+        for sql in _SQLITE_KEEP_STATS:
+            conn.execute(sql, bounds)
+        conn.execute("DELETE FROM insights WHERE created_at >= ? AND created_at < ?", bounds)
+    else:
+        conn.execute("SELECT drop_insights_partition(%s)", (month,))
+
+
+def archive_month(conn, dialect: str, month: date) -> int:
+    """
+    Архивация одного месяца: выгрузка в Parquet и удаление из БД
+
+    Если файл месяца уже есть (например, после позднего импорта), строки объединяются.
+    """
+    rows = _fetch_month(conn, dialect, month)
+    path = archive_path(month)
+
+    if os.path.exists(path):
+        _, pq = _import_pyarrow()
+        known = {row['id'] for row in rows}
+        rows += [row for row in pq.read_table(path).to_pylist() if row['id'] not in known]
+        rows.sort(key=lambda r: r['created_at'], reverse=True)
+
+    write_parquet(rows, path)
+
+    _, pq = _import_pyarrow()
+    written = pq.ParquetFile(path).metadata.num_rows
+    if written != len(rows):
+        raise RuntimeError(f"Archive {path} has {written} rows, expected {len(rows)}")
+
+    _drop_month(conn, dialect, month)
+    logger.info(f"Archived {len(rows)} insights for {month:%Y-%m} to {path}")
+    return len(rows)
+
+
+def months_to_archive(conn, dialect: str, keep_months: int) -> list:
+    """Месяцы с данными старше keep_months"""
+    cutoff = add_months(month_start(date.today()), -keep_months)
+
+    if dialect == 'sqlite':
+        rows = conn.execute(
+            "SELECT DISTINCT substr(created_at, 1, 7) FROM insights WHERE created_at < ?",
+            (cutoff.isoformat(),)
+        ).fetchall()
+        return sorted(date.fromisoformat(f"{row[0]}-01") for row in rows)
+
+    rows = conn.execute(
+        "SELECT DISTINCT date_trunc('month', created_at)::date FROM insights WHERE created_at < %s",
+        (cutoff,)
+    ).fetchall()
+    return sorted(row[0] for row in rows)
+
+
+def run(database_url: str, keep_months: int = ARCHIVE_KEEP_MONTHS) -> int:
+    """Архивация всех месяцев старше keep_months, возвращает число строк"""
+    dialect = get_dialect(database_url)
+    conn = connect(database_url)
+    total = 0
+    try:
+        for month in months_to_archive(conn, dialect, keep_months):
+            if dialect == 'sqlite':
+                conn.execute("BEGIN")
+                try:
+                    total += archive_month(conn, dialect, month)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            else:
+                with conn.transaction():
+                    total += archive_month(conn, dialect, month)
+    finally:
+        conn.close()
+
+    logger.info(f"Archiving finished: {total} insights moved to {ARCHIVE_DIR}")
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Архивирование старых инсайтов в Parquet")
+    parser.add_argument('--database-url', default=config('DATABASE_URL', default=''),
+                        help="адрес БД (по умолчанию DATABASE_URL)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="показать архивные месяцы")
+    run_parser = subparsers.add_parser('run', help="архивировать старые месяцы")
+    run_parser.add_argument('--keep-months', type=int, default=ARCHIVE_KEEP_MONTHS,
+                            help="сколько последних месяцев оставить в БД")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'list':
+        for month in archived_months():
+            print(f"{month:%Y-%m}  {archive_path(month)}")
+        return
+
+    if not args.database_url:
+        parser.error("DATABASE_URL is not set")
+    run(args.database_url, args.keep_months)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
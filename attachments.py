@@ -0,0 +1,187 @@
+"""
+Вложения инсайтов
+
+При загрузке сохраняются тип файла, размер и file_unique_id (миграция 0004),
+по типу выбирается метод отправки: фото - send_photo, документ - send_document
+и т.д. Для старых записей без типа он угадывается, а если Telegram отверг
+file_id для выбранного метода, пробуются остальные; сработавший тип
+записывается в БД. Проверенные file_id кэшируются, чтобы повторная отправка
+шла сразу нужным методом.
+
+Несколько вложений отправляются альбомами (send_media_group, до 10 файлов).
+"""
+
+import logging
+from collections import OrderedDict
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+
+from database import update_insight
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_TYPES = ('document', 'photo', 'video', 'audio', 'animation', 'voice')
+
+# Метод Bot и имя параметра с файлом для каждого типа
+SEND_METHODS = {
+    'document': ('send_document', 'document'),
+    'photo': ('send_photo', 'photo'),
+    'video': ('send_video', 'video'),
+    'audio': ('send_audio', 'audio'),
+    'animation': ('send_animation', 'animation'),
+    'voice': ('send_voice', 'voice'),
+}
+
+# Какие типы можно объединять в один альбом (анимации и голосовые - только по одному)
+MEDIA_GROUPS = {
+    'photo': ('visual', InputMediaPhoto),
+    'video': ('visual', InputMediaVideo),
+    'document': ('document', InputMediaDocument),
+    'audio': ('audio', InputMediaAudio),
+}
+MEDIA_GROUP_SIZE = 10
+
+VALIDATED_CACHE_SIZE = 1000
+
+# Ответы Telegram, когда file_id есть, но не того типа ("can't use file of type Photo as Document")
+TYPE_MISMATCH_ERRORS = ("can't use file of type", "type of file mismatch")
+
+# id инсайта -> (тип, file_id), с которыми отправка прошла успешно
+_validated = OrderedDict()
+
+
+def attachment_from_message(message) -> dict:
+    """Метаданные вложения из сообщения или None, если вложения нет"""
+    for file_type in ATTACHMENT_TYPES:
+        media = getattr(message, file_type, None)
+        if not media:
+            continue
+        if file_type == 'photo':
+            media = media[-1]  # самый большой размер
+        return {
+            'file_id': media.file_id,
+            'file_unique_id': media.file_unique_id,
+            'file_type': file_type,
+            'file_size': media.file_size,
+            'filename': getattr(media, 'file_name', None),
+        }
+    return None
+
+
+def attachment_type(insight: dict) -> str:
+    """Тип вложения; для записей до миграции 0004 - по наличию имени файла"""
+    return insight.get('file_type') or ('document' if insight.get('filename') else 'photo')
+
+
+def _remember(insight_id, file_type: str, file_id: str):
+    _validated[insight_id] = (file_type, file_id)
+    _validated.move_to_end(insight_id)
+    while len(_validated) > VALIDATED_CACHE_SIZE:
+        _validated.popitem(last=False)
+
+
+def _is_type_mismatch(error: TelegramBadRequest) -> bool:
+    message = (error.message or '').lower()
+    return any(marker in message for marker in TYPE_MISMATCH_ERRORS)
+
+
+def forget(insight_id):
+    """Убрать вложение из кэша (инсайт изменен или удален)"""
+    _validated.pop(insight_id, None)
+
+
+async def _send_as(bot, chat_id, file_type: str, file_id: str, caption: str = None):
+    method, argument = SEND_METHODS[file_type]
+    return await getattr(bot, method)(chat_id, **{argument: file_id}, caption=caption)
+
+
+async def send_attachment(bot, chat_id, insight: dict, caption: str = None):
+    """
+    Отправка вложения инсайта подходящим методом
+
+    Returns:
+        отправленное сообщение
+
+    Raises:
+        TelegramBadRequest, если file_id не подошел ни для одного метода
+        или ошибка не связана с типом файла
+    """
+    file_type, file_id = _validated.get(insight['id'], (attachment_type(insight), insight['file_id']))
+    candidates = [file_type] + [t for t in ATTACHMENT_TYPES if t != file_type]
+
+    error = None
+    for candidate in candidates:
+        try:
+            sent = await _send_as(bot, chat_id, candidate, file_id, caption)
+        except TelegramBadRequest as e:
+            # Не тот тип файла - пробуем следующий; остальные ошибки (чат, file_id) сразу наверх
+            if not _is_type_mismatch(e):
+                raise
+            error = e
+            metrics.increment("attachments.type_mismatch")
+            continue
+
+        sent_attachment = attachment_from_message(sent)
+        _remember(insight['id'], candidate, sent_attachment['file_id'] if sent_attachment else file_id)
+
+        if candidate != insight.get('file_type'):
+            logger.info(f"Insight {insight['id']} attachment type is {candidate}")
+            await update_insight(insight['id'], {'file_type': candidate})
+        return sent
+
+    raise error
+
+
+async def send_attachments(bot, chat_id, insights: list) -> int:
+    """
+    Отправка вложений нескольких инсайтов альбомами
+
+    Вложения группируются по совместимым типам (фото и видео вместе, документы
+    и аудио отдельно) и уходят по MEDIA_GROUP_SIZE в одном сообщении. Если
+    альбом не принят, его файлы отправляются по одному через send_attachment.
+
+    Returns:
+        количество отправленных вложений
+    """
+    groups = {}
+    singles = []
+    for insight in insights:
+        if not insight.get('file_id'):
+            continue
+        file_type, _ = _validated.get(insight['id'], (attachment_type(insight), None))
+        if file_type in MEDIA_GROUPS:
+            groups.setdefault(MEDIA_GROUPS[file_type][0], []).append(insight)
+        else:
+            singles.append(insight)
+
+    sent = 0
+    for group in groups.values():
+        for start in range(0, len(group), MEDIA_GROUP_SIZE):
+            chunk = group[start:start + MEDIA_GROUP_SIZE]
+            if len(chunk) == 1:
+                singles.extend(chunk)
+                continue
+
+            media = []
+            for insight in chunk:
+                file_type, file_id = _validated.get(insight['id'], (attachment_type(insight), insight['file_id']))
+                media.append(MEDIA_GROUPS[file_type][1](media=file_id, caption=insight.get('theme')))
+
+            try:
+                await bot.send_media_group(chat_id, media=media)
+                metrics.increment("attachments.media_groups")
+                sent += len(chunk)
+            except TelegramBadRequest as e:
+                logger.warning(f"Media group rejected, sending {len(chunk)} file(s) one by one: {e}")
+                singles.extend(chunk)
+
+    for insight in singles:
+        try:
+            await send_attachment(bot, chat_id, insight, caption=insight.get('theme'))
+            sent += 1
+        except TelegramBadRequest as e:
+            logger.error(f"Attachment of insight {insight['id']} can not be sent: {e}")
+
+    return sent
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Сравнение форматов экспорта: скорость и пиковая память
+
+Каждый формат из exporters.EXPORTERS запускается в отдельном процессе на
+одних и тех же синтетических данных, чтобы пиковая память (ru_maxrss)
+одного формата не влияла на другой.
+
+    python bench_export.py                      # 100000 строк, все доступные форматы
+    python bench_export.py --rows 20000 --formats csv xlsx_fast
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import importlib
+import resource
+import tempfile
+import multiprocessing
+from datetime import datetime, timedelta
+
+
+def synthetic_insights(rows: int, seed: int = 1) -> list:
+    """Инсайты, похожие на настоящие: темы, описания разной длины, часть с файлами"""
+    from config import MACRO_REGIONS, INDUSTRIES
+
+    rng = random.Random(seed)
+    words = ["рынок", "спрос", "поставки", "клиенты", "цены", "регион", "сделка", "конкурент",
+             "бюджет", "тендер", "рост", "снижение", "проект", "контракт", "импорт"]
+    started = datetime(2024, 1, 1)
+    return [
+        {
+            'id': i,
+            'created_at': (started + timedelta(minutes=7 * i)).isoformat(),
+            'theme': " ".join(rng.choices(words, k=rng.randint(3, 8))).capitalize(),
+            'description': " ".join(rng.choices(words, k=rng.randint(20, 120))).capitalize(),
+            'macro_region': rng.choice(MACRO_REGIONS),
+            'industry': rng.choice(INDUSTRIES),
+            'file_id': f"file{i}" if rng.random() < 0.3 else None,
+        }
+        for i in range(1, rows + 1)
+    ]
+
+
+def _max_rss_bytes() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux - килобайты, macOS - байты
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _run_one(format_name: str, rows: int, directory: str, results):
+    from exporters import EXPORTERS
+
+    insights = synthetic_insights(rows)
+    exporter = EXPORTERS[format_name]
+    filename = os.path.join(directory, f"bench_{format_name}{exporter.extension}")
+
+    # Импорт библиотеки формата не входит в замер
+    if exporter.requires:
+        importlib.import_module(exporter.requires)
+    if format_name == 'parquet':
+        importlib.import_module('pyarrow.parquet')
+
+    baseline = _max_rss_bytes()
+    started = time.perf_counter()
+    exporter.write(insights, filename)
+    elapsed = time.perf_counter() - started
+
+    results.put((format_name, elapsed, _max_rss_bytes() - baseline, os.path.getsize(filename)))
+
+
+def main(argv=None):
+    from exporters import EXPORTERS, available_exporters
+
+    parser = argparse.ArgumentParser(description="Сравнение форматов экспорта")
+    parser.add_argument('--rows', type=int, default=100_000, help="число строк (по умолчанию 100000)")
+    parser.add_argument('--formats', nargs='*', choices=list(EXPORTERS), help="форматы (по умолчанию все доступные)")
+    args = parser.parse_args(argv)
+
+    formats = args.formats or [exporter.name for exporter in available_exporters()]
+    context = multiprocessing.get_context('spawn')
+
+    print(f"{'формат':<12}{'секунд':>10}{'строк/с':>12}{'пик памяти, МБ':>17}{'файл, МБ':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        for format_name in formats:
+            if not EXPORTERS[format_name].available:
+                print(f"{format_name:<12} не установлен {EXPORTERS[format_name].requires}")
+                continue
+
+            results = context.Queue()
+            process = context.Process(target=_run_one, args=(format_name, args.rows, directory, results))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print(f"{format_name:<12} ошибка (код {process.exitcode})")
+                continue
+
+            name, elapsed, peak, size = results.get()
+            print(f"{name:<12}{elapsed:>10.2f}{args.rows / elapsed:>12.0f}"
+                  f"{peak / 1024 ** 2:>17.1f}{size / 1024 ** 2:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
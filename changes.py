@@ -0,0 +1,139 @@
+"""
+Журнал изменений: сброс кэшей по событиям из insight_changes (миграция 0009)
+
+Триггеры записывают каждую вставку, правку и удаление инсайта с растущим
+номером version - и сделанные ботом, и сделанные в обход него (Supabase
+Table Editor, SQL, другие воркеры cluster.py). Каждый процесс бота раз в
+CHANGES_POLL_SECONDS читает события после последнего прочитанного номера
+и сбрасывает только затронутые ими кэши (invalidation.invalidate).
+Удаление в insights физическое: событие D хранит удаленную строку (old_row),
+по ней сбрасывается то же, что при правке.
+
+Пока журнал читается, количества и статистика держатся в памяти
+CHANGES_CACHE_MINUTES вместо CACHE_TIMEOUT_MINUTES: устаревают они не по
+времени, а по событиям. Если журнал недоступен (миграция не применена,
+ошибка запроса), сроки возвращаются к короткому CACHE_TIMEOUT_MINUTES.
+
+Номера выдает последовательность, поэтому транзакция с меньшим номером
+может зафиксироваться позже большего. Такой пропуск ждет CHANGES_GAP_SECONDS:
+события после пропуска применяются сразу, а курсор стоит на пропуске, пока
+он не заполнится (или не окажется номером откаченной транзакции).
+"""
+
+import time
+import asyncio
+import logging
+
+from config import CACHE_TIMEOUT_MINUTES, CHANGES_POLL_SECONDS, CHANGES_CACHE_MINUTES
+from database import count_cache, get_changes, get_last_change_version
+from invalidation import invalidate
+from attachments import forget
+from stats import stats
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CHANGES_BATCH_SIZE = 500
+CHANGES_GAP_SECONDS = 30
+
+
+class ChangeFeed:
+    """Чтение журнала изменений с последнего прочитанного номера"""
+
+    def __init__(self, interval: float = CHANGES_POLL_SECONDS, batch_size: int = CHANGES_BATCH_SIZE,
+                 gap_seconds: float = CHANGES_GAP_SECONDS):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.gap_seconds = gap_seconds
+        self.version = None      # все события до этого номера включительно применены
+        self.healthy = False
+        self._seen = set()       # примененные номера после пропуска
+        self._gap_since = None
+
+    async def poll(self) -> bool:
+        """Одно чтение журнала; False - журнал недоступен"""
+        if self.version is None:
+            # Начало - текущий конец журнала: до запуска кэшей еще не было
+            self.version = await get_last_change_version()
+            return self.version is not None
+
+        changes = await get_changes(self.version, self.batch_size)
+        if changes is None:
+            return False
+
+        fresh = [change for change in changes if change['version'] not in self._seen]
+        if fresh:
+            await self.apply(fresh)
+            self._seen.update(change['version'] for change in fresh)
+        self._advance()
+        return True
+
+    def _advance(self):
+        while self.version + 1 in self._seen:
+            self.version += 1
+            self._seen.discard(self.version)
+
+        if not self._seen:
+            self._gap_since = None
+            return
+
+        now = time.monotonic()
+        if self._gap_since is None:
+            self._gap_since = now
+        elif now - self._gap_since > self.gap_seconds:
+            # Номер так и не появился - транзакция откачена
+            logger.debug(f"Skipping change versions {self.version + 1}..{min(self._seen) - 1}")
+            self.version = min(self._seen) - 1
+            self._gap_since = None
+            self._advance()
+
+    async def apply(self, changes: list):
+        """Сброс кэшей, затронутых событиями, одним проходом на пачку"""
+        rows, edited, archived = [], False, False
+        for change in changes:
+            if change['op'] == 'A':
+                archived = True
+                continue
+            rows += [row for row in (change.get('old_row'), change.get('new_row')) if row]
+            if change['op'] in ('U', 'D'):
+                edited = True
+                forget(change['insight_id'])
+
+        if archived:
+            # Месяц ушел в архив целиком: меняются почти все количества, выгрузки читают архив
+            await invalidate(None)
+        if rows:
+            await invalidate(rows, exports=edited)
+        stats.expire()
+
+        metrics.increment("changes.events", len(changes))
+        logger.debug(f"Applied {len(changes)} insight change(s) up to version {changes[-1]['version']}")
+
+    def _set_healthy(self, healthy: bool):
+        if healthy == self.healthy:
+            return
+        self.healthy = healthy
+        minutes = CHANGES_CACHE_MINUTES if healthy else CACHE_TIMEOUT_MINUTES
+        count_cache.ttl = stats.ttl = minutes * 60
+        metrics.set_gauge("changes.healthy", int(healthy))
+        if healthy:
+            logger.info(f"Reading insight changes from version {self.version}, caches kept {minutes:g} min")
+        else:
+            logger.warning(f"Insight changes are not available, caches kept {minutes:g} min")
+
+    async def watch(self):
+        """Фоновое чтение журнала (запускается при старте каждого процесса бота)"""
+        if self.interval <= 0:
+            return
+
+        while True:
+            try:
+                healthy = await self.poll()
+            except Exception as e:
+                logger.error(f"Insight changes poll failed: {e}", exc_info=True)
+                healthy = False
+            self._set_healthy(healthy)
+            await asyncio.sleep(self.interval)
+
+
+change_feed = ChangeFeed()
@@ -0,0 +1,162 @@
+"""
+Графики статистики
+
+PNG тепловой карты регион x отрасль и динамики по неделям. matplotlib
+(backend Agg) работает в отдельном процессе, чтобы отрисовка не занимала
+цикл событий и GIL процесса бота.
+
+График определяется данными: версия - хеш входных чисел. Одинаковые данные
+не перерисовываются (кэш в памяти), одновременные запросы одного графика
+рисуются один раз (singleflight.py), а после первой отправки хранится
+file_id фото в Telegram - дальше график уходит без загрузки.
+"""
+
+import io
+import json
+import hashlib
+import logging
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from config import MACRO_REGIONS, INDUSTRIES
+from singleflight import SingleFlight
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CHART_CACHE_SIZE = 32
+
+_executor = None
+_renders = SingleFlight("chart_renders")
+_charts = OrderedDict()
+
+
+@dataclass
+class Chart:
+    kind: str
+    version: str
+    png: bytes
+    file_id: Optional[str] = None
+
+    @property
+    def filename(self) -> str:
+        return f"{self.kind}_{self.version[:8]}.png"
+
+
+# ==================== Отрисовка (в процессе-воркере) ====================
+
+def _figure_png(fig) -> bytes:
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buffer, format='png')
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def render_heatmap(regions: list, industries: list, matrix: list) -> bytes:
+    """Тепловая карта: строки - регионы, столбцы - отрасли, в клетках количество"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(9, 6), dpi=110)
+    image = ax.imshow(matrix, cmap='Blues', aspect='auto')
+    ax.set_xticks(range(len(industries)), labels=industries, rotation=30, ha='right')
+    ax.set_yticks(range(len(regions)), labels=regions)
+    ax.set_title("Инсайты: регион × отрасль")
+
+    peak = max((max(row) for row in matrix), default=0)
+    for y, row in enumerate(matrix):
+        for x, value in enumerate(row):
+            if value:
+                ax.text(x, y, str(value), ha='center', va='center',
+                        color='white' if value > peak / 2 else 'black', fontsize=9)
+
+    fig.colorbar(image, ax=ax)
+    return _figure_png(fig)
+
+
+def render_weekly(labels: list, values: list) -> bytes:
+    """Столбцы по неделям"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(9, 4), dpi=110)
+    bars = ax.bar(labels, values, color='#4472C4')
+    ax.bar_label(bars)
+    ax.set_title("Новые инсайты по неделям")
+    ax.set_ylabel("Инсайтов")
+    ax.spines[['top', 'right']].set_visible(False)
+    return _figure_png(fig)
+
+
+RENDERERS = {
+    'heatmap': render_heatmap,
+    'weekly': render_weekly,
+}
+
+
+# ==================== Данные и кэш ====================
+
+def heatmap_data(aggregate) -> tuple:
+    heatmap = aggregate.heatmap()
+    return MACRO_REGIONS, INDUSTRIES, [[heatmap[(region, industry)] for industry in INDUSTRIES]
+                                       for region in MACRO_REGIONS]
+
+
+def weekly_data(aggregate) -> tuple:
+    weekly = aggregate.weekly()
+    return [f"{monday:%d.%m}" for monday, _ in weekly], [total for _, total in weekly]
+
+
+def chart_version(kind: str, data: tuple) -> str:
+    raw = json.dumps([kind, data], ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: воркер не наследует состояние бота (цикл событий, соединения)
+        _executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+async def _render(kind: str, version: str, data: tuple) -> Chart:
+    with metrics.timed(f"charts.render.{kind}"):
+        png = await asyncio.get_running_loop().run_in_executor(_pool(), RENDERERS[kind], *data)
+    logger.info(f"Chart {kind} rendered ({len(png)} bytes)")
+
+    chart = Chart(kind, version, png)
+    _charts[(kind, version)] = chart
+    while len(_charts) > CHART_CACHE_SIZE:
+        _charts.popitem(last=False)
+    return chart
+
+
+async def get_chart(kind: str, data: tuple) -> Chart:
+    """График по данным: из кэша или отрисованный в процессе-воркере"""
+    version = chart_version(kind, data)
+    chart = _charts.get((kind, version))
+    if chart is not None:
+        _charts.move_to_end((kind, version))
+        metrics.increment("charts.hits")
+        return chart
+
+    chart, _ = await _renders.do((kind, version), lambda: _render(kind, version, data))
+    return chart
+
+
+def shutdown():
+    """Остановка процесса отрисовки (при остановке бота)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
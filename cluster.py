@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Многопроцессный webhook-режим
+
+Фронтовой процесс принимает webhook на PORT и пересылает каждое обновление
+одному из воркеров по хешу chat_id. Один чат всегда попадает в один воркер,
+поэтому FSM-сессии и кэши остаются локальными для процесса, а общим между
+воркерами остается только БД. Воркеры - обычные приложения main.create_app()
+на unix-сокетах; упавший воркер перезапускается.
+
+Запуск:
+    python cluster.py                 # WORKERS воркеров (по умолчанию - число ядер)
+    python cluster.py --workers 4
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import multiprocessing
+from aiohttp import web, ClientSession, UnixConnector, ClientError
+from decouple import config
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WORKERS = config('WORKERS', default=os.cpu_count() or 1, cast=int)
+WORKER_SOCKET_DIR = config('WORKER_SOCKET_DIR', default=tempfile.gettempdir())
+WORKER_FORWARD_TIMEOUT = config('WORKER_FORWARD_TIMEOUT', default=60, cast=float)
+
+# Типы обновлений, в которых есть чат; для остальных маршрут строится по пользователю
+CHAT_UPDATE_TYPES = ('message', 'edited_message', 'channel_post', 'edited_channel_post',
+                     'my_chat_member', 'chat_member', 'chat_join_request')
+USER_UPDATE_TYPES = ('inline_query', 'chosen_inline_result', 'shipping_query',
+                     'pre_checkout_query', 'poll_answer')
+
+
+def route_key(update: dict) -> int:
+    """chat_id обновления (или id пользователя, если чата нет)"""
+    for update_type in CHAT_UPDATE_TYPES:
+        if update_type in update:
+            return update[update_type]['chat']['id']
+
+    callback = update.get('callback_query')
+    if callback:
+        message = callback.get('message')
+        return message['chat']['id'] if message else callback['from']['id']
+
+    for update_type in USER_UPDATE_TYPES:
+        if update_type in update:
+            sender = update[update_type].get('from') or update[update_type].get('user')
+            if sender:
+                return sender['id']
+
+    return update.get('update_id', 0)
+
+
+def worker_index(update: dict, workers: int) -> int:
+    return route_key(update) % workers
+
+
+def worker_socket(index: int) -> str:
+    return os.path.join(WORKER_SOCKET_DIR, f"insights-bot-worker-{index}.sock")
+
+
+# ==================== ВОРКЕР ====================
+
+def run_worker(index: int):
+    """Процесс-воркер: полноценное webhook-приложение на своем unix-сокете"""
+    import main
+
+    path = worker_socket(index)
+    if os.path.exists(path):
+        os.remove(path)
+
+    logger.info(f"Worker {index} (pid {os.getpid()}) listening on {path}")
+    # Задачи по расписанию (scheduler.py) - в одном воркере, а не в каждом
+    web.run_app(main.create_app(mode="worker", run_scheduler=index == 0), path=path, print=None)
+
+
+# ==================== ФРОНТ ====================
+
+class Cluster:
+    """Запуск и перезапуск воркеров, маршрутизация обновлений"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.processes = [None] * workers
+        self.sessions = []
+        self._context = multiprocessing.get_context('spawn')
+        self._monitor = None
+
+    def _start_worker(self, index: int):
+        process = self._context.Process(target=run_worker, args=(index,), name=f"worker-{index}", daemon=True)
+        process.start()
+        self.processes[index] = process
+        metrics.increment("cluster.worker_starts")
+
+    async def _watch_workers(self):
+        while True:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logger.warning(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    self._start_worker(index)
+
+    async def on_startup(self, app: web.Application):
+        # Миграции - один раз здесь, а не одновременно в каждом воркере
+        from database import init_database
+        await init_database()
+
+        for index in range(self.workers):
+            self._start_worker(index)
+
+        # Отдельная сессия keep-alive на каждый сокет воркера
+        self.sessions = [
+            ClientSession(connector=UnixConnector(path=worker_socket(index)))
+            for index in range(self.workers)
+        ]
+        self._monitor = asyncio.create_task(self._watch_workers())
+
+        # Webhook ставит только фронт; воркеры (mode="worker") его не трогают
+        from aiogram import Bot
+        from config import BOT_TOKEN, WEBHOOK_URL
+
+        async with Bot(token=BOT_TOKEN) as bot:
+            await bot.set_webhook(f"{WEBHOOK_URL}/webhook")
+        logger.info(f"Cluster of {self.workers} workers, webhook set to {WEBHOOK_URL}/webhook")
+
+    async def on_cleanup(self, app: web.Application):
+        if self._monitor:
+            self._monitor.cancel()
+
+        from aiogram import Bot
+        from config import BOT_TOKEN
+
+        async with Bot(token=BOT_TOKEN) as bot:
+            await bot.delete_webhook()
+
+        for session in self.sessions:
+            await session.close()
+
+        for process in self.processes:
+            if process and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process:
+                process.join(timeout=10)
+
+        logger.info(f"Metrics: {metrics.snapshot()}")
+
+    async def forward_update(self, request: web.Request) -> web.Response:
+        """Пересылка обновления воркеру, отвечающему за чат"""
+        body = await request.read()
+        try:
+            index = worker_index(json.loads(body), self.workers)
+        except (ValueError, KeyError, TypeError):
+            return web.Response(status=400)
+
+        started = time.perf_counter()
+        try:
+            async with self.sessions[index].post(
+                "http://worker/webhook",
+                data=body,
+                headers={"Content-Type": "application/json"},
+                timeout=WORKER_FORWARD_TIMEOUT,
+            ) as response:
+                payload = await response.read()
+                metrics.increment(f"cluster.worker_{index}.updates")
+                return web.Response(status=response.status, body=payload,
+                                    content_type=response.content_type)
+        except (ClientError, asyncio.TimeoutError) as e:
+            # Telegram повторит доставку, когда воркер поднимется
+            logger.warning(f"Worker {index} is unavailable: {e}")
+            metrics.increment("cluster.forward_errors")
+            return web.Response(status=503)
+        finally:
+            metrics.observe("cluster.forward", time.perf_counter() - started)
+
+    async def metrics_handler(self, request: web.Request) -> web.Response:
+        """Метрики фронта и всех воркеров"""
+        workers = []
+        for session in self.sessions:
+            try:
+                async with session.get("http://worker/metrics", timeout=5) as response:
+                    workers.append(await response.json())
+            except (ClientError, asyncio.TimeoutError):
+                workers.append(None)
+
+        return web.json_response({"cluster": metrics.snapshot(), "workers": workers})
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/webhook", self.forward_update)
+        app.router.add_get("/metrics", self.metrics_handler)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+
+def main(argv=None):
+    from config import PORT, LOG_LEVEL, LOG_FORMAT
+
+    parser = argparse.ArgumentParser(description="Insights Bot: несколько воркеров за одним webhook")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="число воркеров (по умолчанию WORKERS)")
+    parser.add_argument('--port', type=int, default=PORT, help="порт webhook (по умолчанию PORT)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+    cluster = Cluster(max(1, args.workers))
+    web.run_app(cluster.create_app(), host="0.0.0.0", port=args.port)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,15 +5,49 @@
 """
 
 import os
-from decouple import config
+from decouple import config, Csv
 
 # ==================== Telegram Bot ====================
 BOT_TOKEN = config('BOT_TOKEN')
-WEBHOOK_URL = config('WEBHOOK_URL')
+WEBHOOK_URL = config('WEBHOOK_URL', default='')
+
+# Транспорт обновлений: webhook (хостинг) или polling (локально, staging)
+BOT_MODE = config('BOT_MODE', default='webhook')
+
+# ==================== Polling ====================
+# Long-poll getUpdates: сколько секунд Telegram держит запрос и сколько обновлений отдает за раз
+POLLING_TIMEOUT = config('POLLING_TIMEOUT', default=30, cast=int)
+POLLING_LIMIT = config('POLLING_LIMIT', default=100, cast=int)
+# Типы обновлений, которые обрабатывает бот; остальные Telegram не присылает
+POLLING_ALLOWED_UPDATES = config('POLLING_ALLOWED_UPDATES', default='message,callback_query,inline_query', cast=Csv())
+# Сколько обновлений обрабатывается одновременно (обновления одного чата - строго по очереди)
+POLLING_CONCURRENCY = config('POLLING_CONCURRENCY', default=64, cast=int)
+# Сколько секунд при остановке ждать завершения начатых обработчиков
+POLLING_DRAIN_TIMEOUT = config('POLLING_DRAIN_TIMEOUT', default=25, cast=float)
+# Файл с обновлениями, обработанными до остановки, но не подтвержденными Telegram ('' - не хранить)
+POLLING_STATE_PATH = config('POLLING_STATE_PATH', default='polling_state.json')
+
+# ==================== Исходящие запросы к Telegram ====================
+# Лимиты Telegram: ~30 сообщений/с на бота, ~1/с в личный чат, 20/мин в группу (см. send_queue.py)
+SEND_GLOBAL_RATE = config('SEND_GLOBAL_RATE', default=30, cast=float)
+SEND_CHAT_RATE = config('SEND_CHAT_RATE', default=1, cast=float)
+SEND_CHAT_BURST = config('SEND_CHAT_BURST', default=3, cast=int)
+SEND_GROUP_RATE = config('SEND_GROUP_RATE', default=20 / 60, cast=float)
+# Сколько раз повторять запрос после 429 (retry_after)
+SEND_MAX_RETRIES = config('SEND_MAX_RETRIES', default=3, cast=int)
+
+# ==================== Storage ====================
+# supabase - Supabase (по умолчанию), sqlite - локальный файл SQLITE_PATH
+STORAGE_BACKEND = config('STORAGE_BACKEND', default='supabase')
+SQLITE_PATH = config('SQLITE_PATH', default='insights.db')
 
 # ==================== Supabase ====================
-SUPABASE_URL = config('SUPABASE_URL')
-SUPABASE_KEY = config('SUPABASE_KEY')
+SUPABASE_URL = config('SUPABASE_URL', default='')
+SUPABASE_KEY = config('SUPABASE_KEY', default='')
+
+# Прямое подключение для миграций (python migrate.py up):
+# postgresql://... (Supabase → Settings → Database) или sqlite:///insights.db
+DATABASE_URL = config('DATABASE_URL', default='')
 
 # ==================== Server ====================
 PORT = int(config('PORT', default=8000))
@@ -21,14 +55,15 @@ DEBUG = config('DEBUG', default=False, cast=bool)
 
 # ==================== Bot Settings ====================
 MACRO_REGIONS = [
-    "МСК",      # Москва
-    "ЦФО",      # Центральный федеральный округ
-    "СЗФО",     # Северо-западный федеральный округ
-    "УФО",      # Уральский федеральный округ
-    "ЮФО",      # Южный федеральный округ
-    "ПФО",      # Приволжский федеральный округ
-    "СДФО",     # Сибирский федеральный округ
-    "СНГ"       # Страны СНГ
+    "МСК",          # Москва
+    "ЦФО",          # Центральный федеральный округ
+    "СЗФО",         # Северо-западный федеральный округ
+    "УФО",          # Уральский федеральный округ
+    "ЮФО",          # Южный федеральный округ
+    "ПФО",          # Приволжский федеральный округ
+    "СДФО",         # Сибирский федеральный округ
+    "СНГ",          # Страны СНГ
+    "РФ-целиком"    # Вся Россия
 ]
 
 INDUSTRIES = [
@@ -37,7 +72,8 @@ INDUSTRIES = [
     "Торговля",
     "Банки",
     "Нефть и газ",
-    "Энергетика"
+    "Энергетика",
+    "Другое"
 ]
 
 # ==================== Database ====================
@@ -47,9 +83,29 @@ DB_TABLE_NAME = "insights"
 MAX_THEME_LENGTH = 255
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
 
+# Результаты поиска: инсайтов на странице списка и шаг кнопок быстрого перехода
+SEARCH_PAGE_SIZE = config('SEARCH_PAGE_SIZE', default=10, cast=int)
+SEARCH_JUMP = 10
+
+# Подготовленные заранее экраны соседних инсайтов (см. render_cache.py)
+RENDER_CACHE_SESSIONS = config('RENDER_CACHE_SESSIONS', default=1000, cast=int)
+RENDER_CACHE_SECONDS = config('RENDER_CACHE_SECONDS', default=120, cast=float)
+
+# Окно склейки нажатий "⬅️ Пред." / "Сл. ➡️" (секунды, см. debounce.py)
+NAV_DEBOUNCE_SECONDS = config('NAV_DEBOUNCE_SECONDS', default=0.3, cast=float)
+
 # Timeout для кэша (в минутах)
 CACHE_TIMEOUT_MINUTES = 5
 
+# ==================== Локальная копия вложений ====================
+# Фоновое скачивание вложений в MIRROR_DIR (см. mirror.py); файлы больше MAX_FILE_SIZE не копируются
+MIRROR_ENABLED = config('MIRROR_ENABLED', default=False, cast=bool)
+MIRROR_DIR = config('MIRROR_DIR', default='mirror')
+# Предельный объем копий; при превышении удаляются давно не использованные
+MIRROR_MAX_BYTES = config('MIRROR_MAX_BYTES', default=2 * 1024 ** 3, cast=int)
+# Пауза между проходами по вложениям без копии (секунды)
+MIRROR_INTERVAL = config('MIRROR_INTERVAL', default=600, cast=float)
+
 # ==================== Logging ====================
 LOG_LEVEL = config('LOG_LEVEL', default='INFO')
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -57,6 +113,39 @@ LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 # ==================== Export ====================
 EXPORT_TEMP_DIR = '/tmp'
 EXPORT_BATCH_SIZE = 1000  # Размер батча для экспорта больших данных
+# Сколько вложений скачивать одновременно при экспорте в ZIP
+EXPORT_DOWNLOAD_CONCURRENCY = config('EXPORT_DOWNLOAD_CONCURRENCY', default=4, cast=int)
+# Готовые выгрузки (см. export_cache.py): каталог и сколько часов хранить неиспользуемые
+EXPORT_CACHE_DIR = config('EXPORT_CACHE_DIR', default='export_cache')
+EXPORT_CACHE_MAX_AGE_HOURS = config('EXPORT_CACHE_MAX_AGE_HOURS', default=48, cast=float)
+
+# ==================== Расписание ====================
+# Фоновые задачи по расписанию (см. scheduler.py); время - локальное время сервера, ЧЧ:ММ
+SCHEDULER_ENABLED = config('SCHEDULER_ENABLED', default=True, cast=bool)
+# Заранее подготовленные выгрузки: полная и по каждой паре регион/отрасль
+EXPORT_PREPARE_AT = config('EXPORT_PREPARE_AT', default='04:00')
+EXPORT_PREPARE_FORMATS = config('EXPORT_PREPARE_FORMATS', default='xlsx', cast=Csv())
+# Еженедельный дайджест подписчикам /digest (0 - понедельник)
+DIGEST_ENABLED = config('DIGEST_ENABLED', default=False, cast=bool)
+DIGEST_WEEKDAY = config('DIGEST_WEEKDAY', default=0, cast=int)
+DIGEST_AT = config('DIGEST_AT', default='08:00')
+
+# ==================== Повторы ====================
+# Проверка новых инсайтов на повторы в том же регионе и отрасли (см. dedup.py)
+DUPLICATE_CHECK_ENABLED = config('DUPLICATE_CHECK_ENABLED', default=True, cast=bool)
+# Сходство текстов (0..1), с которого инсайт считается повтором
+DUPLICATE_THRESHOLD = config('DUPLICATE_THRESHOLD', default=0.8, cast=float)
+# Пауза между проходами по записям без хеша текста (секунды)
+DEDUP_INDEX_INTERVAL = config('DEDUP_INDEX_INTERVAL', default=600, cast=float)
+
+# ==================== Журнал изменений ====================
+# Чтение журнала insight_changes (см. changes.py): пауза между запросами, секунды (0 - не читать)
+CHANGES_POLL_SECONDS = config('CHANGES_POLL_SECONDS', default=5, cast=float)
+# Сколько хранить количества и статистику в памяти, пока журнал читается (минуты);
+# без журнала - CACHE_TIMEOUT_MINUTES
+CHANGES_CACHE_MINUTES = config('CHANGES_CACHE_MINUTES', default=60, cast=float)
+# Сколько дней хранить события журнала (удаляются в EXPORT_PREPARE_AT)
+CHANGES_RETENTION_DAYS = config('CHANGES_RETENTION_DAYS', default=7, cast=int)
 
 # ==================== Rate Limiting ====================
 RATE_LIMIT_REQUESTS = 10  # Количество запросов
@@ -1,67 +1,251 @@
 import os
+import json
+import time
+import asyncio
 import logging
-from supabase import create_client, Client
+import threading
 from decouple import config
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from migrate import migrate_url
+from archive import read_archived_insights
+from storage import create_repository, matches_filters, EXPORT_BATCH_SIZE
+from config import CACHE_TIMEOUT_MINUTES, DUPLICATE_CHECK_ENABLED, DUPLICATE_THRESHOLD, DEDUP_INDEX_INTERVAL
+from dedup import DuplicateInsight
+import dedup
+import metrics
 
 logger = logging.getLogger(__name__)
 
-# Инициализация Supabase
-SUPABASE_URL = config('SUPABASE_URL')
-SUPABASE_KEY = config('SUPABASE_KEY')
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Интервал прогревочного запроса при простое (секунды, 0 - отключить)
+DB_WARMUP_INTERVAL = config('DB_WARMUP_INTERVAL', default=60, cast=float)
+
+# Сколько кандидатов в почти-повторы проверять по тексту
+DUPLICATE_CANDIDATES = 20
+# Поля, от которых зависят хеш текста и корзины повторов
+TEXT_FIELDS = {'theme', 'description', 'macro_region', 'industry'}
+
+# Хранилище (STORAGE_BACKEND: supabase | sqlite, см. storage.py) создается при первом обращении,
+# чтобы импорт модуля не открывал соединений и не тянул клиент Supabase
+_repository = None
+_repository_lock = threading.Lock()
+
+def get_repository():
+    """Хранилище инсайтов (создается при первом вызове)"""
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                _repository = create_repository()
+    return _repository
+
+class CountCache:
+    """
+    Количества по фильтрам (поиск, клавиатуры регионов и отраслей, меню экспорта)
+
+    Хранятся ttl секунд. Изменение записи сбрасывает только те количества,
+    под фильтры которых она попадает (invalidate).
+    """
+
+    def __init__(self, ttl: float = CACHE_TIMEOUT_MINUTES * 60):
+        self.ttl = ttl
+        self._entries = {}  # ключ -> (фильтры, значение, time.monotonic() загрузки)
+
+    @staticmethod
+    def key(kind: str, filters: dict = None) -> str:
+        conditions = {field: value for field, value in (filters or {}).items() if value is not None}
+        return json.dumps([kind, conditions], ensure_ascii=False, sort_keys=True, default=str)
+
+    async def get(self, kind: str, filters: dict, load):
+        key = self.key(kind, filters)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[2] <= self.ttl:
+            metrics.increment("count_cache.hits")
+            return entry[1]
+
+        metrics.increment("count_cache.misses")
+        value = await load()
+        self._entries[key] = (dict(filters or {}), value, time.monotonic())
+        return value
+
+    def invalidate(self, insights: list = None) -> int:
+        """Сброс количеств, затронутых записями (None - всех)"""
+        if insights is None:
+            removed = len(self._entries)
+            self._entries.clear()
+            return removed
+
+        stale = [key for key, (filters, _, _) in self._entries.items()
+                 if any(matches_filters(filters, insight) for insight in insights)]
+        for key in stale:
+            del self._entries[key]
+        return len(stale)
+
+
+count_cache = CountCache()
+
+async def warm_up_database():
+    """Создание хранилища заранее, в фоне после запуска, а не на первом запросе"""
+    try:
+        await asyncio.to_thread(get_repository)
+    except Exception as e:
+        logger.error(f"Storage warm-up error: {e}")
+
+async def keep_connections_warm(interval: float = DB_WARMUP_INTERVAL):
+    """
+    Периодический запрос к хранилищу после простоя
+
+    Держит keep-alive соединения пула открытыми, чтобы первый запрос после
+    тишины не платил за новое TCP/TLS-соединение. Запускается в фоне при старте.
+    """
+    if interval <= 0:
+        return
+
+    while True:
+        repository = get_repository()
+        idle = repository.idle_seconds
+        if idle < interval:
+            await asyncio.sleep(interval - idle)
+            continue
+
+        try:
+            with metrics.timed("db.warmup_ping"):
+                await repository.ping()
+        except Exception as e:
+            logger.warning(f"Storage warm-up ping failed: {e}")
+        # Пауза и после успешного запроса: ping может не обновлять idle_seconds
+        await asyncio.sleep(interval)
 
 async def init_database():
-    """Инициализация таблицы в БД (выполнить один раз)"""
-    try:
-        # Таблица уже должна быть создана в Supabase через UI
-        # Но вот SQL для создания на случай:
-        sql = """
-        CREATE TABLE IF NOT EXISTS insights (
-            id SERIAL PRIMARY KEY,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            theme VARCHAR(255) NOT NULL,
-            description TEXT NOT NULL,
-            macro_region VARCHAR(50) NOT NULL,
-            industry VARCHAR(100) NOT NULL,
-            file_id VARCHAR(255),
-            filename VARCHAR(255),
-            user_id BIGINT NOT NULL
-        );
-        
-        CREATE INDEX IF NOT EXISTS idx_macro_region ON insights(macro_region);
-        CREATE INDEX IF NOT EXISTS idx_industry ON insights(industry);
-        CREATE INDEX IF NOT EXISTS idx_user_id ON insights(user_id);
-        """
-        logger.info("Database schema is ready")
+    """
+    Применение миграций схемы (migrations/, см. migrate.py)
+
+    Выполняется, только если задан DATABASE_URL - прямое подключение к Postgres/SQLite.
+    Без него схемой управляют вручную: python migrate.py up
+    """
+    database_url = config('DATABASE_URL', default='')
+    if not database_url:
+        logger.info("DATABASE_URL is not set, skipping migrations")
+        return
+
+    try:
+        applied = await asyncio.to_thread(migrate_url, database_url)
+        logger.info(f"Database schema is ready ({len(applied)} new migration(s))")
     except Exception as e:
         logger.error(f"Database init error: {e}")
 
-async def save_insight_to_db(data: dict, user_id: int):
-    """Сохранение инсайта в базу данных"""
-    try:
-        response = supabase.table("insights").insert({
-            "theme": data.get("theme"),
-            "description": data.get("description"),
-            "macro_region": data.get("macro_region"),
-            "industry": data.get("industry"),
-            "file_id": data.get("file_id"),
-            "filename": data.get("filename"),
-            "user_id": user_id
-        }).execute()
-        
+async def ensure_insight_partitions(months_ahead: int = 2) -> int:
+    """Создание помесячных секций insights на текущий и следующие месяцы"""
+    try:
+        created = await get_repository().ensure_partitions(months_ahead)
+        if created:
+            logger.info(f"Created {created} insights partition(s)")
+        return created
+    except Exception as e:
+        logger.error(f"Error ensuring insights partitions: {e}")
+        return 0
+
+async def save_insight_to_db(data: dict, user_id: int, allow_duplicates: bool = False):
+    """
+    Сохранение инсайта в базу данных
+
+    Если в том же регионе и отрасли уже есть такой же или очень похожий
+    инсайт (см. dedup.py), запись не сохраняется и выбрасывается
+    DuplicateInsight со списком похожих; сохранить все равно -
+    allow_duplicates=True.
+    """
+    try:
+        fingerprint = await asyncio.to_thread(dedup.fingerprint, data)
+        if DUPLICATE_CHECK_ENABLED and not allow_duplicates:
+            matches = await find_duplicates(data, fingerprint)
+            if matches:
+                logger.info(f"Insight {data.get('theme')} by user {user_id} looks like {len(matches)} existing one(s)")
+                raise DuplicateInsight(matches)
+
+        # Хеш текста пишется вместе с записью, отдельно - только корзины LSH
+        saved = await get_repository().save({**data, 'content_hash': fingerprint.content_hash}, user_id)
+        for insight in saved:
+            await index_insight(insight, fingerprint)
+
         logger.info(f"Insight saved: {data.get('theme')} by user {user_id}")
-        return response.data
+        return saved
+    except DuplicateInsight:
+        raise
     except Exception as e:
         logger.error(f"Error saving insight: {e}")
         raise
 
+async def find_duplicates(data: dict, fingerprint=None, limit: int = 3) -> list:
+    """
+    Похожие инсайты того же региона и отрасли: [(инсайт, сходство)], самые похожие сначала
+
+    Точный повтор ищется по content_hash, почти-повторы - среди записей с
+    общими корзинами LSH (не больше DUPLICATE_CANDIDATES), сходство
+    проверяется по шинглам. Ошибка поиска не мешает сохранению.
+    """
+    try:
+        fingerprint = fingerprint or await asyncio.to_thread(dedup.fingerprint, data)
+        repository = get_repository()
+        scope = {"macro_region": data["macro_region"], "industry": data["industry"]}
+
+        exact = await repository.filtered_page({**scope, "content_hash": fingerprint.content_hash}, limit=limit)
+        matches = {insight['id']: (insight, 1.0) for insight in exact}
+
+        if len(matches) < limit:
+            candidates = await repository.minhash_candidates(
+                data["macro_region"], data["industry"], fingerprint.buckets, DUPLICATE_CANDIDATES
+            )
+            candidates = [insight_id for insight_id in candidates if insight_id not in matches]
+            for insight in await asyncio.gather(*(repository.get_by_id(insight_id) for insight_id in candidates)):
+                if insight is None:
+                    continue  # удалена или в архиве
+                score = dedup.similarity(fingerprint.shingles, dedup.shingles(dedup.insight_text(insight)))
+                if score >= DUPLICATE_THRESHOLD:
+                    matches[insight['id']] = (insight, score)
+
+        metrics.increment("dedup.checks")
+        if matches:
+            metrics.increment("dedup.flagged")
+        return sorted(matches.values(), key=lambda match: match[1], reverse=True)[:limit]
+    except Exception as e:
+        logger.error(f"Error looking for duplicate insights: {e}")
+        return []
+
+async def index_insight(insight: dict, fingerprint=None) -> bool:
+    """Хеш текста (если в записи его еще нет) и корзины LSH записи (новой, старой или измененной)"""
+    try:
+        fingerprint = fingerprint or await asyncio.to_thread(dedup.fingerprint, insight)
+        repository = get_repository()
+        if insight.get('content_hash') != fingerprint.content_hash:
+            await repository.update(insight['id'], {'content_hash': fingerprint.content_hash})
+        await repository.save_minhash(insight, fingerprint.buckets)
+        return True
+    except Exception as e:
+        logger.error(f"Error indexing insight {insight.get('id')} for duplicates: {e}")
+        return False
+
+async def index_insights(interval: float = DEDUP_INDEX_INTERVAL):
+    """Фоновый расчет хешей текста для записей без них (старые, измененные в обход бота)"""
+    while True:
+        indexed = 0
+        while True:
+            batch = await get_insights_page({"unindexed": True}, EXPORT_BATCH_SIZE)
+            if not batch:
+                break
+            done = [await index_insight(insight) for insight in batch]
+            indexed += sum(done)
+            if not all(done):
+                break
+
+        if indexed:
+            logger.info(f"Indexed {indexed} insight(s) for duplicate search")
+        await asyncio.sleep(interval)
+
 # Функция 1: считает записи по одному полю
 async def get_count_by_field(field: str, value: str) -> int:
     """Получить количество инсайтов по одному полю"""
     try:
-        response = supabase.table('insights').select('id', count='exact').eq(field, value).execute()
-        return len(response.data) if response.data else 0
+        return await get_repository().count({field: value})
     except Exception as e:
         logger.error(f"Error counting by field: {e}")
         return 0
@@ -71,24 +255,54 @@ async def get_count_by_field(field: str, value: str) -> int:
 async def get_count_by_two_fields(field1: str, value1: str, field2: str, value2: str) -> int:
     """Получить количество инсайтов по двум полям"""
     try:
-        response = supabase.table('insights').select('id', count='exact').eq(field1, value1).eq(field2, value2).execute()
-        return len(response.data) if response.data else 0
+        return await get_repository().count({field1: value1, field2: value2})
     except Exception as e:
         logger.error(f"Error counting by two fields: {e}")
         return 0
 
 
+# Функция 3: считает записи по всем значениям поля одним запросом
+async def get_counts_by_field(field: str, filters: dict = None) -> dict:
+    """Получить количество инсайтов по каждому значению поля: {значение: количество}"""
+    try:
+        return await count_cache.get(f"facets:{field}", filters,
+                                     lambda: get_repository().facet_counts(field, filters))
+    except Exception as e:
+        logger.error(f"Error counting by field values: {e}")
+        return {}
+
+
+async def get_all_insights(date_from=None, date_to=None, include_archive: bool = True, filters: dict = None):
+    """
+    Получение всех записей для экспорта
+
+    Args:
+        date_from: начало периода по created_at включительно
+        date_to: конец периода по created_at не включительно
+        include_archive: добавить записи из Parquet-архива (см. archive.py)
+        filters: macro_region, industry, user_id - как в поиске
 
-async def get_all_insights():
-    """Получение всех записей для экспорта"""
+    Ограничения передаются в запрос, поэтому читаются только подходящие
+    записи, а Postgres по датам открывает только секции нужного периода.
+    """
     try:
-        response = supabase.table("insights")\
-            .select("*")\
-            .order("created_at", desc=True)\
-            .execute()
-        
-        logger.info(f"Retrieved {len(response.data)} insights")
-        return response.data
+        filters = {**(filters or {}), "date_from": date_from, "date_to": date_to}
+        insights = []
+        async for batch in get_repository().export_stream(filters, EXPORT_BATCH_SIZE):
+            insights.extend(batch)
+
+        if include_archive:
+            try:
+                archived = await asyncio.to_thread(read_archived_insights, date_from, date_to, filters)
+            except Exception as e:
+                logger.warning(f"Archived insights are not available: {e}")
+                archived = []
+
+            known = {insight['id'] for insight in insights}
+            insights += [row for row in archived if row['id'] not in known]
+
+        logger.info(f"Retrieved {len(insights)} insights")
+        return insights
     except Exception as e:
         logger.error(f"Error getting all insights: {e}")
         return []
@@ -96,47 +310,65 @@ async def get_all_insights():
 async def get_filtered_insights(filters: dict):
     """Получение отфильтрованных записей"""
     try:
-        query = supabase.table("insights").select("*")
-        
-        if filters.get("macro_region"):
-            query = query.eq("macro_region", filters["macro_region"])
-        
-        if filters.get("industry"):
-            query = query.eq("industry", filters["industry"])
-        
-        response = query.order("created_at", desc=True).execute()
-        
-        logger.info(f"Retrieved {len(response.data)} filtered insights")
-        return response.data
+        insights = await get_repository().filtered_page(filters)
+
+        logger.info(f"Retrieved {len(insights)} filtered insights")
+        return insights
     except Exception as e:
         logger.error(f"Error getting filtered insights: {e}")
         return []
 
+async def count_insights(filters: dict = None, cached: bool = True) -> int:
+    """Количество инсайтов по фильтрам (cached=False - мимо кэша, прямо из БД)"""
+    try:
+        if not cached:
+            return await get_repository().count(filters)
+        return await count_cache.get("count", filters, lambda: get_repository().count(filters))
+    except Exception as e:
+        logger.error(f"Error counting insights: {e}")
+        return 0
+
+async def get_insights_page(filters: dict, limit: int, offset: int = 0):
+    """
+    Страница отфильтрованных записей, новые сначала
+
+    Адресуется смещением, поэтому к любой странице (или записи) результатов
+    можно перейти одним запросом, не загружая предыдущие.
+    """
+    try:
+        return await get_repository().filtered_page(filters, limit=limit, offset=offset)
+    except Exception as e:
+        logger.error(f"Error getting insights page (offset {offset}): {e}")
+        return []
+
 async def get_insight_by_id(insight_id: int):
     """Получение инсайта по ID"""
     try:
-        response = supabase.table("insights")\
-            .select("*")\
-            .eq("id", insight_id)\
-            .single()\
-            .execute()
-        
-        return response.data
+        return await get_repository().get_by_id(insight_id)
     except Exception as e:
         logger.error(f"Error getting insight {insight_id}: {e}")
         return None
 
+async def update_insight(insight_id: int, fields: dict, user_id: int = None) -> bool:
+    """Изменение полей инсайта (только владельцем, если задан user_id); при правке текста - новый хеш"""
+    try:
+        updated = await get_repository().update(insight_id, fields, user_id)
+        if updated and set(fields) & TEXT_FIELDS:
+            insight = await get_repository().get_by_id(insight_id)
+            if insight is not None:
+                await index_insight(insight)
+        return updated
+    except Exception as e:
+        logger.error(f"Error updating insight {insight_id}: {e}")
+        return False
+
 async def delete_insight(insight_id: int, user_id: int):
     """Удаление инсайта (только владельцем)"""
     try:
-        response = supabase.table("insights")\
-            .delete()\
-            .eq("id", insight_id)\
-            .eq("user_id", user_id)\
-            .execute()
-        
+        deleted = await get_repository().delete(insight_id, user_id)
+
         logger.info(f"Insight {insight_id} deleted by user {user_id}")
-        return True
+        return deleted
     except Exception as e:
         logger.error(f"Error deleting insight: {e}")
         return False
@@ -144,40 +376,89 @@ async def delete_insight(insight_id: int, user_id: int):
 async def get_user_insights(user_id: int):
     """Получение всех инсайтов пользователя"""
     try:
-        response = supabase.table("insights")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .order("created_at", desc=True)\
-            .execute()
-        
-        return response.data
+        return await get_repository().filtered_page({"user_id": user_id})
     except Exception as e:
         logger.error(f"Error getting user insights: {e}")
         return []
 
+async def get_user_insights_page(user_id: int, limit: int, before: dict = None):
+    """
+    Страница инсайтов автора, новые сначала
+
+    before - {created_at, id} последней записи предыдущей страницы. Страница
+    читается по индексу (user_id, created_at, id) с места курсора, без
+    OFFSET, поэтому одинаково быстра и на первой, и на сотой странице.
+    """
+    try:
+        return await get_repository().filtered_page({"user_id": user_id, "before": before}, limit=limit)
+    except Exception as e:
+        logger.error(f"Error getting user {user_id} insights page: {e}")
+        return []
+
+async def subscribe_digest(user_id: int, chat_id: int, macro_region: str = None) -> bool:
+    """Подписка на еженедельный дайджест (всех регионов или одного)"""
+    try:
+        await get_repository().subscribe(user_id, chat_id, macro_region)
+        logger.info(f"User {user_id} subscribed to digest ({macro_region or 'all regions'})")
+        return True
+    except Exception as e:
+        logger.error(f"Error subscribing user {user_id} to digest: {e}")
+        return False
+
+async def unsubscribe_digest(user_id: int) -> bool:
+    """Отписка от дайджеста"""
+    try:
+        return await get_repository().unsubscribe(user_id)
+    except Exception as e:
+        logger.error(f"Error unsubscribing user {user_id} from digest: {e}")
+        return False
+
+async def get_digest_subscriptions() -> list:
+    """Подписчики дайджеста"""
+    try:
+        return await get_repository().subscriptions()
+    except Exception as e:
+        logger.error(f"Error getting digest subscriptions: {e}")
+        return []
+
 async def get_stats():
-    """Получение статистики по БД"""
-    try:
-        # Общее количество
-        total = supabase.table("insights")\
-            .select("id", count="exact")\
-            .execute()
-        
-        # По регионам
-        regions_response = supabase.rpc('get_region_stats').execute()
-        
-        # По отраслям
-        industries_response = supabase.rpc('get_industry_stats').execute()
-        
-        return {
-            "total": total.count,
-            "by_regions": regions_response.data if hasattr(regions_response, 'data') else [],
-            "by_industries": industries_response.data if hasattr(industries_response, 'data') else []
-        }
+    """
+    Статистика из готовых счетчиков (миграция 0007), без чтения таблицы insights
+
+    Returns:
+        {"daily": [{day, macro_region, industry, total}], "users": [{user_id, total, last_at}]};
+        None - счетчики не прочитались
+    """
+    try:
+        repository = get_repository()
+        daily, users = await asyncio.gather(repository.daily_stats(), repository.user_stats())
+        return {"daily": daily, "users": users}
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
-        return {
-            "total": 0,
-            "by_regions": [],
-            "by_industries": []
-        }
+        return None
+
+async def get_changes(after: int, limit: int):
+    """События журнала изменений после номера after; None - журнал недоступен"""
+    try:
+        return await get_repository().changes(after, limit)
+    except Exception as e:
+        logger.error(f"Error reading insight changes after {after}: {e}")
+        return None
+
+async def get_last_change_version():
+    """Номер последнего события журнала изменений; None - журнал недоступен"""
+    try:
+        return await get_repository().last_change_version()
+    except Exception as e:
+        logger.error(f"Error reading last insight change version: {e}")
+        return None
+
+async def prune_changes(keep_days: int) -> int:
+    """Удаление событий журнала изменений старше keep_days дней"""
+    try:
+        removed = await get_repository().prune_changes(datetime.utcnow() - timedelta(days=keep_days))
+        logger.info(f"Pruned {removed} insight change(s) older than {keep_days} day(s)")
+        return removed
+    except Exception as e:
+        logger.error(f"Error pruning insight changes: {e}")
+        return 0
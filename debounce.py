@@ -0,0 +1,54 @@
+"""
+Склейка частых нажатий навигации
+
+Нажатия "⬅️ Пред." / "Сл. ➡️" на одном сообщении в пределах NAV_DEBOUNCE_SECONDS
+складываются в одно смещение, и обработчик применяет его один раз: одно
+чтение/запись FSM и одна правка сообщения вместо десятка.
+
+    navigation.push((chat_id, message_id), +1, apply)   # apply(delta) - корутина
+"""
+
+import asyncio
+import logging
+
+from config import NAV_DEBOUNCE_SECONDS
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Debouncer:
+    """Накопление смещений по ключу и отложенный вызов apply(суммарное смещение)"""
+
+    def __init__(self, window: float = NAV_DEBOUNCE_SECONDS):
+        self.window = window
+        self._pending = {}
+        self._tasks = set()
+
+    def push(self, key, delta: int, apply):
+        """Добавить смещение; apply первого нажатия вызовется после паузы"""
+        if key in self._pending:
+            self._pending[key] += delta
+            metrics.increment("nav.coalesced")
+            return
+
+        self._pending[key] = delta
+        # Обработчик не ждет окно: иначе следующие нажатия этого чата
+        # встали бы за ним в очередь (polling.py) и не склеились
+        task = asyncio.create_task(self._flush(key, apply))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, key, apply):
+        await asyncio.sleep(self.window)
+        delta = self._pending.pop(key)
+        if not delta:
+            return
+
+        try:
+            await apply(delta)
+        except Exception as e:
+            logger.error(f"Navigation error for {key}: {e}", exc_info=True)
+
+
+navigation = Debouncer()
@@ -0,0 +1,104 @@
+"""
+Поиск повторов инсайтов
+
+Текст инсайта (тема и описание) нормализуется: нижний регистр, ё -> е, без
+знаков препинания и лишних пробелов.
+
+    content_hash - SHA-1 нормализованного текста: точный повтор находится
+                   по индексу (macro_region, industry, content_hash)
+    MinHash      - подпись из MINHASH_BANDS * MINHASH_ROWS минимумов хешей
+                   шинглов (подстрок по SHINGLE_SIZE символов). Подпись
+                   режется на полосы, хеш каждой полосы - корзина в таблице
+                   insight_minhash (миграция 0010). Кандидаты в почти-повторы -
+                   записи того же региона и отрасли, совпавшие с новой хотя бы
+                   в одной корзине (LSH): проверяются только они, а не вся таблица.
+
+Кандидаты проверяются точной мерой Жаккара по шинглам; повтором считается
+сходство от DUPLICATE_THRESHOLD. Вычисления здесь без обращения к БД,
+поиск - database.find_duplicates.
+"""
+
+import re
+import random
+import struct
+import hashlib
+from dataclasses import dataclass
+
+SHINGLE_SIZE = 5
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 61) - 1
+_random = random.Random(20240611)
+# Перестановки (a*x + b) mod p - постоянные, иначе корзины старых записей не совпадут с новыми
+_PERMUTATIONS = [(_random.randrange(1, _PRIME), _random.randrange(0, _PRIME))
+                 for _ in range(MINHASH_BANDS * MINHASH_ROWS)]
+
+_NOT_WORD = re.compile(r'[\W_]+')
+
+
+class DuplicateInsight(Exception):
+    """Похожие инсайты уже есть: matches - [(инсайт, сходство 0..1)], самые похожие сначала"""
+
+    def __init__(self, matches: list):
+        super().__init__(f"{len(matches)} similar insight(s) found")
+        self.matches = matches
+
+
+@dataclass
+class Fingerprint:
+    content_hash: str
+    shingles: frozenset
+    buckets: list
+
+
+def normalize(text: str) -> str:
+    text = (text or '').lower().replace('ё', 'е')
+    return ' '.join(_NOT_WORD.sub(' ', text).split())
+
+
+def insight_text(insight: dict) -> str:
+    return normalize(f"{insight.get('theme') or ''} {insight.get('description') or ''}")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> frozenset:
+    if len(text) <= size:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + size] for i in range(len(text) - size + 1))
+
+
+def minhash(items: frozenset) -> list:
+    hashes = [struct.unpack('<Q', hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest())[0] & _MASK
+              for item in items]
+    if not hashes:
+        return [0] * len(_PERMUTATIONS)
+    return [min((a * value + b) % _PRIME for value in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_buckets(signature: list) -> list:
+    """Корзины LSH: '<номер полосы>:<хеш полосы>'"""
+    buckets = []
+    for band in range(MINHASH_BANDS):
+        values = signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]
+        digest = hashlib.blake2b(struct.pack(f'<{MINHASH_ROWS}Q', *values), digest_size=8).hexdigest()
+        buckets.append(f"{band}:{digest}")
+    return buckets
+
+
+def fingerprint(insight: dict) -> Fingerprint:
+    """Хеш текста, шинглы и корзины LSH инсайта"""
+    text = insight_text(insight)
+    items = shingles(text)
+    return Fingerprint(
+        content_hash=hashlib.sha1(text.encode('utf-8')).hexdigest(),
+        shingles=items,
+        buckets=band_buckets(minhash(items)),
+    )
+
+
+def similarity(first: frozenset, second: frozenset) -> float:
+    """Мера Жаккара двух наборов шинглов"""
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
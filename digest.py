@@ -0,0 +1,79 @@
+"""
+Еженедельный дайджест
+
+Подписчики (/digest, таблица digest_subscriptions, миграция 0006) раз в
+неделю получают сводку: сколько инсайтов добавлено за 7 дней по регионам и
+отраслям и темы последних из них. Записи за неделю читаются одним запросом
+на всех подписчиков; сообщения уходят с фоновым приоритетом очереди
+отправки, чтобы не задерживать ответы на нажатия.
+"""
+
+import logging
+from datetime import date, timedelta
+from collections import Counter
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from database import get_all_insights, get_digest_subscriptions, unsubscribe_digest
+from send_queue import bulk_priority
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DIGEST_DAYS = 7
+DIGEST_LATEST = 5
+
+
+def build_digest(insights: list, macro_region: str = None):
+    """Текст дайджеста по записям за неделю или None, если новых записей нет"""
+    if macro_region:
+        insights = [insight for insight in insights if insight['macro_region'] == macro_region]
+    if not insights:
+        return None
+
+    lines = [f"📬 Дайджест за неделю: {len(insights)} новых инсайтов", ""]
+    if macro_region:
+        lines.append(f"🗺️ {macro_region}")
+    else:
+        regions = Counter(insight['macro_region'] for insight in insights)
+        lines += [f"🗺️ {region}: {total}" for region, total in regions.most_common()]
+    lines.append("")
+
+    industries = Counter(insight['industry'] for insight in insights)
+    lines += [f"🏭 {industry}: {total}" for industry, total in industries.most_common()]
+
+    lines += ["", "🆕 Последние:"]
+    for insight in insights[:DIGEST_LATEST]:
+        lines.append(f"• {insight['theme']} ({insight['macro_region']} · {insight['industry']})")
+
+    lines += ["", "Выгрузка — 📊 Экспорт в главном меню (/start), отписаться — /digest off"]
+    return "\n".join(lines)
+
+
+async def send_digests(bot) -> int:
+    """Рассылка дайджеста всем подписчикам, возвращает число отправленных"""
+    subscriptions = await get_digest_subscriptions()
+    if not subscriptions:
+        return 0
+
+    insights = await get_all_insights(date_from=date.today() - timedelta(days=DIGEST_DAYS), include_archive=False)
+
+    sent = 0
+    with bulk_priority():
+        for subscription in subscriptions:
+            text = build_digest(insights, subscription.get('macro_region'))
+            if text is None:
+                continue
+            try:
+                await bot.send_message(subscription['chat_id'], text)
+                sent += 1
+            except TelegramForbiddenError:
+                # Пользователь заблокировал бота - подписка больше не нужна
+                logger.info(f"User {subscription['user_id']} blocked the bot, removing digest subscription")
+                await unsubscribe_digest(subscription['user_id'])
+            except TelegramBadRequest as e:
+                logger.warning(f"Digest for user {subscription['user_id']} was not sent: {e}")
+
+    metrics.increment("digest.sent", sent)
+    logger.info(f"Digest sent to {sent} of {len(subscriptions)} subscriber(s)")
+    return sent
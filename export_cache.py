@@ -0,0 +1,266 @@
+"""
+Кэш готовых выгрузок
+
+Выгрузка с одними и теми же условиями (формат, фильтры, период) строится
+один раз и хранится в EXPORT_CACHE_DIR, пока данные не изменились. Рядом с
+файлом в <ключ>.json записывается подпись данных - количество подходящих
+записей и ID самой новой; если при запросе подпись другая, выгрузка
+строится заново. Проверка подписи - два коротких запроса вместо чтения
+всей таблицы.
+
+Выгрузка запоминает свои условия, и изменение или удаление записи бота
+(invalidate) сразу убирает выгрузки, в которые запись могла попасть: правка
+текста подпись данных не меняет.
+
+Одновременные запросы одной выгрузки собираются один раз (singleflight.py).
+После первой отправки в Telegram сохраняется file_id документа, и дальше
+файл уходит без повторной загрузки; пока первая загрузка идет, остальные
+отправки ждут ее file_id. Каталог общий для всех процессов
+(воркеры cluster.py видят выгрузки друг друга).
+
+prepare_exports() заранее, вне часов пик, строит полную выгрузку и выгрузки
+по каждой паре регион/отрасль (см. scheduler.py).
+"""
+
+import os
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass, asdict
+from datetime import date, datetime
+from typing import Optional
+
+from config import (
+    MACRO_REGIONS,
+    EXPORT_CACHE_DIR,
+    EXPORT_CACHE_MAX_AGE_HOURS,
+    EXPORT_PREPARE_FORMATS,
+)
+from database import count_insights, get_insights_page, get_all_insights, get_counts_by_field
+from storage import matches_filters
+from exporters import EXPORTERS, export_insights
+from singleflight import SingleFlight
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# user_id в имени временного файла выгрузки, построенной не по запросу пользователя
+SYSTEM_USER_ID = 0
+
+# Одновременные запросы одной выгрузки строят ее один раз, одновременные
+# отправки одного файла загружают его в Telegram один раз
+_builds = SingleFlight("export_builds")
+uploads = SingleFlight("export_uploads")
+
+
+def export_conditions(filters: dict = None, date_from=None) -> dict:
+    """Условия выгрузки без пустых значений, date_from - ISO-строкой"""
+    conditions = {field: value for field, value in (filters or {}).items() if value is not None}
+    if date_from is not None:
+        conditions['date_from'] = date_from.isoformat() if isinstance(date_from, (date, datetime)) else date_from
+    return conditions
+
+
+def export_key(format_name: str, filters: dict = None, date_from=None) -> str:
+    """Ключ выгрузки: формат и условия (пустые условия не учитываются)"""
+    conditions = export_conditions(filters, date_from)
+    raw = json.dumps([format_name, conditions], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+
+async def data_signature(filters: dict = None, date_from=None) -> list:
+    """Подпись данных выгрузки: [количество записей, ID самой новой]"""
+    conditions = {**(filters or {}), 'date_from': date_from}
+    total = await count_insights(conditions, cached=False)
+    newest = await get_insights_page(conditions, 1)
+    return [total, newest[0]['id'] if newest else None]
+
+
+@dataclass
+class CachedExport:
+    key: str
+    format_name: str
+    signature: list
+    path: str
+    rows: int
+    created: float
+    file_id: Optional[str] = None
+    conditions: Optional[dict] = None
+
+    @property
+    def filename(self) -> str:
+        """Имя файла для пользователя"""
+        created = datetime.fromtimestamp(self.created).strftime("%Y%m%d_%H%M")
+        return f"insights_export_{created}{EXPORTERS[self.format_name].extension}"
+
+
+class ExportCache:
+    """Готовые выгрузки на диске: файл и <ключ>.json с подписью данных и file_id"""
+
+    def __init__(self, directory: str = EXPORT_CACHE_DIR, max_age: float = EXPORT_CACHE_MAX_AGE_HOURS * 3600):
+        self.directory = directory
+        self.max_age = max_age
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self, key: str) -> Optional[CachedExport]:
+        try:
+            with open(self._meta_path(key), encoding='utf-8') as file:
+                entry = CachedExport(**json.load(file))
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Broken export cache entry {key}: {e}")
+            return None
+        return entry if os.path.exists(entry.path) else None
+
+    def _save(self, entry: CachedExport):
+        tmp_path = f"{self._meta_path(entry.key)}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(asdict(entry), file, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path(entry.key))
+
+    def get(self, key: str, signature: list) -> Optional[CachedExport]:
+        """Готовая выгрузка, если данные с тех пор не менялись"""
+        entry = self._load(key)
+        if entry is None or entry.signature != signature:
+            metrics.increment("export_cache.misses")
+            return None
+
+        # Время доступа - для удаления давно не использованных выгрузок
+        os.utime(entry.path)
+        metrics.increment("export_cache.hits")
+        return entry
+
+    def put(self, key: str, format_name: str, signature: list, source_path: str, rows: int,
+            conditions: dict = None) -> CachedExport:
+        """Перенос построенного файла в кэш (заменяет прежнюю выгрузку с тем же ключом)"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{key}{EXPORTERS[format_name].extension}")
+        # EXPORT_TEMP_DIR может быть на другом диске - os.replace не подойдет
+        shutil.move(source_path, path)
+
+        entry = CachedExport(key, format_name, signature, path, rows, time.time(), conditions=conditions)
+        self._save(entry)
+        return entry
+
+    def set_file_id(self, entry: CachedExport, file_id: str):
+        """file_id загруженного в Telegram файла - следующие отправки без загрузки"""
+        current = self._load(entry.key)
+        if current is None or current.path != entry.path or current.created != entry.created:
+            return  # выгрузку уже заменили более свежей
+        current.file_id = file_id
+        self._save(current)
+        entry.file_id = file_id
+
+    def _remove(self, keep) -> int:
+        """Удаление выгрузок, для которых keep(entry) ложно (entry=None - запись повреждена)"""
+        if not os.path.isdir(self.directory):
+            return 0
+
+        removed = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            entry = self._load(name[:-len('.json')])
+            try:
+                if entry is not None and keep(entry):
+                    continue
+                if entry is not None:
+                    os.remove(entry.path)
+                os.remove(os.path.join(self.directory, name))
+                removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+    def prune(self) -> int:
+        """Удаление выгрузок, к которым не обращались дольше max_age"""
+        deadline = time.time() - self.max_age
+        return self._remove(lambda entry: os.path.getmtime(entry.path) >= deadline)
+
+    def invalidate(self, insights: list) -> int:
+        """Удаление выгрузок, в которые могли попасть записи (выгрузки без условий - всех)"""
+        def keep(entry):
+            return entry.conditions is not None and not any(
+                matches_filters(entry.conditions, insight) for insight in insights
+            )
+
+        return self._remove(keep)
+
+
+export_cache = ExportCache()
+
+
+async def cached_export(format_name: str, filters: dict = None, date_from=None,
+                        user_id: int = SYSTEM_USER_ID) -> Optional[CachedExport]:
+    """
+    Выгрузка из кэша или построенная заново (и сохраненная в кэш)
+
+    Одновременные запросы с одинаковыми условиями (десять нажатий "Экспорт"
+    в одну минуту) ждут одну общую проверку кэша и сборку.
+
+    Returns:
+        CachedExport или None, если подходящих записей нет
+    """
+    key = export_key(format_name, filters, date_from)
+    entry, shared = await _builds.do(key, lambda: _cached_export(key, format_name, filters, date_from, user_id))
+    if shared:
+        logger.info(f"Export {key} ({format_name}) shared with an in-flight request")
+    return entry
+
+
+async def _cached_export(key: str, format_name: str, filters: dict, date_from, user_id: int):
+    signature = await data_signature(filters, date_from)
+
+    entry = await asyncio.to_thread(export_cache.get, key, signature)
+    if entry is not None:
+        logger.info(f"Export {key} ({format_name}) served from cache")
+        return entry
+
+    insights = await get_all_insights(date_from=date_from, filters=filters)
+    if not insights:
+        return None
+
+    filename = await export_insights(insights, user_id, format_name)
+    try:
+        return await asyncio.to_thread(export_cache.put, key, format_name, signature, filename, len(insights),
+                                       export_conditions(filters, date_from))
+    except BaseException:
+        if os.path.exists(filename):
+            os.remove(filename)
+        raise
+
+
+async def prepare_exports(formats: list = EXPORT_PREPARE_FORMATS):
+    """
+    Заранее построить полную выгрузку и выгрузки по парам регион/отрасль
+
+    Пары - те же условия, что у экспорта из результатов поиска; пары без
+    записей пропускаются. Выгрузки, данные которых не менялись, не
+    перестраиваются.
+    """
+    scopes = [{}]
+    for region in MACRO_REGIONS:
+        counts = await get_counts_by_field("industry", {"macro_region": region})
+        scopes += [{"macro_region": region, "industry": industry} for industry, total in counts.items() if total]
+
+    prepared = 0
+    for format_name in formats:
+        exporter = EXPORTERS.get(format_name)
+        if exporter is None or not exporter.available:
+            logger.warning(f"Export format {format_name} is not available, not preparing it")
+            continue
+        for filters in scopes:
+            try:
+                if await cached_export(format_name, filters) is not None:
+                    prepared += 1
+            except Exception as e:
+                logger.error(f"Error preparing {format_name} export {filters}: {e}")
+
+    removed = await asyncio.to_thread(export_cache.prune)
+    logger.info(f"Prepared {prepared} export(s), removed {removed} stale export(s)")
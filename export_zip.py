@@ -0,0 +1,150 @@
+"""
+Экспорт в ZIP: таблица Excel и все прикрепленные файлы
+
+Файлы скачиваются параллельно (не больше EXPORT_DOWNLOAD_CONCURRENCY сразу)
+через локальную копию mirror.py и дописываются в архив по мере готовности -
+архив пишется на диск, а не собирается в памяти. Telegram принимает от бота
+файлы до MAX_FILE_SIZE, поэтому архив делится на части не больше этого размера.
+"""
+
+import os
+import asyncio
+import logging
+import zipfile
+from datetime import datetime
+
+from config import MAX_FILE_SIZE, EXPORT_TEMP_DIR, EXPORT_DOWNLOAD_CONCURRENCY
+from export_excel import export_insights_to_excel
+from mirror import ensure_local
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Запас на заголовки записи и центральный каталог ZIP (на файл)
+ZIP_ENTRY_OVERHEAD = 1024
+
+# Уже сжатые форматы кладутся без сжатия
+STORED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp4', '.mov', '.mp3', '.ogg',
+                     '.zip', '.rar', '.7z', '.gz', '.xlsx', '.docx', '.pptx'}
+
+# Расширения для вложений без имени файла
+DEFAULT_EXTENSIONS = {'photo': '.jpg', 'video': '.mp4', 'audio': '.mp3', 'voice': '.ogg', 'animation': '.mp4'}
+
+
+def attachment_name(insight: dict) -> str:
+    """Имя файла инсайта внутри архива: files/<id>_<имя>"""
+    filename = os.path.basename(insight.get('filename') or '')
+    if not filename:
+        file_type = insight.get('file_type') or 'photo'
+        filename = f"{file_type}{DEFAULT_EXTENSIONS.get(file_type, '')}"
+    return f"files/{insight['id']}_{filename}"
+
+
+class ZipParts:
+    """Запись ZIP частями не больше limit байт: part1.zip, part2.zip, ..."""
+
+    def __init__(self, base_path: str, limit: int = MAX_FILE_SIZE):
+        self.base_path = base_path
+        self.limit = limit
+        self.paths = []
+        self._zip = None
+        self._entries = 0
+
+    def _size(self) -> int:
+        return self._zip.fp.tell() + self._entries * ZIP_ENTRY_OVERHEAD
+
+    def _next_part(self):
+        if self._zip is not None:
+            self._zip.close()
+        path = f"{self.base_path}_part{len(self.paths) + 1}.zip"
+        self.paths.append(path)
+        self._zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+        self._entries = 0
+
+    def _reserve(self, size: int):
+        if self._zip is None or (self._entries and self._size() + size + ZIP_ENTRY_OVERHEAD > self.limit):
+            self._next_part()
+
+    def add(self, path: str, arcname: str):
+        size = os.path.getsize(path)
+        if size + 2 * ZIP_ENTRY_OVERHEAD > self.limit:
+            raise ValueError(f"{arcname} ({size} bytes) does not fit into one part")
+
+        self._reserve(size)
+        stored = os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS
+        self._zip.write(path, arcname, compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+        self._entries += 1
+
+    def add_text(self, arcname: str, text: str):
+        data = text.encode('utf-8')
+        self._reserve(len(data))
+        self._zip.writestr(arcname, data)
+        self._entries += 1
+
+    def close(self) -> list:
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        return self.paths
+
+    def remove(self):
+        self.close()
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+async def export_insights_to_zip(bot, insights: list, user_id: int) -> list:
+    """
+    Экспорт инсайтов в ZIP с прикрепленными файлами
+
+    Args:
+        bot: Bot для скачивания файлов
+        insights: список инсайтов из БД
+        user_id: ID пользователя (для имени файла)
+
+    Returns:
+        пути к частям архива (каждая не больше MAX_FILE_SIZE)
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(EXPORT_TEMP_DIR, exist_ok=True)
+    parts = ZipParts(os.path.join(EXPORT_TEMP_DIR, f"insights_files_{user_id}_{timestamp}"))
+
+    workbook = await export_insights_to_excel(insights, user_id)
+    try:
+        await asyncio.to_thread(parts.add, workbook, "insights.xlsx")
+
+        semaphore = asyncio.Semaphore(EXPORT_DOWNLOAD_CONCURRENCY)
+
+        async def fetch(insight):
+            async with semaphore:
+                return insight, await ensure_local(bot, insight)
+
+        # Файлы пишутся в архив в порядке готовности, пока остальные еще скачиваются
+        missing = []
+        with metrics.timed("export.zip"):
+            downloads = [fetch(insight) for insight in insights if insight.get('file_id')]
+            for download in asyncio.as_completed(downloads):
+                insight, path = await download
+                if path is None:
+                    missing.append(insight)
+                    continue
+                await asyncio.to_thread(parts.add, path, attachment_name(insight))
+
+        if missing:
+            lines = [f"{insight['id']}\t{insight.get('filename') or insight.get('file_type') or ''}" for insight in missing]
+            await asyncio.to_thread(
+                parts.add_text, "missing_files.txt",
+                "Файлы, которые не удалось скачать (ID инсайта, файл):\n" + "\n".join(lines) + "\n"
+            )
+            logger.warning(f"ZIP export for user {user_id}: {len(missing)} file(s) are not available")
+
+        paths = await asyncio.to_thread(parts.close)
+        logger.info(f"ZIP export created for user {user_id}: {len(paths)} part(s)")
+        return paths
+    except BaseException:
+        await asyncio.to_thread(parts.remove)
+        raise
+    finally:
+        if os.path.exists(workbook):
+            os.remove(workbook)
@@ -0,0 +1,208 @@
+"""
+Форматы экспорта инсайтов
+
+EXPORTERS - реестр форматов: название, расширение, функция записи и
+необязательная зависимость. Все функции записи синхронные и выполняются в
+отдельном потоке; строки пишутся по одной, без промежуточного DataFrame.
+
+    xlsx      - Excel через openpyxl, с оформлением (export_excel.py)
+    xlsx_fast - Excel через XlsxWriter в режиме constant_memory: строки сразу
+                уходят на диск, память не растет с числом записей
+    csv       - CSV (UTF-8 с BOM, открывается в Excel)
+    csv_gz    - тот же CSV, сжатый gzip
+    parquet   - Parquet через pyarrow (zstd), для аналитики
+
+Сравнение скорости и памяти: python bench_export.py --rows 100000
+"""
+
+import os
+import csv
+import gzip
+import asyncio
+import logging
+import importlib.util
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+
+from config import EXPORT_TEMP_DIR, EXPORT_BATCH_SIZE
+from export_excel import write_workbook
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Колонки выгрузки: (поле, заголовок)
+EXPORT_COLUMNS = [
+    ('id', 'ID'),
+    ('created_at', 'Дата создания'),
+    ('theme', 'Тема'),
+    ('description', 'Описание'),
+    ('macro_region', 'Макрорегион'),
+    ('industry', 'Отрасль'),
+    ('file_id', 'Файл прикреплен'),
+]
+HEADERS = [title for _, title in EXPORT_COLUMNS]
+
+# Ширины колонок Excel - как в export_excel.write_workbook
+COLUMN_WIDTHS = [8, 15, 25, 40, 15, 20, 15]
+
+
+def export_row(insight: dict) -> list:
+    """Значения строки выгрузки: дата без времени, наличие файла - Да/Нет"""
+    created_at = insight.get('created_at') or ''
+    if not isinstance(created_at, str):
+        created_at = created_at.isoformat()
+    return [
+        insight.get('id', ''),
+        created_at.split('T')[0],
+        insight.get('theme', ''),
+        insight.get('description', ''),
+        insight.get('macro_region', ''),
+        insight.get('industry', ''),
+        "Да" if insight.get('file_id') else "Нет",
+    ]
+
+
+def write_csv(insights, filename: str):
+    # utf-8-sig: Excel распознает кодировку по BOM
+    with open(filename, 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(HEADERS)
+        writer.writerows(export_row(insight) for insight in insights)
+
+
+def write_csv_gz(insights, filename: str):
+    with gzip.open(filename, 'wt', encoding='utf-8-sig', newline='', compresslevel=6) as file:
+        writer = csv.writer(file)
+        writer.writerow(HEADERS)
+        writer.writerows(export_row(insight) for insight in insights)
+
+
+def write_parquet(insights, filename: str):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('created_at', pa.string()),
+        ('theme', pa.string()),
+        ('description', pa.string()),
+        ('macro_region', pa.string()),
+        ('industry', pa.string()),
+        ('has_file', pa.bool_()),
+    ])
+
+    # Пишем группами строк, чтобы не держать всю таблицу в памяти
+    with pq.ParquetWriter(filename, schema, compression='zstd') as writer:
+        batch = []
+        for insight in insights:
+            batch.append(insight)
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                writer.write_table(_parquet_table(pa, schema, batch))
+                batch = []
+        if batch:
+            writer.write_table(_parquet_table(pa, schema, batch))
+
+
+def _parquet_table(pa, schema, insights: list):
+    created_at = [
+        value if isinstance(value, str) else value.isoformat()
+        for value in (insight.get('created_at') or '' for insight in insights)
+    ]
+    return pa.Table.from_arrays([
+        pa.array([insight.get('id') for insight in insights], pa.int64()),
+        pa.array(created_at, pa.string()),
+        pa.array([insight.get('theme') for insight in insights], pa.string()),
+        pa.array([insight.get('description') for insight in insights], pa.string()),
+        pa.array([insight.get('macro_region') for insight in insights], pa.string()),
+        pa.array([insight.get('industry') for insight in insights], pa.string()),
+        pa.array([bool(insight.get('file_id')) for insight in insights], pa.bool_()),
+    ], schema=schema)
+
+
+def write_xlsx_fast(insights, filename: str):
+    import xlsxwriter
+
+    # constant_memory: каждая строка сбрасывается на диск сразу после записи
+    workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet("Инсайды")
+
+        header_format = workbook.add_format({
+            'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#4472C4',
+            'align': 'center', 'valign': 'vcenter', 'text_wrap': True,
+        })
+        cell_format = workbook.add_format({'valign': 'top', 'text_wrap': True})
+
+        for column, width in enumerate(COLUMN_WIDTHS):
+            worksheet.set_column(column, column, width, cell_format)
+
+        worksheet.set_row(0, 25)
+        worksheet.write_row(0, 0, HEADERS, header_format)
+
+        for row, insight in enumerate(insights, 1):
+            worksheet.write_row(row, 0, export_row(insight), cell_format)
+    finally:
+        workbook.close()
+
+
+@dataclass(frozen=True)
+class Exporter:
+    name: str
+    title: str
+    extension: str
+    write: Callable
+    requires: Optional[str] = None
+
+    @property
+    def available(self) -> bool:
+        return self.requires is None or importlib.util.find_spec(self.requires) is not None
+
+
+EXPORTERS = {
+    exporter.name: exporter
+    for exporter in (
+        Exporter('xlsx', "📊 Excel", '.xlsx', write_workbook, 'openpyxl'),
+        Exporter('xlsx_fast', "⚡ Excel (быстрый)", '.xlsx', write_xlsx_fast, 'xlsxwriter'),
+        Exporter('csv', "📄 CSV", '.csv', write_csv),
+        Exporter('csv_gz', "🗜️ CSV.gz", '.csv.gz', write_csv_gz),
+        Exporter('parquet', "🧱 Parquet", '.parquet', write_parquet, 'pyarrow'),
+    )
+}
+
+
+def available_exporters() -> list:
+    """Форматы, зависимости которых установлены"""
+    return [exporter for exporter in EXPORTERS.values() if exporter.available]
+
+
+async def export_insights(insights, user_id: int, format_name: str = 'xlsx') -> str:
+    """
+    Экспорт инсайтов в выбранном формате
+
+    Args:
+        insights: инсайты (список или итератор)
+        user_id: ID пользователя (для имени файла)
+        format_name: ключ EXPORTERS
+
+    Returns:
+        путь к созданному файлу
+    """
+    exporter = EXPORTERS.get(format_name)
+    if exporter is None or not exporter.available:
+        raise ValueError(f"Export format is not available: {format_name}")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(EXPORT_TEMP_DIR, exist_ok=True)
+    filename = os.path.join(EXPORT_TEMP_DIR, f"insights_export_{user_id}_{timestamp}{exporter.extension}")
+
+    try:
+        with metrics.timed(f"export.{exporter.name}"):
+            await asyncio.to_thread(exporter.write, insights, filename)
+    except BaseException:
+        if os.path.exists(filename):
+            os.remove(filename)
+        raise
+
+    logger.info(f"{exporter.name} export created: {filename}")
+    return filename
@@ -0,0 +1,1358 @@
+"""
+Обработчики бота: FSM-формы, клавиатуры, создание, поиск и экспорт инсайтов
+
+Роутер общий для webhook (main.py) и polling (main.py --mode polling).
+"""
+
+import os
+import asyncio
+import logging
+from datetime import date, timedelta
+
+from aiogram import Router, F
+from aiogram.types import Message, CallbackQuery, FSInputFile, BufferedInputFile, InputMediaPhoto
+from aiogram.filters import Command, CommandObject
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from config import MACRO_REGIONS, INDUSTRIES, MAX_THEME_LENGTH, SEARCH_PAGE_SIZE, SEARCH_JUMP, MIRROR_ENABLED
+from database import (
+    save_insight_to_db,
+    get_counts_by_field,
+    get_all_insights,
+    count_insights,
+    get_insights_page,
+    get_insight_by_id,
+    get_user_insights_page,
+    update_insight,
+    delete_insight,
+    subscribe_digest,
+    unsubscribe_digest,
+)
+from exporters import EXPORTERS, available_exporters
+from export_cache import export_cache, cached_export, uploads
+from export_zip import export_insights_to_zip
+from send_queue import bulk_priority
+from debounce import navigation
+from render_cache import render_cache, search_signature
+from attachments import attachment_from_message, send_attachment, send_attachments
+from mirror import ensure_local
+from stats import stats, format_stats
+from charts import get_chart, heatmap_data, weekly_data
+from invalidation import insight_changed
+from dedup import DuplicateInsight
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+_background_tasks = set()
+
+def _run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+# FSM State Machine
+class InsightForm(StatesGroup):
+    macro_region = State()
+    industry = State()
+    theme = State()
+    description = State()
+    file_attachment = State()
+    duplicate = State()
+
+class SearchForm(StatesGroup):
+    macro_region = State()
+    industry = State()
+    viewing = State()
+
+class MyInsights(StatesGroup):
+    listing = State()
+    edit_theme = State()
+    edit_description = State()
+
+# ==================== Создание клавиатур ====================
+
+async def create_main_keyboard():
+    """Создание главной клавиатуры"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="➕ Создать новый инсайт", callback_data="new_insight")
+    builder.button(text="🔍 Поиск и просмотр", callback_data="search_insights")
+    builder.button(text="📂 Мои инсайты", callback_data="my_insights")
+    builder.button(text="📊 Экспорт", callback_data="export_menu")
+    builder.button(text="📈 Статистика", callback_data="stats")
+    builder.button(text="ℹ️ О боте", callback_data="about_bot")
+    builder.adjust(1)
+    return builder.as_markup()
+
+async def create_region_keyboard(for_search=False):
+    """Создание клавиатуры выбора макрорегиона"""
+    builder = InlineKeyboardBuilder()
+    counts = await get_counts_by_field("macro_region")
+    
+    for region in MACRO_REGIONS:
+        count = counts.get(region, 0)
+        prefix = "search" if for_search else "new"
+        builder.button(
+            text=f"{region} ({count})",
+            callback_data=f"{prefix}_region_{region}"
+        )
+    
+    builder.button(text="⬅️ Назад", callback_data="back_to_main")
+    builder.adjust(2)
+    return builder.as_markup()
+
+async def create_industry_keyboard(macro_region=None, for_search=False):
+    """Создание клавиатуры выбора отрасли - считает по выбранному макро"""
+    builder = InlineKeyboardBuilder()
+    
+    # Если указан макро, считаем только для этого макро
+    filters = {"macro_region": macro_region} if macro_region else None
+    counts = await get_counts_by_field("industry", filters)
+    
+    for industry in INDUSTRIES:
+        count = counts.get(industry, 0)
+        
+        prefix = "search" if for_search else "new"
+        builder.button(
+            text=f"{industry} ({count})",
+            callback_data=f"{prefix}_industry_{industry}"
+        )
+    
+    # ИСПРАВЛЕНИЕ: разные callback_data для разных режимов - возврат на макро
+    if for_search:
+        builder.button(text="⬅️ Назад", callback_data="back_to_search_macro")
+    else:
+        builder.button(text="⬅️ Назад", callback_data="back_to_new_macro")
+    
+    builder.adjust(1)
+    return builder.as_markup()
+
+# ==================== Команды ====================
+
+@router.message(Command("start"))
+async def cmd_start(message: Message):
+    """Обработка команды /start с красивым приветствием"""
+    logger.info(f"User {message.from_user.id} ({message.from_user.username}) started the bot")
+    
+    welcome_text = f"""
+🎉 Добро пожаловать в Insights Bot!
+
+👋 Привет, {message.from_user.first_name}!
+
+Это приложение предназначено для управления деловыми инсайдами по макрорегионам и отраслям экономики.
+
+📌 **Основные возможности:**
+
+✏️ **Создать инсайт** — добавить новое наблюдение, факт или аналитику
+   • Выберите макрорегион (МСК, ЦФО, СЗФО и др.)
+   • Выберите отрасль (Оборона, Промышленность, Торговля и др.)
+   • Опишите суть инсайта
+   • Прикрепите документ или фото (опционально)
+
+🔍 **Поиск и просмотр** — найти сохраненные инсайты
+   • Фильтруйте по макрорегиону и отрасли
+   • Листайте результаты
+   • Скачивайте прикрепленные файлы
+
+📂 **Мои инсайты** — ваши записи: правка и удаление
+
+📊 **Экспорт** — выгрузить все данные
+   • Excel с оформлением, быстрый Excel, CSV или Parquet
+   • ZIP вместе с прикрепленными файлами
+
+💾 **Облачное хранилище** — все данные хранятся безопасно в БД
+
+─────────────────────────────────────
+
+⬇️ Выберите действие ниже, чтобы начать:
+"""
+    
+    await message.answer(welcome_text, reply_markup=await create_main_keyboard())
+
+@router.message(Command("help"))
+async def cmd_help(message: Message):
+    """Справка по командам"""
+    help_text = """
+🤖 **Доступные команды:**
+
+/start — Главное меню и приветствие
+/help — Эта справка
+/cancel — Отмена текущей операции
+/stats — Статистика: регионы и отрасли, динамика по неделям, авторы
+/digest — Еженедельный дайджест новых инсайтов (/digest МСК — по региону, /digest off — отписаться)
+
+📌 **Основные функции:**
+
+➕ **Создать новый инсайт**
+   Пошаговое заполнение:
+   1. Выберите макрорегион
+   2. Выберите отрасль
+   3. Введите тему
+   4. Введите описание
+   5. Прикрепите файл или пропустите
+   ✅ Инсайт сохранен!
+
+🔍 **Поиск и просмотр**
+   1. Выберите макрорегион
+   2. Выберите отрасль
+   3. Просмотрите найденные инсайты
+   4. Листайте результаты, скачивайте файлы
+
+📂 **Мои инсайты**
+   Ваши инсайты списком: откройте запись, чтобы изменить тему и описание или удалить ее
+
+📊 **Экспорт**
+   Выгрузите все сохраненные инсайты в Excel, CSV, Parquet или ZIP с файлами
+
+ℹ️ **О боте**
+   Получите подробную информацию о приложении
+"""
+    await message.answer(help_text)
+
+@router.message(Command("cancel"))
+async def cmd_cancel(message: Message, state: FSMContext):
+    """Отмена текущей операции"""
+    await state.clear()
+    await message.answer("❌ Операция отменена", reply_markup=await create_main_keyboard())
+
+def stats_keyboard():
+    builder = InlineKeyboardBuilder()
+    builder.button(text="📊 Графики", callback_data="stats_charts")
+    builder.button(text="🔄 Обновить", callback_data="stats")
+    builder.button(text="🔙 Меню", callback_data="back_to_main")
+    builder.adjust(1, 2)
+    return builder.as_markup()
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    """Статистика из готовых счетчиков (stats.py)"""
+    aggregate = await stats.get()
+    await message.answer(format_stats(aggregate, message.from_user.id), parse_mode="HTML",
+                         reply_markup=stats_keyboard())
+
+@router.callback_query(F.data == "stats")
+async def show_stats(callback: CallbackQuery):
+    """Статистика из главного меню"""
+    aggregate = await stats.get()
+    try:
+        await callback.message.edit_text(format_stats(aggregate, callback.from_user.id), parse_mode="HTML",
+                                         reply_markup=stats_keyboard())
+    except TelegramBadRequest as e:
+        # "Обновить" без новых данных - сообщение не изменилось
+        logger.debug(f"Stats message was not updated: {e}")
+    await callback.answer()
+
+@router.callback_query(F.data == "stats_charts")
+async def show_stats_charts(callback: CallbackQuery):
+    """Графики статистики одним альбомом; уже отправленные - по file_id без отрисовки и загрузки"""
+    await callback.answer("⏳ Готовлю графики...")
+    aggregate = await stats.get()
+    
+    try:
+        chart_list = [
+            await get_chart("heatmap", heatmap_data(aggregate)),
+            await get_chart("weekly", weekly_data(aggregate)),
+        ]
+        media = [
+            InputMediaPhoto(media=chart.file_id or BufferedInputFile(chart.png, filename=chart.filename))
+            for chart in chart_list
+        ]
+        media[0].caption = f"📈 Статистика: {aggregate.total} инсайтов"
+        
+        with bulk_priority():
+            sent = await callback.message.answer_media_group(media)
+        for chart, message in zip(chart_list, sent):
+            chart.file_id = message.photo[-1].file_id
+    except Exception as e:
+        logger.error(f"Stats charts error for user {callback.from_user.id}: {e}", exc_info=True)
+        await callback.message.answer("❌ Не удалось построить графики")
+
+@router.message(Command("digest"))
+async def cmd_digest(message: Message, command: CommandObject):
+    """Подписка на еженедельный дайджест: /digest, /digest <регион>, /digest off"""
+    argument = (command.args or "").strip()
+    
+    if argument.lower() in ("off", "стоп", "выкл"):
+        if await unsubscribe_digest(message.from_user.id):
+            await message.answer("🔕 Вы отписались от еженедельного дайджеста")
+        else:
+            await message.answer("Вы не подписаны на дайджест")
+        return
+    
+    if argument and argument not in MACRO_REGIONS:
+        await message.answer(
+            "❌ Неизвестный регион\n\n"
+            f"Доступные: {', '.join(MACRO_REGIONS)}\n"
+            "Пример: /digest МСК"
+        )
+        return
+    
+    region = argument or None
+    if not await subscribe_digest(message.from_user.id, message.chat.id, region):
+        await message.answer("❌ Не удалось оформить подписку, попробуйте позже")
+        return
+    
+    await message.answer(
+        f"🔔 Вы подписаны на еженедельный дайджест ({region or 'все регионы'})\n\n"
+        "Отписаться — /digest off"
+    )
+
+# ==================== Информация о боте ====================
+
+@router.callback_query(F.data == "about_bot")
+async def about_bot(callback: CallbackQuery):
+    """Информация о боте"""
+    about_text = """
+ℹ️ **О Insights Bot**
+
+🎯 **Назначение:**
+Управление и анализ деловых инсайтов по макрорегионам и отраслям экономики.
+
+🔧 **Технология:**
+• Telegram Bot API (aiogram)
+• PostgreSQL база данных (Supabase)
+• Облачный хостинг (Render)
+• Python 3.11+
+
+📊 **Функциональность:**
+✅ Создание и сохранение инсайтов
+✅ Гибкая фильтрация по регионам и отраслям
+✅ Экспорт данных в Excel с форматированием
+✅ Прикрепление файлов и документов
+✅ 24/7 доступность
+
+🌍 **Поддерживаемые макрорегионы:**
+МСК, ЦФО, СЗФО, УФО, ЮФО, ПФО, СДФО, СНГ, РФ-целиком
+
+🏭 **Поддерживаемые отрасли:**
+Оборона, Промышленность, Торговля, Банки, Нефть и газ, Энергетика, Другое
+
+💾 **Безопасность:**
+Все данные хранятся в защищенной облачной БД с автоматическим резервным копированием.
+
+─────────────────────────────────────
+"""
+    
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🔙 В меню", callback_data="back_to_main")
+    builder.adjust(1)
+    
+    await callback.message.edit_text(about_text, reply_markup=builder.as_markup())
+    await callback.answer()
+
+# ==================== Главное меню ====================
+
+@router.callback_query(F.data == "back_to_main")
+async def back_to_main(callback: CallbackQuery, state: FSMContext):
+    """Возврат в главное меню"""
+    await state.clear()
+    await callback.message.edit_text(
+        "📌 Главное меню:\n\nВыберите действие:",
+        reply_markup=await create_main_keyboard()
+    )
+    await callback.answer()
+
+# ==================== СОЗДАНИЕ НОВОЙ ЗАПИСИ ====================
+
+@router.callback_query(F.data == "new_insight")
+async def new_insight_start(callback: CallbackQuery, state: FSMContext):
+    """Начало создания нового инсайта - сначала выбираем регион"""
+    logger.info(f"User {callback.from_user.id} started creating new insight")
+    keyboard = await create_region_keyboard(for_search=False)
+    await callback.message.edit_text("🗺️ Выберите макрорегион:", reply_markup=keyboard)
+    await state.set_state(InsightForm.macro_region)
+    await callback.answer()
+
+@router.callback_query(InsightForm.macro_region, F.data.startswith("new_region_"))
+async def process_region(callback: CallbackQuery, state: FSMContext):
+    """Обработка выбора макрорегиона"""
+    region = callback.data.replace("new_region_", "")
+    await state.update_data(macro_region=region)
+    
+    keyboard = await create_industry_keyboard(macro_region=region, for_search=False)
+    await callback.message.edit_text("🏭 Выберите отрасль:", reply_markup=keyboard)
+    await state.set_state(InsightForm.industry)
+    await callback.answer()
+
+@router.callback_query(InsightForm.industry, F.data.startswith("new_industry_"))
+async def process_industry(callback: CallbackQuery, state: FSMContext):
+    """Обработка выбора отрасли"""
+    industry = callback.data.replace("new_industry_", "")
+    await state.update_data(industry=industry)
+    
+    await callback.message.edit_text(f"📝 Введите тему инсайта (максимум {MAX_THEME_LENGTH} символов):")
+    await state.set_state(InsightForm.theme)
+    await callback.answer()
+
+@router.message(InsightForm.theme)
+async def process_theme(message: Message, state: FSMContext):
+    """Обработка темы инсайта"""
+    if len(message.text) > MAX_THEME_LENGTH:
+        await message.answer(f"❌ Тема слишком длинная (максимум {MAX_THEME_LENGTH} символов)")
+        return
+    
+    await state.update_data(theme=message.text)
+    await message.answer("📄 Введите подробное описание инсайта:")
+    await state.set_state(InsightForm.description)
+
+@router.message(InsightForm.description)
+async def process_description(message: Message, state: FSMContext):
+    """Обработка описания инсайта"""
+    await state.update_data(description=message.text)
+    
+    builder = InlineKeyboardBuilder()
+    builder.button(text="📎 Прикрепить файл", callback_data="attach_file")
+    builder.button(text="⏭️ Пропустить", callback_data="skip_file")
+    builder.adjust(1)
+    
+    await message.answer(
+        "📎 **Финальный шаг**\n\n"
+        "Хотите прикрепить файл к инсайту?\n"
+        "Вы можете отправить документ или фотографию.",
+        reply_markup=builder.as_markup()
+    )
+    await state.set_state(InsightForm.file_attachment)
+
+@router.callback_query(InsightForm.file_attachment, F.data == "attach_file")
+async def ready_for_file(callback: CallbackQuery):
+    """Подготовка к получению файла"""
+    await callback.message.edit_text(
+        "📤 Отправьте файл (документ или фото).\n"
+        "Используйте /cancel для отмены."
+    )
+    await callback.answer()
+
+def after_save(bot, saved: list):
+    """После сохранения: сброс кэшей (invalidation.py) и локальная копия вложения в фоне (MIRROR_ENABLED)"""
+    for insight in saved or []:
+        _run_in_background(insight_changed(new=insight))
+        if MIRROR_ENABLED:
+            _run_in_background(ensure_local(bot, insight))
+
+@router.message(InsightForm.file_attachment, F.document)
+async def process_document(message: Message, state: FSMContext):
+    """Обработка прикрепленного документа"""
+    attachment = attachment_from_message(message)
+    filename = attachment['filename']
+    
+    await state.update_data(**attachment)
+    
+    data = await state.get_data()
+    try:
+        saved = await save_insight_to_db(data, message.from_user.id)
+        logger.info(f"User {message.from_user.id} created insight with document: {data.get('theme')}")
+        after_save(message.bot, saved)
+        
+        success_text = (
+            f"✅ **Инсайт успешно создан!**\n\n"
+            f"📝 Тема: {data['theme']}\n"
+            f"🗺️ Макрорегион: {data['macro_region']}\n"
+            f"🏭 Отрасль: {data['industry']}\n"
+            f"📎 Файл: {filename}"
+        )
+        
+        await message.answer(success_text, reply_markup=await create_main_keyboard())
+    except DuplicateInsight as e:
+        await confirm_duplicate(message, state, e.matches)
+        return
+    except Exception as e:
+        logger.error(f"Error saving insight with document: {str(e)}", exc_info=True)
+        await message.answer(f"❌ Ошибка при сохранении инсайта: {str(e)}")
+    
+    await state.clear()
+
+@router.message(InsightForm.file_attachment, F.photo)
+async def process_photo(message: Message, state: FSMContext):
+    """Обработка прикрепленной фотографии"""
+    await state.update_data(**attachment_from_message(message))
+    
+    data = await state.get_data()
+    try:
+        saved = await save_insight_to_db(data, message.from_user.id)
+        logger.info(f"User {message.from_user.id} created insight with photo: {data.get('theme')}")
+        after_save(message.bot, saved)
+        
+        success_text = (
+            f"✅ **Инсайт успешно создан!**\n\n"
+            f"📝 Тема: {data['theme']}\n"
+            f"🗺️ Макрорегион: {data['macro_region']}\n"
+            f"🏭 Отрасль: {data['industry']}\n"
+            f"📸 Фото прикреплено"
+        )
+        
+        await message.answer(success_text, reply_markup=await create_main_keyboard())
+    except DuplicateInsight as e:
+        await confirm_duplicate(message, state, e.matches)
+        return
+    except Exception as e:
+        logger.error(f"Error saving insight with photo: {str(e)}", exc_info=True)
+        await message.answer(f"❌ Ошибка при сохранении инсайта: {str(e)}")
+    
+    await state.clear()
+
+@router.callback_query(InsightForm.file_attachment, F.data == "skip_file")
+async def skip_file(callback: CallbackQuery, state: FSMContext):
+    """Пропуск прикрепления файла"""
+    data = await state.get_data()
+    try:
+        if 'file_id' not in data:
+            data['file_id'] = None
+            data['filename'] = None
+        
+        logger.info(f"Saving insight for user {callback.from_user.id}: theme={data.get('theme')}, region={data.get('macro_region')}, industry={data.get('industry')}")
+        
+        saved = await save_insight_to_db(data, callback.from_user.id)
+        after_save(callback.bot, saved)
+        logger.info(f"User {callback.from_user.id} created insight without file: {data.get('theme')}")
+        
+        success_text = (
+            f"✅ **Инсайт успешно создан!**\n\n"
+            f"📝 Тема: {data['theme']}\n"
+            f"🗺️ Макрорегион: {data['macro_region']}\n"
+            f"🏭 Отрасль: {data['industry']}"
+        )
+        
+        await callback.message.edit_text(success_text, reply_markup=await create_main_keyboard())
+    except DuplicateInsight as e:
+        await confirm_duplicate(callback.message, state, e.matches, edit=True)
+        await callback.answer()
+        return
+    except Exception as e:
+        logger.error(f"Error saving insight without file: {str(e)}", exc_info=True)
+        await callback.message.edit_text(f"❌ Ошибка при сохранении инсайта:\n{str(e)}")
+    
+    await state.clear()
+    await callback.answer()
+
+async def confirm_duplicate(message, state: FSMContext, matches: list, edit: bool = False):
+    """Похожие инсайты уже есть: сохранить новый все равно или отказаться"""
+    lines = ["⚠️ Похоже, такой инсайт уже есть:", ""]
+    for insight, score in matches:
+        match = "совпадает" if score >= 1 else f"сходство {score:.0%}"
+        lines.append(f"• {insight['created_at'][:10]} — {short_text(insight['theme'])} ({match})")
+    lines += ["", "Сохранить новый инсайт все равно?"]
+    
+    builder = InlineKeyboardBuilder()
+    builder.button(text="💾 Сохранить", callback_data="save_duplicate")
+    builder.button(text="❌ Не сохранять", callback_data="drop_duplicate")
+    builder.adjust(2)
+    
+    await state.set_state(InsightForm.duplicate)
+    if edit:
+        await message.edit_text("\n".join(lines), reply_markup=builder.as_markup())
+    else:
+        await message.answer("\n".join(lines), reply_markup=builder.as_markup())
+
+@router.callback_query(InsightForm.duplicate, F.data == "save_duplicate")
+async def save_duplicate(callback: CallbackQuery, state: FSMContext):
+    """Сохранение инсайта, несмотря на похожие"""
+    data = await state.get_data()
+    try:
+        saved = await save_insight_to_db(data, callback.from_user.id, allow_duplicates=True)
+        after_save(callback.bot, saved)
+        logger.info(f"User {callback.from_user.id} saved insight despite duplicates: {data.get('theme')}")
+        
+        success_text = (
+            f"✅ **Инсайт успешно создан!**\n\n"
+            f"📝 Тема: {data['theme']}\n"
+            f"🗺️ Макрорегион: {data['macro_region']}\n"
+            f"🏭 Отрасль: {data['industry']}"
+        )
+        if data.get('file_id'):
+            success_text += f"\n📎 Файл: {data.get('filename') or 'прикреплен'}"
+        
+        await callback.message.edit_text(success_text, reply_markup=await create_main_keyboard())
+    except Exception as e:
+        logger.error(f"Error saving duplicate insight: {str(e)}", exc_info=True)
+        await callback.message.edit_text(f"❌ Ошибка при сохранении инсайта:\n{str(e)}")
+    
+    await state.clear()
+    await callback.answer()
+
+@router.callback_query(InsightForm.duplicate, F.data == "drop_duplicate")
+async def drop_duplicate(callback: CallbackQuery, state: FSMContext):
+    """Отказ от сохранения повтора"""
+    await state.clear()
+    await callback.message.edit_text("❌ Инсайт не сохранен", reply_markup=await create_main_keyboard())
+    await callback.answer()
+
+# ==================== ПОИСК И ПРОСМОТР ====================
+
+@router.callback_query(F.data == "search_insights")
+async def search_start(callback: CallbackQuery, state: FSMContext):
+    """Начало поиска"""
+    logger.info(f"User {callback.from_user.id} started searching")
+    keyboard = await create_region_keyboard(for_search=True)
+    await callback.message.edit_text("🗺️ Выберите макрорегион для поиска:", 
+                                     reply_markup=keyboard)
+    await state.set_state(SearchForm.macro_region)
+    await callback.answer()
+
+@router.callback_query(SearchForm.macro_region, F.data.startswith("search_region_"))
+async def search_region_selected(callback: CallbackQuery, state: FSMContext):
+    """Выбор макрорегиона в поиске"""
+    region = callback.data.replace("search_region_", "")
+    logger.info(f"User {callback.from_user.id} selected region: {region}")
+    await state.update_data(macro_region=region)
+    
+    keyboard = await create_industry_keyboard(macro_region=region, for_search=True)
+    await callback.message.edit_text("🏭 Выберите отрасль:", reply_markup=keyboard)
+    await state.set_state(SearchForm.industry)
+    await callback.answer()
+
+@router.callback_query(SearchForm.industry, F.data.startswith("search_industry_"))
+async def search_industry_selected(callback: CallbackQuery, state: FSMContext):
+    """Выбор отрасли в поиске и вывод первой страницы результатов"""
+    industry = callback.data.replace("search_industry_", "")
+    logger.info(f"User {callback.from_user.id} selected industry: {industry}")
+    await state.update_data(industry=industry)
+    
+    data = await state.get_data()
+    filters = search_filters(data)
+    
+    logger.info(f"🔍 User {callback.from_user.id} searching with filters: {filters}")
+    
+    try:
+        total = await count_insights(filters)
+        logger.info(f"✅ Found {total} insights with filters {filters}")
+        
+        if not total:
+            logger.warning(f"⚠️ No insights found for filters: {filters}")
+            await callback.message.edit_text(
+                f"😔 Записей не найдено\n\n"
+                f"🗺️ Регион: {filters['macro_region']}\n"
+                f"🏭 Отрасль: {filters['industry']}\n\n"
+                "Создайте первый инсайт!",
+                reply_markup=InlineKeyboardBuilder()
+                .button(text="⬅️ Назад", callback_data="back_to_main")
+                .as_markup()
+            )
+            await state.clear()
+            await callback.answer()
+            return
+        
+        # В FSM хранятся только фильтры и позиция, записи читаются постранично
+        await state.update_data(total=total, current_index=0, insight_id=None)
+        await state.set_state(SearchForm.viewing)
+        await show_results_page(callback.message, filters, total, 0)
+        logger.info(f"Showing first page to user {callback.from_user.id}")
+    except Exception as e:
+        logger.error(f"❌ Error searching insights: {str(e)}", exc_info=True)
+        await callback.message.edit_text(f"❌ Ошибка при поиске:\n{str(e)}")
+    
+    await callback.answer()
+
+def search_filters(data: dict) -> dict:
+    """Фильтры поиска из данных FSM"""
+    return {
+        "macro_region": data.get("macro_region"),
+        "industry": data.get("industry")
+    }
+
+def short_text(text: str, limit: int = 60) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+async def show_results_page(message, filters, total, page):
+    """Страница результатов: SEARCH_PAGE_SIZE кратких записей и переходы по страницам"""
+    pages = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+    page = min(max(0, page), pages - 1)
+    offset = page * SEARCH_PAGE_SIZE
+    insights = await get_insights_page(filters, SEARCH_PAGE_SIZE, offset)
+    
+    lines = [
+        f"🔍 Найдено: {total}",
+        f"🗺️ {filters['macro_region']} · 🏭 {filters['industry']}",
+        f"Страница {page + 1} из {pages}",
+        ""
+    ]
+    for number, insight in enumerate(insights, start=offset + 1):
+        lines.append(f"{number}. {insight['created_at'][:10]} — {short_text(insight['theme'])}")
+    
+    builder = InlineKeyboardBuilder()
+    
+    # Номера записей - открыть инсайт
+    for number in range(offset, offset + len(insights)):
+        builder.button(text=str(number + 1), callback_data=f"open_insight_{number}")
+    
+    # Переходы: первая, -SEARCH_JUMP, пред., след., +SEARCH_JUMP, последняя
+    jumps = [
+        ("⏮", 0),
+        (f"« {SEARCH_JUMP}", page - SEARCH_JUMP),
+        ("‹", page - 1),
+        ("›", page + 1),
+        (f"{SEARCH_JUMP} »", page + SEARCH_JUMP),
+        ("⏭", pages - 1),
+    ]
+    shown = set()
+    nav = 0
+    for text, target in jumps:
+        if 0 <= target < pages and target != page and target not in shown:
+            shown.add(target)
+            builder.button(text=text, callback_data=f"search_page_{target}")
+            nav += 1
+    
+    files = sum(1 for insight in insights if insight.get('file_id'))
+    if files:
+        builder.button(text=f"📎 Файлы страницы ({files})", callback_data=f"page_files_{page}")
+    
+    builder.button(text="📊 Экспорт результатов", callback_data="export_menu")
+    builder.button(text="🔍 К фильтрам", callback_data="back_to_search")
+    builder.button(text="🔙 Меню", callback_data="back_to_main")
+    
+    rows = [5] * (len(insights) // 5)
+    if len(insights) % 5:
+        rows.append(len(insights) % 5)
+    if nav:
+        rows.append(nav)
+    if files:
+        rows.append(1)
+    builder.adjust(*rows, 1, 2)
+    
+    await message.edit_text("\n".join(lines), reply_markup=builder.as_markup())
+
+def render_insight(insight, index, total):
+    """Текст и клавиатура экрана одного инсайта с навигацией"""
+    insight_text = (
+        f"📌 **Инсайт {index + 1} из {total}**\n\n"
+        f"📅 Дата: {insight['created_at'][:10]}\n"
+        f"📝 Тема: {insight['theme']}\n"
+        f"📄 Описание: {insight['description']}\n"
+        f"🗺️ Макрорегион: {insight['macro_region']}\n"
+        f"🏭 Отрасль: {insight['industry']}"
+    )
+    
+    builder = InlineKeyboardBuilder()
+    rows = []
+    
+    step = []
+    if index > 0:
+        builder.button(text="⬅️ Пред.", callback_data="prev_insight")
+        step.append(1)
+    if index < total - 1:
+        builder.button(text="Сл. ➡️", callback_data="next_insight")
+        step.append(1)
+    if step:
+        rows.append(len(step))
+    
+    # Быстрые переходы для длинных результатов
+    jumps = 0
+    if index > 0 and total > SEARCH_JUMP:
+        builder.button(text="⏮", callback_data="open_insight_0")
+        builder.button(text=f"⏪ {SEARCH_JUMP}", callback_data=f"skip_insight_{-SEARCH_JUMP}")
+        jumps += 2
+    if index < total - 1 and total > SEARCH_JUMP:
+        builder.button(text=f"{SEARCH_JUMP} ⏩", callback_data=f"skip_insight_{SEARCH_JUMP}")
+        builder.button(text="⏭", callback_data=f"open_insight_{total - 1}")
+        jumps += 2
+    if jumps:
+        rows.append(jumps)
+    
+    if insight.get('file_id'):
+        builder.button(text="📎 Файл", callback_data="download_file")
+        rows.append(1)
+    
+    builder.button(text="📋 Список", callback_data=f"search_page_{index // SEARCH_PAGE_SIZE}")
+    builder.button(text="🔍 К фильтрам", callback_data="back_to_search")
+    builder.button(text="🔙 Меню", callback_data="back_to_main")
+    builder.adjust(*rows, 3)
+    
+    return insight_text, builder.as_markup()
+
+async def prefetch_neighbours(session, filters: dict, total: int, index: int):
+    """Фоновая подготовка экранов index-1, index, index+1 одним запросом"""
+    offset = max(0, index - 1)
+    try:
+        insights = await get_insights_page(filters, index + 2 - offset, offset)
+    except Exception as e:
+        logger.warning(f"Prefetch failed for {session}: {e}")
+        return
+    
+    screens = {}
+    for position, insight in enumerate(insights, start=offset):
+        text, markup = render_insight(insight, position, total)
+        screens[position] = (insight['id'], text, markup)
+    render_cache.put(session, search_signature(filters, total), screens)
+
+async def open_insight(message, state: FSMContext, data: dict, index: int) -> bool:
+    """Показать инсайт с номером index в результатах (из кэша экранов или из БД)"""
+    total = data.get("total", 0)
+    index = min(max(0, index), total - 1)
+    filters = search_filters(data)
+    session = (message.chat.id, message.message_id)
+    
+    screen = render_cache.get(session, search_signature(filters, total), index)
+    if screen is None:
+        insights = await get_insights_page(filters, 1, index)
+        if not insights:
+            return False
+        screen = (insights[0]['id'], *render_insight(insights[0], index, total))
+    
+    insight_id, text, markup = screen
+    await state.update_data(current_index=index, insight_id=insight_id)
+    await message.edit_text(text, reply_markup=markup)
+    
+    # Соседи готовятся, пока пользователь читает этот инсайт
+    _run_in_background(prefetch_neighbours(session, filters, total, index))
+    return True
+
+@router.callback_query(SearchForm.viewing, F.data.startswith("search_page_"))
+async def search_page(callback: CallbackQuery, state: FSMContext):
+    """Переход на страницу результатов"""
+    page = int(callback.data.replace("search_page_", ""))
+    data = await state.get_data()
+    
+    await show_results_page(callback.message, search_filters(data), data.get("total", 0), page)
+    await callback.answer()
+
+@router.callback_query(SearchForm.viewing, F.data.startswith("open_insight_"))
+async def open_insight_selected(callback: CallbackQuery, state: FSMContext):
+    """Открыть инсайт по номеру (из списка или кнопками ⏮ / ⏭)"""
+    index = int(callback.data.replace("open_insight_", ""))
+    data = await state.get_data()
+    
+    if not await open_insight(callback.message, state, data, index):
+        await callback.answer("❌ Инсайт не найден", show_alert=True)
+        return
+    await callback.answer()
+
+async def navigate_insights(callback: CallbackQuery, state: FSMContext, delta: int):
+    """Сдвиг по результатам поиска; быстрые нажатия склеиваются в один переход"""
+    message = callback.message
+
+    async def apply(total_delta: int):
+        if await state.get_state() != SearchForm.viewing.state:
+            return
+
+        data = await state.get_data()
+        current_index = data.get("current_index", 0)
+        index = min(max(0, current_index + total_delta), data.get("total", 0) - 1)
+        if index == current_index:
+            return
+
+        await open_insight(message, state, data, index)
+
+    navigation.push((message.chat.id, message.message_id), delta, apply)
+    await callback.answer()
+
+@router.callback_query(SearchForm.viewing, F.data == "next_insight")
+async def next_insight(callback: CallbackQuery, state: FSMContext):
+    """Следующий инсайт"""
+    await navigate_insights(callback, state, 1)
+
+@router.callback_query(SearchForm.viewing, F.data == "prev_insight")
+async def prev_insight(callback: CallbackQuery, state: FSMContext):
+    """Предыдущий инсайт"""
+    await navigate_insights(callback, state, -1)
+
+@router.callback_query(SearchForm.viewing, F.data.startswith("skip_insight_"))
+async def skip_insights(callback: CallbackQuery, state: FSMContext):
+    """Переход на SEARCH_JUMP инсайтов вперед или назад"""
+    await navigate_insights(callback, state, int(callback.data.replace("skip_insight_", "")))
+
+@router.callback_query(SearchForm.viewing, F.data == "download_file")
+async def download_file(callback: CallbackQuery, state: FSMContext):
+    """Скачивание файла из инсайта"""
+    data = await state.get_data()
+    insight = await get_insight_by_id(data["insight_id"]) if data.get("insight_id") else None
+    
+    if insight and insight.get('file_id'):
+        try:
+            await send_attachment(
+                callback.bot,
+                callback.from_user.id,
+                insight,
+                caption=f"📎 Файл из инсайта: {insight['theme']}"
+            )
+            logger.info(f"User {callback.from_user.id} downloaded file")
+        except Exception as e:
+            logger.error(f"Error downloading file: {e}", exc_info=True)
+            await callback.answer("❌ Ошибка при скачивании файла", show_alert=True)
+    
+    await callback.answer()
+
+@router.callback_query(SearchForm.viewing, F.data.startswith("page_files_"))
+async def download_page_files(callback: CallbackQuery, state: FSMContext):
+    """Все вложения страницы результатов одним или несколькими альбомами"""
+    page = int(callback.data.replace("page_files_", ""))
+    data = await state.get_data()
+    
+    insights = await get_insights_page(search_filters(data), SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE)
+    try:
+        sent = await send_attachments(callback.bot, callback.from_user.id, insights)
+        logger.info(f"User {callback.from_user.id} downloaded {sent} file(s) from page {page + 1}")
+    except Exception as e:
+        logger.error(f"Error downloading page files: {e}", exc_info=True)
+        await callback.answer("❌ Ошибка при скачивании файлов", show_alert=True)
+    
+    await callback.answer()
+
+@router.callback_query(SearchForm.viewing, F.data == "back_to_search")
+async def back_to_search(callback: CallbackQuery, state: FSMContext):
+    """Возврат к фильтрам поиска"""
+    data = await state.get_data()
+    region = data.get("macro_region")
+    industry = data.get("industry")
+
+    builder = InlineKeyboardBuilder()
+    builder.button(text="✏️ Изменить фильтры", callback_data="search_insights")
+    builder.button(text="🔙 В меню", callback_data="back_to_main")
+    builder.adjust(1)
+
+    await callback.message.edit_text(
+        f"🔍 **Текущие фильтры:**\n\n"
+        f"🗺️ Регион: {region}\n"
+        f"🏭 Отрасль: {industry}\n\n"
+        f"Хотите изменить фильтры?",
+        reply_markup=builder.as_markup()
+    )
+    await callback.answer()
+
+# ==================== ВОЗВРАТ НА МАКРО-РЕГИОН ====================
+
+@router.callback_query(F.data == "back_to_new_macro")
+async def back_to_new_macro(callback: CallbackQuery, state: FSMContext):
+    """Возврат к выбору макрорегиона при создании инсайта"""
+    data = await state.get_data()
+    
+    await state.set_state(InsightForm.macro_region)
+    
+    keyboard = await create_region_keyboard(for_search=False)
+    await callback.message.edit_text("🗺️ Выберите макрорегион:", reply_markup=keyboard)
+    await callback.answer()
+
+@router.callback_query(F.data == "back_to_search_macro")
+async def back_to_search_macro(callback: CallbackQuery, state: FSMContext):
+    """Возврат к выбору макрорегиона при поиске инсайта"""
+    data = await state.get_data()
+    
+    await state.set_state(SearchForm.macro_region)
+    
+    keyboard = await create_region_keyboard(for_search=True)
+    await callback.message.edit_text("🗺️ Выберите макрорегион для поиска:", reply_markup=keyboard)
+    await callback.answer()
+
+# ==================== МОИ ИНСАЙТЫ ====================
+
+# Страницы списка адресуются курсором - последней записью предыдущей страницы
+# (keyset-пагинация по индексу user_id, created_at, id). В FSM хранится стек
+# курсоров открытых страниц: "›" добавляет курсор, "‹" снимает.
+
+async def show_my_page(message, state: FSMContext, user_id: int):
+    """Страница списка "Мои инсайты" (текущая - по последнему курсору стека)"""
+    data = await state.get_data()
+    pages = data.get("my_pages") or [None]
+    
+    # Лишняя запись - признак следующей страницы
+    insights = await get_user_insights_page(user_id, SEARCH_PAGE_SIZE + 1, pages[-1])
+    while not insights and len(pages) > 1:
+        # Последние записи страницы удалены - назад на предыдущую
+        pages = pages[:-1]
+        insights = await get_user_insights_page(user_id, SEARCH_PAGE_SIZE + 1, pages[-1])
+    has_next = len(insights) > SEARCH_PAGE_SIZE
+    insights = insights[:SEARCH_PAGE_SIZE]
+    
+    await state.set_state(MyInsights.listing)
+    await state.update_data(
+        my_pages=pages,
+        my_next={"created_at": insights[-1]["created_at"], "id": insights[-1]["id"]} if has_next else None,
+    )
+    
+    builder = InlineKeyboardBuilder()
+    if not insights:
+        builder.button(text="➕ Создать новый инсайт", callback_data="new_insight")
+        builder.button(text="🔙 Меню", callback_data="back_to_main")
+        builder.adjust(1)
+        text = "📂 У вас пока нет инсайтов"
+    else:
+        total = await count_insights({"user_id": user_id})
+        offset = (len(pages) - 1) * SEARCH_PAGE_SIZE
+        pages_total = max(len(pages), (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE)
+        lines = [f"📂 Мои инсайты: {total}", f"Страница {len(pages)} из {pages_total}", ""]
+        for number, insight in enumerate(insights, start=offset + 1):
+            lines.append(f"{number}. {insight['created_at'][:10]} · {insight['macro_region']} · "
+                         f"{short_text(insight['theme'], 45)}")
+            builder.button(text=str(number), callback_data=f"my_open_{insight['id']}")
+        
+        rows = [5] * (len(insights) // 5)
+        if len(insights) % 5:
+            rows.append(len(insights) % 5)
+        nav = 0
+        if len(pages) > 1:
+            builder.button(text="‹", callback_data="my_prev")
+            nav += 1
+        if has_next:
+            builder.button(text="›", callback_data="my_next")
+            nav += 1
+        if nav:
+            rows.append(nav)
+        builder.button(text="📊 Экспорт моих", callback_data="export_menu")
+        builder.button(text="🔙 Меню", callback_data="back_to_main")
+        builder.adjust(*rows, 2)
+        text = "\n".join(lines)
+    
+    await message.edit_text(text, reply_markup=builder.as_markup())
+
+def render_my_insight(insight: dict):
+    """Текст и клавиатура своего инсайта: правка, удаление, файл"""
+    text = (
+        f"📌 **Мой инсайт**\n\n"
+        f"📅 Дата: {insight['created_at'][:10]}\n"
+        f"📝 Тема: {insight['theme']}\n"
+        f"📄 Описание: {insight['description']}\n"
+        f"🗺️ Макрорегион: {insight['macro_region']}\n"
+        f"🏭 Отрасль: {insight['industry']}"
+    )
+    
+    builder = InlineKeyboardBuilder()
+    builder.button(text="✏️ Тема", callback_data="my_edit_theme")
+    builder.button(text="✏️ Описание", callback_data="my_edit_description")
+    rows = [2]
+    if insight.get('file_id'):
+        builder.button(text="📎 Файл", callback_data="my_file")
+        rows.append(1)
+    builder.button(text="🗑 Удалить", callback_data="my_delete")
+    builder.button(text="📋 К списку", callback_data="my_list")
+    builder.adjust(*rows, 2)
+    return text, builder.as_markup()
+
+async def get_own_insight(state: FSMContext, user_id: int):
+    """Открытый в "Мои инсайты" инсайт, если он есть и принадлежит пользователю"""
+    insight_id = (await state.get_data()).get("my_insight")
+    insight = await get_insight_by_id(insight_id) if insight_id else None
+    return insight if insight and insight['user_id'] == user_id else None
+
+@router.callback_query(F.data == "my_insights")
+async def my_insights(callback: CallbackQuery, state: FSMContext):
+    """Список своих инсайтов, первая страница"""
+    logger.info(f"User {callback.from_user.id} opened own insights")
+    await state.clear()
+    await state.update_data(my_pages=[None])
+    await show_my_page(callback.message, state, callback.from_user.id)
+    await callback.answer()
+
+@router.callback_query(MyInsights, F.data.in_({"my_next", "my_prev", "my_list"}))
+async def my_insights_page(callback: CallbackQuery, state: FSMContext):
+    """Следующая / предыдущая страница или возврат к текущей"""
+    data = await state.get_data()
+    pages = data.get("my_pages") or [None]
+    if callback.data == "my_next" and data.get("my_next"):
+        pages = pages + [data["my_next"]]
+    elif callback.data == "my_prev" and len(pages) > 1:
+        pages = pages[:-1]
+    
+    await state.update_data(my_pages=pages)
+    await show_my_page(callback.message, state, callback.from_user.id)
+    await callback.answer()
+
+@router.callback_query(MyInsights, F.data.startswith("my_open_"))
+async def my_insight_open(callback: CallbackQuery, state: FSMContext):
+    """Открыть свой инсайт"""
+    await state.update_data(my_insight=int(callback.data.replace("my_open_", "")))
+    insight = await get_own_insight(state, callback.from_user.id)
+    if insight is None:
+        await callback.answer("❌ Инсайт не найден", show_alert=True)
+        return
+    
+    await state.set_state(MyInsights.listing)
+    text, markup = render_my_insight(insight)
+    await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
+
+@router.callback_query(MyInsights, F.data == "my_file")
+async def my_insight_file(callback: CallbackQuery, state: FSMContext):
+    """Вложение своего инсайта"""
+    insight = await get_own_insight(state, callback.from_user.id)
+    if insight and insight.get('file_id'):
+        try:
+            await send_attachment(callback.bot, callback.from_user.id, insight,
+                                  caption=f"📎 Файл из инсайта: {insight['theme']}")
+        except Exception as e:
+            logger.error(f"Error sending own insight file: {e}", exc_info=True)
+            await callback.answer("❌ Ошибка при скачивании файла", show_alert=True)
+    await callback.answer()
+
+@router.callback_query(MyInsights, F.data.in_({"my_edit_theme", "my_edit_description"}))
+async def my_insight_edit(callback: CallbackQuery, state: FSMContext):
+    """Правка темы или описания: следующее сообщение - новый текст"""
+    insight = await get_own_insight(state, callback.from_user.id)
+    if insight is None:
+        await callback.answer("❌ Инсайт не найден", show_alert=True)
+        return
+    
+    builder = InlineKeyboardBuilder()
+    builder.button(text="⬅️ Отмена", callback_data=f"my_open_{insight['id']}")
+    
+    if callback.data == "my_edit_theme":
+        await state.set_state(MyInsights.edit_theme)
+        prompt = f"✏️ Текущая тема:\n{insight['theme']}\n\nВведите новую тему (максимум {MAX_THEME_LENGTH} символов):"
+    else:
+        await state.set_state(MyInsights.edit_description)
+        prompt = f"✏️ Текущее описание:\n{insight['description']}\n\nВведите новое описание:"
+    
+    await callback.message.edit_text(prompt, reply_markup=builder.as_markup())
+    await callback.answer()
+
+async def save_my_edit(message: Message, state: FSMContext, field: str):
+    """Сохранение новой темы или описания и показ инсайта"""
+    insight = await get_own_insight(state, message.from_user.id)
+    if insight is None:
+        await message.answer("❌ Инсайт не найден", reply_markup=await create_main_keyboard())
+        await state.clear()
+        return
+    
+    if await update_insight(insight['id'], {field: message.text}, message.from_user.id):
+        changed = {**insight, field: message.text}
+        await insight_changed(insight, changed)
+        logger.info(f"User {message.from_user.id} changed {field} of insight {insight['id']}")
+        insight = changed
+    else:
+        await message.answer("❌ Не удалось сохранить изменения")
+    
+    await state.set_state(MyInsights.listing)
+    text, markup = render_my_insight(insight)
+    await message.answer(text, reply_markup=markup)
+
+@router.message(MyInsights.edit_theme, F.text)
+async def my_insight_theme(message: Message, state: FSMContext):
+    """Новая тема своего инсайта"""
+    if len(message.text) > MAX_THEME_LENGTH:
+        await message.answer(f"❌ Тема слишком длинная (максимум {MAX_THEME_LENGTH} символов)")
+        return
+    await save_my_edit(message, state, "theme")
+
+@router.message(MyInsights.edit_description, F.text)
+async def my_insight_description(message: Message, state: FSMContext):
+    """Новое описание своего инсайта"""
+    await save_my_edit(message, state, "description")
+
+@router.callback_query(MyInsights, F.data == "my_delete")
+async def my_insight_delete(callback: CallbackQuery, state: FSMContext):
+    """Подтверждение удаления"""
+    insight = await get_own_insight(state, callback.from_user.id)
+    if insight is None:
+        await callback.answer("❌ Инсайт не найден", show_alert=True)
+        return
+    
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🗑 Да, удалить", callback_data="my_delete_confirm")
+    builder.button(text="⬅️ Отмена", callback_data=f"my_open_{insight['id']}")
+    builder.adjust(2)
+    await callback.message.edit_text(
+        f"🗑 Удалить инсайт «{short_text(insight['theme'])}»?\n\nЭто действие нельзя отменить.",
+        reply_markup=builder.as_markup()
+    )
+    await callback.answer()
+
+@router.callback_query(MyInsights, F.data == "my_delete_confirm")
+async def my_insight_delete_confirm(callback: CallbackQuery, state: FSMContext):
+    """Удаление своего инсайта и возврат к списку"""
+    insight = await get_own_insight(state, callback.from_user.id)
+    if insight is None or not await delete_insight(insight['id'], callback.from_user.id):
+        await callback.answer("❌ Не удалось удалить инсайт", show_alert=True)
+        return
+    
+    await insight_changed(old=insight)
+    await state.update_data(my_insight=None)
+    await show_my_page(callback.message, state, callback.from_user.id)
+    await callback.answer("🗑 Инсайт удален")
+
+# ==================== ЭКСПОРТ ====================
+
+# Периоды выгрузки: дней назад -> подпись (0 - все время)
+EXPORT_PERIODS = {0: "всё время", 7: "7 дней", 30: "30 дней", 90: "3 месяца", 365: "год"}
+
+def export_filters(data: dict, user_id: int) -> tuple:
+    """
+    Условия выгрузки из настроек меню экспорта: (фильтры, date_from)
+
+    Все условия передаются в запрос (get_all_insights), из БД читаются
+    только попадающие в выгрузку записи.
+    """
+    scope = data.get("export", {})
+    filters = {}
+    if scope.get("search"):
+        filters.update(search_filters(data))
+    if scope.get("mine"):
+        filters["user_id"] = user_id
+    days = scope.get("days", 0)
+    date_from = date.today() - timedelta(days=days) if days else None
+    return filters, date_from
+
+def describe_export(data: dict) -> str:
+    """Описание выгрузки для меню и подписи к файлу"""
+    scope = data.get("export", {})
+    parts = []
+    if scope.get("search"):
+        parts.append(f"🗺️ {data.get('macro_region')} · 🏭 {data.get('industry')}")
+    if scope.get("mine"):
+        parts.append("👤 только мои")
+    parts.append(f"📅 {EXPORT_PERIODS[scope.get('days', 0)]}")
+    return "\n".join(parts)
+
+async def show_export_menu(message, state: FSMContext, user_id: int):
+    """Меню экспорта: что выгружать (поиск, мои, период) и в каком формате"""
+    data = await state.get_data()
+    scope = data.get("export", {})
+    in_search = "search" in scope
+    
+    builder = InlineKeyboardBuilder()
+    options = 2
+    if in_search:
+        mark = "✅" if scope["search"] else "⬜"
+        builder.button(text=f"{mark} По текущему поиску", callback_data="export_toggle_search")
+        options += 1
+    builder.button(text=f"{'✅' if scope.get('mine') else '⬜'} Только мои", callback_data="export_toggle_mine")
+    builder.button(text=f"📅 Период: {EXPORT_PERIODS[scope.get('days', 0)]}", callback_data="export_period")
+    
+    for exporter in available_exporters():
+        builder.button(text=exporter.title, callback_data=f"export_format_{exporter.name}")
+    builder.button(text="📦 ZIP с файлами", callback_data="export_zip")
+    if in_search:
+        builder.button(text="⬅️ К результатам", callback_data="search_page_0")
+    builder.button(text="🔙 Меню", callback_data="back_to_main")
+    builder.adjust(*[1] * options, 2)
+    
+    # Счетчик - тем же запросом с теми же условиями, что и выгрузка (без архива)
+    filters, date_from = export_filters(data, user_id)
+    total = await count_insights({**filters, "date_from": date_from})
+    
+    await message.edit_text(
+        "📊 **Экспорт инсайтов**\n\n"
+        f"{describe_export(data)}\n"
+        f"Записей: {total}\n\n"
+        "Excel — таблица с оформлением, быстрый Excel — для больших выгрузок,\n"
+        "CSV — для любых программ, Parquet — для аналитики.",
+        reply_markup=builder.as_markup()
+    )
+
+@router.callback_query(F.data == "export_menu")
+async def export_menu(callback: CallbackQuery, state: FSMContext):
+    """Выбор формата экспорта; из результатов поиска - с фильтрами поиска, из "Мои инсайты" - только свои"""
+    current = await state.get_state()
+    if current == SearchForm.viewing.state:
+        scope = {"search": True}
+    elif current in MyInsights:
+        scope = {"mine": True}
+    else:
+        scope = {}
+    await state.update_data(export=scope)
+    await show_export_menu(callback.message, state, callback.from_user.id)
+    await callback.answer()
+
+@router.callback_query(F.data.in_({"export_toggle_search", "export_toggle_mine", "export_period"}))
+async def export_scope(callback: CallbackQuery, state: FSMContext):
+    """Изменение условий выгрузки"""
+    data = await state.get_data()
+    scope = dict(data.get("export", {}))
+    if callback.data == "export_toggle_search":
+        scope["search"] = not scope.get("search")
+    elif callback.data == "export_toggle_mine":
+        scope["mine"] = not scope.get("mine")
+    else:
+        periods = list(EXPORT_PERIODS)
+        scope["days"] = periods[(periods.index(scope.get("days", 0)) + 1) % len(periods)]
+    await state.update_data(export=scope)
+    await show_export_menu(callback.message, state, callback.from_user.id)
+    await callback.answer()
+
+async def send_export(message, entry, caption: str):
+    """
+    Отправка готовой выгрузки
+
+    Файл загружается в Telegram один раз: одновременные отправки того же
+    файла ждут первую загрузку и уходят по ее file_id.
+    """
+    async def upload():
+        sent = await message.answer_document(FSInputFile(entry.path, filename=entry.filename), caption=caption)
+        await asyncio.to_thread(export_cache.set_file_id, entry, sent.document.file_id)
+        return sent
+    
+    # Выгрузка файла не должна задерживать ответы другим пользователям
+    with bulk_priority():
+        file_id = entry.file_id
+        if not file_id:
+            sent, shared = await uploads.do((entry.key, entry.created), upload)
+            if not shared:
+                return sent
+            file_id = sent.document.file_id
+        
+        try:
+            return await message.answer_document(file_id, caption=caption)
+        except TelegramBadRequest as e:
+            logger.warning(f"Cached export file_id was rejected, uploading again: {e}")
+            return await upload()
+
+@router.callback_query(F.data.startswith("export_format_") | (F.data == "export_excel"))
+async def export_format(callback: CallbackQuery, state: FSMContext):
+    """Экспорт инсайтов в выбранном формате (export_excel - кнопка старых сообщений)"""
+    format_name = callback.data.replace("export_format_", "") if callback.data != "export_excel" else "xlsx"
+    data = await state.get_data()
+    filters, date_from = export_filters(data, callback.from_user.id)
+    logger.info(f"User {callback.from_user.id} requested {format_name} export: {filters}, from {date_from}")
+    
+    try:
+        # Та же выгрузка, построенная раньше (в том числе заранее, см. scheduler.py), берется из кэша
+        entry = await cached_export(format_name, filters, date_from, callback.from_user.id)
+        
+        if entry is None:
+            await callback.answer("❌ Нет данных для экспорта", show_alert=True)
+            return
+        
+        await send_export(
+            callback.message, entry,
+            caption=f"📊 Экспорт инсайтов ({entry.rows} записей)\n\n"
+                    f"{describe_export(data)}\n"
+                    f"Формат: {EXPORTERS[format_name].title}"
+        )
+        
+        logger.info(f"Export completed for user {callback.from_user.id}")
+    
+    except Exception as e:
+        logger.error(f"Export error for user {callback.from_user.id}: {e}", exc_info=True)
+        await callback.answer("❌ Ошибка при экспорте данных", show_alert=True)
+    
+    await callback.answer()
+
+@router.callback_query(F.data == "export_zip")
+async def export_zip(callback: CallbackQuery, state: FSMContext):
+    """Экспорт инсайтов с прикрепленными файлами в ZIP (по частям до 50 МБ)"""
+    data = await state.get_data()
+    filters, date_from = export_filters(data, callback.from_user.id)
+    logger.info(f"User {callback.from_user.id} requested ZIP export: {filters}, from {date_from}")
+    
+    paths = []
+    try:
+        insights = await get_all_insights(date_from=date_from, filters=filters)
+        
+        if not insights:
+            await callback.answer("❌ Нет данных для экспорта", show_alert=True)
+            return
+        
+        await callback.answer("⏳ Собираю архив с файлами...")
+        paths = await export_insights_to_zip(callback.bot, insights, callback.from_user.id)
+        
+        files = sum(1 for insight in insights if insight.get('file_id'))
+        with bulk_priority():
+            for number, path in enumerate(paths, start=1):
+                part = f", часть {number} из {len(paths)}" if len(paths) > 1 else ""
+                await callback.message.answer_document(
+                    FSInputFile(path),
+                    caption=f"📦 Экспорт инсайтов с файлами{part}\n\n"
+                            f"{describe_export(data)}\n"
+                            f"{len(insights)} записей, {files} файлов"
+                )
+        
+        logger.info(f"ZIP export completed for user {callback.from_user.id}")
+    
+    except Exception as e:
+        logger.error(f"ZIP export error for user {callback.from_user.id}: {e}", exc_info=True)
+        await callback.message.answer("❌ Ошибка при экспорте данных")
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
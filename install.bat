@@ -65,6 +65,6 @@ echo 🤖 Запуск бота...
 echo ================================================
 echo.
 
-python main.py
+python main.py --mode polling
 
 pause
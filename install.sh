@@ -56,7 +56,7 @@ echo "✓ Конфигурация готова"
 echo ""
 echo "🤖 Запуск бота..."
 echo "================================================"
-python main.py
+python main.py --mode polling
 
 # Деактивация окружения при выходе
 trap "deactivate" EXIT
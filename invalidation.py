@@ -0,0 +1,60 @@
+"""
+Сброс кэшей при изменении инсайтов
+
+Бот сохраняет, правит и удаляет инсайты только через обработчики, и после
+каждого изменения вызывается insight_changed(old, new): old - запись до
+изменения (None для новой), new - после (None для удаленной). Изменения,
+сделанные другими процессами и в обход бота, приходят из журнала
+изменений (changes.py) и сбрасывают те же кэши через invalidate().
+Сбрасывается только то, что могло зависеть от этих записей:
+
+    количества поиска, клавиатур и меню экспорта (database.count_cache)
+    подготовленные экраны поисков (render_cache)
+    готовые выгрузки (export_cache) - при правке и удалении; новая запись
+        и так меняет подпись данных выгрузки
+    проверенный file_id вложения (attachments)
+    счетчики /stats в памяти (stats.record)
+"""
+
+import asyncio
+import logging
+
+from database import count_cache
+from render_cache import render_cache
+from export_cache import export_cache
+from attachments import forget
+from stats import stats
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+async def invalidate(rows: list = None, exports: bool = True):
+    """
+    Сброс количеств, окон поиска и готовых выгрузок, в которые могли попасть записи
+
+    rows=None - сбросить количества и окна поиска целиком (выгрузки не трогаются).
+    exports=False - не проверять выгрузки (для одних только новых записей).
+    """
+    counts = count_cache.invalidate(rows)
+    screens = render_cache.invalidate(rows)
+    removed = await asyncio.to_thread(export_cache.invalidate, rows) if exports and rows else 0
+
+    logger.debug(f"Invalidated {counts} count(s), {screens} search window(s), {removed} export(s)")
+    return counts, screens, removed
+
+
+async def insight_changed(old: dict = None, new: dict = None):
+    """Сброс кэшей, затронутых изменением записи (old/new - до и после, None - нет записи)"""
+    rows = [insight for insight in (old, new) if insight]
+    if not rows:
+        return
+
+    if old:
+        stats.record(old, -1)
+        forget(old['id'])
+    if new:
+        stats.record(new)
+
+    await invalidate(rows, exports=bool(old))
+    metrics.increment("invalidation.changes")
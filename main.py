@@ -1,657 +1,199 @@
-import os
+import time
+
+# Отсчет холодного старта - до импорта тяжелых модулей
+_STARTED_AT = time.perf_counter()
+
+import asyncio
 import logging
-from datetime import datetime
-from decouple import config
+import argparse
 from aiohttp import web
 
-from aiogram import Bot, Dispatcher, Router, F
-from aiogram.types import Message, CallbackQuery, FSInputFile
-from aiogram.filters import Command
-from aiogram.fsm.context import FSMContext
-from aiogram.fsm.state import State, StatesGroup
-from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram import Bot, Dispatcher
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
+from config import BOT_TOKEN, WEBHOOK_URL, PORT, BOT_MODE, LOG_LEVEL, LOG_FORMAT
 from database import (
-    save_insight_to_db,
-    get_count_by_field,
-    get_count_by_two_fields,
-    get_all_insights,
-    get_filtered_insights,
+    init_database,
+    ensure_insight_partitions,
+    warm_up_database,
+    keep_connections_warm,
+    index_insights,
 )
-from export_excel import export_insights_to_excel
+from export_excel import preload as preload_excel
+from handlers import router
+from polling import PollingRunner
+from send_queue import SendQueue
+from mirror import mirror_attachments
+from scheduler import scheduled_jobs
+from changes import change_feed
+import charts
+from startup import StartupReport
+import metrics
 
 # Настройка логирования
 logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    level=LOG_LEVEL,
+    format=LOG_FORMAT
 )
 logger = logging.getLogger(__name__)
 
-# Инициализация
-BOT_TOKEN = config('BOT_TOKEN')
-WEBHOOK_URL = config('WEBHOOK_URL')
-PORT = int(config('PORT', default=8000))
-
-bot = Bot(token=BOT_TOKEN)
+# Bot создается в create_app()/run_polling(), а не при импорте модуля
 dp = Dispatcher()
-router = Router()
-
-# Константы
-MACRO_REGIONS = ["МСК", "ЦФО", "СЗФО", "УФО", "ЮФО", "ПФО", "СДФО", "СНГ", "РФ-целиком"]
-INDUSTRIES = ["Оборона", "Промышленность", "Торговля", "Банки", "Нефть и газ", "Энергетика", "Другое"]
-
-# FSM State Machine
-class InsightForm(StatesGroup):
-    macro_region = State()
-    industry = State()
-    theme = State()
-    description = State()
-    file_attachment = State()
-
-class SearchForm(StatesGroup):
-    macro_region = State()
-    industry = State()
-    viewing = State()
-
-# ==================== Создание клавиатур ====================
-
-async def create_main_keyboard():
-    """Создание главной клавиатуры"""
-    builder = InlineKeyboardBuilder()
-    builder.button(text="➕ Создать новый инсайт", callback_data="new_insight")
-    builder.button(text="🔍 Поиск и просмотр", callback_data="search_insights")
-    builder.button(text="📊 Экспорт в Excel", callback_data="export_excel")
-    builder.button(text="ℹ️ О боте", callback_data="about_bot")
-    builder.adjust(1)
-    return builder.as_markup()
-
-async def create_region_keyboard(for_search=False):
-    """Создание клавиатуры выбора макрорегиона"""
-    builder = InlineKeyboardBuilder()
-    
-    for region in MACRO_REGIONS:
-        count = await get_count_by_field("macro_region", region)
-        prefix = "search" if for_search else "new"
-        builder.button(
-            text=f"{region} ({count})",
-            callback_data=f"{prefix}_region_{region}"
-        )
-    
-    builder.button(text="⬅️ Назад", callback_data="back_to_main")
-    builder.adjust(2)
-    return builder.as_markup()
-
-async def create_industry_keyboard(macro_region=None, for_search=False):
-    """Создание клавиатуры выбора отрасли - считает по выбранному макро"""
-    builder = InlineKeyboardBuilder()
-    
-    for industry in INDUSTRIES:
-        # Если указан макро, считаем только для этого макро
-        if macro_region:
-            count = await get_count_by_two_fields("macro_region", macro_region, "industry", industry)
-        else:
-            count = await get_count_by_field("industry", industry)
-        
-        prefix = "search" if for_search else "new"
-        builder.button(
-            text=f"{industry} ({count})",
-            callback_data=f"{prefix}_industry_{industry}"
-        )
-    
-    # ИСПРАВЛЕНИЕ: разные callback_data для разных режимов - возврат на макро
-    if for_search:
-        builder.button(text="⬅️ Назад", callback_data="back_to_search_macro")
-    else:
-        builder.button(text="⬅️ Назад", callback_data="back_to_new_macro")
-    
-    builder.adjust(1)
-    return builder.as_markup()
-
-# ==================== Команды ====================
-
-@router.message(Command("start"))
-async def cmd_start(message: Message):
-    """Обработка команды /start с красивым приветствием"""
-    logger.info(f"User {message.from_user.id} ({message.from_user.username}) started the bot")
-    
-    welcome_text = f"""
-🎉 Добро пожаловать в Insights Bot!
-
-👋 Привет, {message.from_user.first_name}!
-
-Это приложение предназначено для управления деловыми инсайдами по макрорегионам и отраслям экономики.
-
-📌 **Основные возможности:**
-
-✏️ **Создать инсайт** — добавить новое наблюдение, факт или аналитику
-   • Выберите макрорегион (МСК, ЦФО, СЗФО и др.)
-   • Выберите отрасль (Оборона, Промышленность, Торговля и др.)
-   • Опишите суть инсайта
-   • Прикрепите документ или фото (опционально)
-
-🔍 **Поиск и просмотр** — найти сохраненные инсайты
-   • Фильтруйте по макрорегиону и отрасли
-   • Листайте результаты
-   • Скачивайте прикрепленные файлы
-
-📊 **Экспорт в Excel** — выгрузить все данные в таблицу
-   • Получите красиво отформатированный файл
-   • Удобно для анализа и архивирования
-
-💾 **Облачное хранилище** — все данные хранятся безопасно в БД
-
-─────────────────────────────────────
-
-⬇️ Выберите действие ниже, чтобы начать:
-"""
-    
-    await message.answer(welcome_text, reply_markup=await create_main_keyboard())
-
-@router.message(Command("help"))
-async def cmd_help(message: Message):
-    """Справка по командам"""
-    help_text = """
-🤖 **Доступные команды:**
-
-/start — Главное меню и приветствие
-/help — Эта справка
-/cancel — Отмена текущей операции
-
-📌 **Основные функции:**
-
-➕ **Создать новый инсайт**
-   Пошаговое заполнение:
-   1. Выберите макрорегион
-   2. Выберите отрасль
-   3. Введите тему
-   4. Введите описание
-   5. Прикрепите файл или пропустите
-   ✅ Инсайт сохранен!
-
-🔍 **Поиск и просмотр**
-   1. Выберите макрорегион
-   2. Выберите отрасль
-   3. Просмотрите найденные инсайты
-   4. Листайте результаты, скачивайте файлы
-
-📊 **Экспорт в Excel**
-   Выгрузите все сохраненные инсайты в один файл
-
-ℹ️ **О боте**
-   Получите подробную информацию о приложении
-"""
-    await message.answer(help_text)
-
-@router.message(Command("cancel"))
-async def cmd_cancel(message: Message, state: FSMContext):
-    """Отмена текущей операции"""
-    await state.clear()
-    await message.answer("❌ Операция отменена", reply_markup=await create_main_keyboard())
-
-# ==================== Информация о боте ====================
-
-@router.callback_query(F.data == "about_bot")
-async def about_bot(callback: CallbackQuery):
-    """Информация о боте"""
-    about_text = """
-ℹ️ **О Insights Bot**
-
-🎯 **Назначение:**
-Управление и анализ деловых инсайтов по макрорегионам и отраслям экономики.
-
-🔧 **Технология:**
-• Telegram Bot API (aiogram)
-• PostgreSQL база данных (Supabase)
-• Облачный хостинг (Render)
-• Python 3.11+
-
-📊 **Функциональность:**
-✅ Создание и сохранение инсайтов
-✅ Гибкая фильтрация по регионам и отраслям
-✅ Экспорт данных в Excel с форматированием
-✅ Прикрепление файлов и документов
-✅ 24/7 доступность
-
-🌍 **Поддерживаемые макрорегионы:**
-МСК, ЦФО, СЗФО, УФО, ЮФО, ПФО, СДФО, СНГ, РФ-целиком
-
-🏭 **Поддерживаемые отрасли:**
-Оборона, Промышленность, Торговля, Банки, Нефть и газ, Энергетика, Другое
-
-💾 **Безопасность:**
-Все данные хранятся в защищенной облачной БД с автоматическим резервным копированием.
-
-─────────────────────────────────────
-"""
-    
-    builder = InlineKeyboardBuilder()
-    builder.button(text="🔙 В меню", callback_data="back_to_main")
-    builder.adjust(1)
-    
-    await callback.message.edit_text(about_text, reply_markup=builder.as_markup())
-    await callback.answer()
-
-# ==================== Главное меню ====================
-
-@router.callback_query(F.data == "back_to_main")
-async def back_to_main(callback: CallbackQuery, state: FSMContext):
-    """Возврат в главное меню"""
-    await state.clear()
-    await callback.message.edit_text(
-        "📌 Главное меню:\n\nВыберите действие:",
-        reply_markup=await create_main_keyboard()
-    )
-    await callback.answer()
-
-# ==================== СОЗДАНИЕ НОВОЙ ЗАПИСИ ====================
-
-@router.callback_query(F.data == "new_insight")
-async def new_insight_start(callback: CallbackQuery, state: FSMContext):
-    """Начало создания нового инсайта - сначала выбираем регион"""
-    logger.info(f"User {callback.from_user.id} started creating new insight")
-    keyboard = await create_region_keyboard(for_search=False)
-    await callback.message.edit_text("🗺️ Выберите макрорегион:", reply_markup=keyboard)
-    await state.set_state(InsightForm.macro_region)
-    await callback.answer()
-
-@router.callback_query(InsightForm.macro_region, F.data.startswith("new_region_"))
-async def process_region(callback: CallbackQuery, state: FSMContext):
-    """Обработка выбора макрорегиона"""
-    region = callback.data.replace("new_region_", "")
-    await state.update_data(macro_region=region)
-    
-    keyboard = await create_industry_keyboard(macro_region=region, for_search=False)
-    await callback.message.edit_text("🏭 Выберите отрасль:", reply_markup=keyboard)
-    await state.set_state(InsightForm.industry)
-    await callback.answer()
-
-@router.callback_query(InsightForm.industry, F.data.startswith("new_industry_"))
-async def process_industry(callback: CallbackQuery, state: FSMContext):
-    """Обработка выбора отрасли"""
-    industry = callback.data.replace("new_industry_", "")
-    await state.update_data(industry=industry)
-    
-    await callback.message.edit_text("📝 Введите тему инсайта (максимум 255 символов):")
-    await state.set_state(InsightForm.theme)
-    await callback.answer()
-
-@router.message(InsightForm.theme)
-async def process_theme(message: Message, state: FSMContext):
-    """Обработка темы инсайта"""
-    if len(message.text) > 255:
-        await message.answer("❌ Тема слишком длинная (максимум 255 символов)")
-        return
-    
-    await state.update_data(theme=message.text)
-    await message.answer("📄 Введите подробное описание инсайта:")
-    await state.set_state(InsightForm.description)
-
-@router.message(InsightForm.description)
-async def process_description(message: Message, state: FSMContext):
-    """Обработка описания инсайта"""
-    await state.update_data(description=message.text)
-    
-    builder = InlineKeyboardBuilder()
-    builder.button(text="📎 Прикрепить файл", callback_data="attach_file")
-    builder.button(text="⏭️ Пропустить", callback_data="skip_file")
-    builder.adjust(1)
-    
-    await message.answer(
-        "📎 **Финальный шаг**\n\n"
-        "Хотите прикрепить файл к инсайту?\n"
-        "Вы можете отправить документ или фотографию.",
-        reply_markup=builder.as_markup()
-    )
-    await state.set_state(InsightForm.file_attachment)
-
-@router.callback_query(InsightForm.file_attachment, F.data == "attach_file")
-async def ready_for_file(callback: CallbackQuery):
-    """Подготовка к получению файла"""
-    await callback.message.edit_text(
-        "📤 Отправьте файл (документ или фото).\n"
-        "Используйте /cancel для отмены."
-    )
-    await callback.answer()
-
-@router.message(InsightForm.file_attachment, F.document)
-async def process_document(message: Message, state: FSMContext):
-    """Обработка прикрепленного документа"""
-    file_id = message.document.file_id
-    filename = message.document.file_name
-    
-    await state.update_data(file_id=file_id, filename=filename)
-    
-    data = await state.get_data()
-    try:
-        await save_insight_to_db(data, message.from_user.id)
-        logger.info(f"User {message.from_user.id} created insight with document: {data.get('theme')}")
-        
-        success_text = (
-            f"✅ **Инсайт успешно создан!**\n\n"
-            f"📝 Тема: {data['theme']}\n"
-            f"🗺️ Макрорегион: {data['macro_region']}\n"
-            f"🏭 Отрасль: {data['industry']}\n"
-            f"📎 Файл: {filename}"
-        )
-        
-        await message.answer(success_text, reply_markup=await create_main_keyboard())
-    except Exception as e:
-        logger.error(f"Error saving insight with document: {str(e)}", exc_info=True)
-        await message.answer(f"❌ Ошибка при сохранении инсайта: {str(e)}")
-    
-    await state.clear()
-
-@router.message(InsightForm.file_attachment, F.photo)
-async def process_photo(message: Message, state: FSMContext):
-    """Обработка прикрепленной фотографии"""
-    file_id = message.photo[-1].file_id
-    
-    await state.update_data(file_id=file_id, filename=None)
-    
-    data = await state.get_data()
-    try:
-        await save_insight_to_db(data, message.from_user.id)
-        logger.info(f"User {message.from_user.id} created insight with photo: {data.get('theme')}")
-        
-        success_text = (
-            f"✅ **Инсайт успешно создан!**\n\n"
-            f"📝 Тема: {data['theme']}\n"
-            f"🗺️ Макрорегион: {data['macro_region']}\n"
-            f"🏭 Отрасль: {data['industry']}\n"
-            f"📸 Фото прикреплено"
-        )
-        
-        await message.answer(success_text, reply_markup=await create_main_keyboard())
-    except Exception as e:
-        logger.error(f"Error saving insight with photo: {str(e)}", exc_info=True)
-        await message.answer(f"❌ Ошибка при сохранении инсайта: {str(e)}")
-    
-    await state.clear()
-
-@router.callback_query(InsightForm.file_attachment, F.data == "skip_file")
-async def skip_file(callback: CallbackQuery, state: FSMContext):
-    """Пропуск прикрепления файла"""
-    data = await state.get_data()
-    try:
-        if 'file_id' not in data:
-            data['file_id'] = None
-            data['filename'] = None
-        
-        logger.info(f"Saving insight for user {callback.from_user.id}: theme={data.get('theme')}, region={data.get('macro_region')}, industry={data.get('industry')}")
-        
-        await save_insight_to_db(data, callback.from_user.id)
-        logger.info(f"User {callback.from_user.id} created insight without file: {data.get('theme')}")
-        
-        success_text = (
-            f"✅ **Инсайт успешно создан!**\n\n"
-            f"📝 Тема: {data['theme']}\n"
-            f"🗺️ Макрорегион: {data['macro_region']}\n"
-            f"🏭 Отрасль: {data['industry']}"
-        )
-        
-        await callback.message.edit_text(success_text, reply_markup=await create_main_keyboard())
-    except Exception as e:
-        logger.error(f"Error saving insight without file: {str(e)}", exc_info=True)
-        await callback.message.edit_text(f"❌ Ошибка при сохранении инсайта:\n{str(e)}")
-    
-    await state.clear()
-    await callback.answer()
-
-# ==================== ПОИСК И ПРОСМОТР ====================
-
-@router.callback_query(F.data == "search_insights")
-async def search_start(callback: CallbackQuery, state: FSMContext):
-    """Начало поиска"""
-    logger.info(f"User {callback.from_user.id} started searching")
-    keyboard = await create_region_keyboard(for_search=True)
-    await callback.message.edit_text("🗺️ Выберите макрорегион для поиска:", 
-                                     reply_markup=keyboard)
-    await state.set_state(SearchForm.macro_region)
-    await callback.answer()
-
-@router.callback_query(SearchForm.macro_region, F.data.startswith("search_region_"))
-async def search_region_selected(callback: CallbackQuery, state: FSMContext):
-    """Выбор макрорегиона в поиске"""
-    region = callback.data.replace("search_region_", "")
-    logger.info(f"User {callback.from_user.id} selected region: {region}")
-    await state.update_data(macro_region=region)
-    
-    keyboard = await create_industry_keyboard(macro_region=region, for_search=True)
-    await callback.message.edit_text("🏭 Выберите отрасль:", reply_markup=keyboard)
-    await state.set_state(SearchForm.industry)
-    await callback.answer()
-
-@router.callback_query(SearchForm.industry, F.data.startswith("search_industry_"))
-async def search_industry_selected(callback: CallbackQuery, state: FSMContext):
-    """Выбор отрасли в поиске и вывод результатов"""
-    industry = callback.data.replace("search_industry_", "")
-    logger.info(f"User {callback.from_user.id} selected industry: {industry}")
-    await state.update_data(industry=industry)
-    
-    data = await state.get_data()
-    filters = {
-        "macro_region": data.get("macro_region"),
-        "industry": industry
-    }
-    
-    logger.info(f"🔍 User {callback.from_user.id} searching with filters: {filters}")
-    
-    try:
-        insights = await get_filtered_insights(filters)
-        logger.info(f"✅ Found {len(insights)} insights with filters {filters}")
-        
-        if not insights:
-            logger.warning(f"⚠️ No insights found for filters: {filters}")
-            await callback.message.edit_text(
-                f"😔 Записей не найдено\n\n"
-                f"🗺️ Регион: {filters['macro_region']}\n"
-                f"🏭 Отрасль: {filters['industry']}\n\n"
-                "Создайте первый инсайт!",
-                reply_markup=InlineKeyboardBuilder()
-                .button(text="⬅️ Назад", callback_data="back_to_main")
-                .as_markup()
-            )
-            await state.clear()
-            await callback.answer()
-            return
-        
-        await show_insight(callback.message, insights[0], insights, 0, state)
-        await state.update_data(insights=insights, current_index=0)
-        await state.set_state(SearchForm.viewing)
-        logger.info(f"Showing first insight to user {callback.from_user.id}")
-    except Exception as e:
-        logger.error(f"❌ Error searching insights: {str(e)}", exc_info=True)
-        await callback.message.edit_text(f"❌ Ошибка при поиске:\n{str(e)}")
-    
-    await callback.answer()
-
-async def show_insight(message, insight, insights_list, index, state):
-    """Показать один инсайт с навигацией"""
-    insight_text = (
-        f"📌 **Инсайт {index + 1} из {len(insights_list)}**\n\n"
-        f"📅 Дата: {insight['created_at'][:10]}\n"
-        f"📝 Тема: {insight['theme']}\n"
-        f"📄 Описание: {insight['description']}\n"
-        f"🗺️ Макрорегион: {insight['macro_region']}\n"
-        f"🏭 Отрасль: {insight['industry']}"
-    )
-    
-    builder = InlineKeyboardBuilder()
-    
-    if index > 0:
-        builder.button(text="⬅️ Пред.", callback_data="prev_insight")
-    
-    if index < len(insights_list) - 1:
-        builder.button(text="Сл. ➡️", callback_data="next_insight")
-    
-    if insight.get('file_id'):
-        builder.button(text="📎 Файл", callback_data="download_file")
-    
-    builder.button(text="🔍 К фильтрам", callback_data="back_to_search")
-    builder.button(text="🔙 Меню", callback_data="back_to_main")
-    builder.adjust(2)
-    
-    await message.edit_text(insight_text, reply_markup=builder.as_markup())
-
-@router.callback_query(SearchForm.viewing, F.data == "next_insight")
-async def next_insight(callback: CallbackQuery, state: FSMContext):
-    """Следующий инсайт"""
-    data = await state.get_data()
-    index = data.get("current_index", 0) + 1
-    insights = data.get("insights", [])
-    
-    if index < len(insights):
-        await state.update_data(current_index=index)
-        await show_insight(callback.message, insights[index], insights, index, state)
-    
-    await callback.answer()
-
-@router.callback_query(SearchForm.viewing, F.data == "prev_insight")
-async def prev_insight(callback: CallbackQuery, state: FSMContext):
-    """Предыдущий инсайт"""
-    data = await state.get_data()
-    index = max(0, data.get("current_index", 0) - 1)
-    insights = data.get("insights", [])
-    
-    await state.update_data(current_index=index)
-    await show_insight(callback.message, insights[index], insights, index, state)
-    
-    await callback.answer()
-
-@router.callback_query(SearchForm.viewing, F.data == "download_file")
-async def download_file(callback: CallbackQuery, state: FSMContext):
-    """Скачивание файла из инсайта"""
-    data = await state.get_data()
-    insights = data.get("insights", [])
-    current_index = data.get("current_index", 0)
-    insight = insights[current_index]
-    
-    if insight.get('file_id'):
-        try:
-            await bot.send_document(
-                callback.from_user.id,
-                insight['file_id'],
-                caption=f"📎 Файл из инсайта: {insight['theme']}"
-            )
-            logger.info(f"User {callback.from_user.id} downloaded file")
-        except Exception as e:
-            logger.error(f"Error downloading file: {e}", exc_info=True)
-            await callback.answer("❌ Ошибка при скачивании файла", show_alert=True)
-    
-    await callback.answer()
-
-@router.callback_query(SearchForm.viewing, F.data == "back_to_search")
-async def back_to_search(callback: CallbackQuery, state: FSMContext):
-    """Возврат к фильтрам поиска"""
-    data = await state.get_data()
-    region = data.get("macro_region")
-    industry = data.get("industry")
-
-    builder = InlineKeyboardBuilder()
-    builder.button(text="✏️ Изменить фильтры", callback_data="search_insights")
-    builder.button(text="🔙 В меню", callback_data="back_to_main")
-    builder.adjust(1)
-
-    await callback.message.edit_text(
-        f"🔍 **Текущие фильтры:**\n\n"
-        f"🗺️ Регион: {region}\n"
-        f"🏭 Отрасль: {industry}\n\n"
-        f"Хотите изменить фильтры?",
-        reply_markup=builder.as_markup()
-    )
-    await callback.answer()
-
-# ==================== ВОЗВРАТ НА МАКРО-РЕГИОН ====================
-
-@router.callback_query(F.data == "back_to_new_macro")
-async def back_to_new_macro(callback: CallbackQuery, state: FSMContext):
-    """Возврат к выбору макрорегиона при создании инсайта"""
-    data = await state.get_data()
-    
-    await state.set_state(InsightForm.macro_region)
-    
-    keyboard = await create_region_keyboard(for_search=False)
-    await callback.message.edit_text("🗺️ Выберите макрорегион:", reply_markup=keyboard)
-    await callback.answer()
-
-@router.callback_query(F.data == "back_to_search_macro")
-async def back_to_search_macro(callback: CallbackQuery, state: FSMContext):
-    """Возврат к выбору макрорегиона при поиске инсайта"""
-    data = await state.get_data()
-    
-    await state.set_state(SearchForm.macro_region)
-    
-    keyboard = await create_region_keyboard(for_search=True)
-    await callback.message.edit_text("🗺️ Выберите макрорегион для поиска:", reply_markup=keyboard)
-    await callback.answer()
-
-# ==================== ЭКСПОРТ В EXCEL ====================
-
-@router.callback_query(F.data == "export_excel")
-async def export_excel(callback: CallbackQuery):
-    """Экспорт всех инсайтов в Excel"""
-    logger.info(f"User {callback.from_user.id} requested export")
-    
-    try:
-        insights = await get_all_insights()
-        
-        if not insights:
-            await callback.answer("❌ Нет данных для экспорта", show_alert=True)
-            return
-        
-        filename = await export_insights_to_excel(insights, callback.from_user.id)
-        
-        file = FSInputFile(filename)
-        await callback.message.answer_document(
-            file,
-            caption=f"📊 Экспорт инсайтов ({len(insights)} записей)\n\n"
-                    f"Файл содержит все сохраненные данные с форматированием."
-        )
-        
-        logger.info(f"Export completed for user {callback.from_user.id}")
-        
-        if os.path.exists(filename):
-            os.remove(filename)
-    
-    except Exception as e:
-        logger.error(f"Export error for user {callback.from_user.id}: {e}", exc_info=True)
-        await callback.answer("❌ Ошибка при экспорте данных", show_alert=True)
-    
-    await callback.answer()
-
-# ==================== WEBHOOK SETUP ====================
-
-async def on_startup(bot: Bot, base_url: str):
-    """Установка webhook при запуске"""
-    await bot.set_webhook(f"{base_url}/webhook")
-    logger.info(f"Webhook set to {base_url}/webhook")
-
-async def on_shutdown(bot: Bot):
+dp.include_router(router)
+
+startup_report = StartupReport(_STARTED_AT)
+startup_report.mark("imports")
+
+MODES = ("webhook", "polling")
+
+# ==================== ЗАПУСК И ОСТАНОВКА ====================
+
+def create_bot() -> Bot:
+    """Bot с очередью исходящих запросов (лимиты Telegram, см. send_queue.py)"""
+    bot = Bot(token=BOT_TOKEN)
+    bot.session.middleware(SendQueue())
+    return bot
+
+_background_tasks = set()
+
+def _run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def warm_up():
+    """Фоновый прогрев после запуска: клиент хранилища, секции, openpyxl"""
+    report = StartupReport()
+    with report.phase("storage"):
+        await warm_up_database()
+    with report.phase("partitions"):
+        await ensure_insight_partitions()
+    with report.phase("openpyxl"):
+        await asyncio.to_thread(preload_excel)
+    report.log("Warm-up report")
+
+    await keep_connections_warm()
+
+async def on_startup(bot: Bot, mode: str, base_url: str = None, run_scheduler: bool = True):
+    """
+    Миграции и подключение транспорта при запуске
+
+    mode: webhook - установить webhook, polling - снять его,
+          worker - воркер cluster.py (webhook и миграции - во фронтовом процессе)
+    run_scheduler: запускать задачи по расписанию и зеркало вложений (в cluster.py - только в одном воркере)
+    """
+    if mode != "worker":
+        with startup_report.phase("init_database"):
+            await init_database()
+
+    if mode == "webhook":
+        with startup_report.phase("set_webhook"):
+            await bot.set_webhook(f"{base_url}/webhook")
+        logger.info(f"Webhook set to {base_url}/webhook")
+    elif mode == "polling":
+        # getUpdates не работает, пока у бота установлен webhook
+        with startup_report.phase("delete_webhook"):
+            await bot.delete_webhook()
+
+    startup_report.log()
+
+    # Остальное догружается, пока бот уже принимает обновления
+    _run_in_background(warm_up())
+    # Журнал изменений читает каждый процесс: у каждого свои кэши в памяти
+    _run_in_background(change_feed.watch())
+    if run_scheduler:
+        # Зеркало вложений - в одном процессе: блокировки и учет объема у него в памяти
+        _run_in_background(mirror_attachments(bot))
+        # Хеши для поиска повторов у старых записей - в одном процессе
+        _run_in_background(index_insights())
+        for job in scheduled_jobs(bot):
+            _run_in_background(job)
+
+async def on_shutdown(bot: Bot, mode: str):
     """Удаление webhook при остановке"""
-    await bot.delete_webhook()
-    logger.info("Webhook deleted")
+    for task in list(_background_tasks):
+        task.cancel()
+    charts.shutdown()
 
-# ==================== MAIN ====================
+    if mode == "webhook":
+        await bot.delete_webhook()
+        logger.info("Webhook deleted")
+
+    logger.info(f"Metrics: {metrics.snapshot()}")
+
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
+
+# ==================== WEBHOOK ====================
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """Метрики процесса (пул соединений к БД и т.д.)"""
+    return web.json_response(metrics.snapshot())
+
+async def create_app(mode: str = "webhook", run_scheduler: bool = True) -> web.Application:
+    """
+    Сборка aiohttp-приложения с webhook
+
+    Точка входа для gunicorn: main:create_app (см. Procfile).
+    cluster.py собирает то же приложение для воркеров с mode="worker".
+    """
+    bot = create_bot()
+
+    dp["mode"] = mode
+    dp["base_url"] = WEBHOOK_URL
+    dp["run_scheduler"] = run_scheduler
 
-def main():
-    """Запуск бота на webhook"""
-    dp.include_router(router)
-    
     app = web.Application()
-    
+
     webhook_requests_handler = SimpleRequestHandler(
         dispatcher=dp,
         bot=bot,
     )
-    
+
     webhook_requests_handler.register(app, path="/webhook")
-    
+    app.router.add_get("/metrics", metrics_handler)
+
     setup_application(app, dp, bot=bot)
-    
+    return app
+
+def run_webhook():
+    """Запуск бота на webhook"""
     logger.info(f"Starting bot on 0.0.0.0:{PORT}")
     logger.info(f"Webhook URL: {WEBHOOK_URL}/webhook")
-    web.run_app(app, host="0.0.0.0", port=PORT)
+    web.run_app(create_app(), host="0.0.0.0", port=PORT)
+
+# ==================== POLLING ====================
+
+async def run_polling():
+    """Запуск бота в режиме polling (параллельная обработка, см. polling.py)"""
+    logger.info("🤖 Запуск бота в режиме polling")
+
+    bot = create_bot()
+    dp["mode"] = "polling"
+
+    try:
+        await PollingRunner(dp, bot).run()
+    finally:
+        await bot.session.close()
+
+# ==================== MAIN ====================
+
+def main(argv=None):
+    """Запуск бота: транспорт из --mode или BOT_MODE (webhook | polling)"""
+    parser = argparse.ArgumentParser(description="Insights Bot")
+    parser.add_argument("--mode", choices=MODES, default=BOT_MODE,
+                        help="транспорт обновлений (по умолчанию BOT_MODE)")
+    args = parser.parse_args(argv)
+
+    if args.mode == "webhook":
+        run_webhook()
+        return
+
+    try:
+        asyncio.run(run_polling())
+    except KeyboardInterrupt:
+        logger.info("🛑 Бот остановлен")
 
 if __name__ == "__main__":
     main()
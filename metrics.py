@@ -0,0 +1,89 @@
+"""
+Метрики процесса в памяти
+
+Счетчики, значения и таймеры без внешних зависимостей. Снимок отдается
+в /metrics (webhook-режим) и пишется в лог при остановке.
+
+    metrics.increment("db.queries")
+    metrics.observe("db.pool_wait", 0.003)
+    with metrics.timed("export.build"):
+        ...
+"""
+
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+SAMPLES_PER_TIMER = 1024
+
+
+class Timer:
+    """Длительности операции: количество, среднее, максимум и перцентили по последним замерам"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=SAMPLES_PER_TIMER)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def snapshot(self) -> dict:
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000 if samples else 0.0
+
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 2),
+            "p50_ms": round(percentile(0.50), 2),
+            "p95_ms": round(percentile(0.95), 2),
+        }
+
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_timers = {}
+
+
+def increment(name: str, value: int = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, seconds: float):
+    with _lock:
+        if name not in _timers:
+            _timers[name] = Timer()
+        _timers[name].observe(seconds)
+
+
+@contextmanager
+def timed(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timers": {name: timer.snapshot() for name, timer in _timers.items()},
+        }
@@ -0,0 +1,138 @@
+-- Помесячное секционирование insights по created_at
+--
+-- Старая таблица переименовывается, данные переносятся в секционированную,
+-- id продолжает ту же последовательность. Строки вне созданных секций попадают
+-- в insights_default и переносятся в свою секцию при ее создании.
+
+ALTER TABLE insights RENAME TO insights_unpartitioned;
+ALTER INDEX IF EXISTS idx_macro_region RENAME TO idx_unpartitioned_macro_region;
+ALTER INDEX IF EXISTS idx_industry RENAME TO idx_unpartitioned_industry;
+ALTER INDEX IF EXISTS idx_user_id RENAME TO idx_unpartitioned_user_id;
+ALTER SEQUENCE insights_id_seq OWNED BY NONE;
+
+CREATE TABLE insights (
+    id INTEGER NOT NULL DEFAULT nextval('insights_id_seq'),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    theme VARCHAR(255) NOT NULL,
+    description TEXT NOT NULL,
+    macro_region VARCHAR(50) NOT NULL,
+    industry VARCHAR(100) NOT NULL,
+    file_id VARCHAR(255),
+    filename VARCHAR(255),
+    user_id BIGINT NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE insights_id_seq OWNED BY insights.id;
+
+CREATE TABLE insights_default PARTITION OF insights DEFAULT;
+
+CREATE INDEX idx_macro_region ON insights(macro_region);
+CREATE INDEX idx_industry ON insights(industry);
+CREATE INDEX idx_user_id ON insights(user_id);
+CREATE INDEX idx_created_at ON insights(created_at DESC);
+-- Поиск по макрорегиону и отрасли с сортировкой по дате
+CREATE INDEX idx_region_industry_created_at ON insights(macro_region, industry, created_at DESC);
+
+-- Создание секции за месяц (строки из insights_default переносятся в нее)
+CREATE OR REPLACE FUNCTION create_insights_partition(p_month DATE)
+RETURNS TEXT
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    start_date DATE := date_trunc('month', p_month)::date;
+    end_date DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::date;
+    partition_name TEXT := format('insights_%s', to_char(start_date, 'YYYY_MM'));
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM insights_default WHERE created_at >= start_date AND created_at < end_date) THEN
+        EXECUTE format('CREATE TABLE %I (LIKE insights INCLUDING DEFAULTS)', partition_name);
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM insights_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+            'INSERT INTO %I SELECT * FROM moved',
+            start_date, end_date, partition_name
+        );
+        EXECUTE format(
+            'ALTER TABLE insights ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+            partition_name, start_date, end_date
+        );
+    ELSE
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF insights FOR VALUES FROM (%L) TO (%L)',
+            partition_name, start_date, end_date
+        );
+    END IF;
+
+    RETURN partition_name;
+END;
+$$;
+
+-- Секции на текущий месяц и months_ahead месяцев вперед (вызывается ботом при запуске)
+CREATE OR REPLACE FUNCTION ensure_insights_partitions(months_ahead INTEGER DEFAULT 2)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    month_start DATE;
+    created INTEGER := 0;
+BEGIN
+    FOR month_start IN
+        SELECT generate_series(
+            date_trunc('month', now()),
+            date_trunc('month', now()) + make_interval(months => LEAST(GREATEST(months_ahead, 0), 12)),
+            INTERVAL '1 month'
+        )::date
+    LOOP
+        IF to_regclass(format('insights_%s', to_char(month_start, 'YYYY_MM'))) IS NULL THEN
+            PERFORM create_insights_partition(month_start);
+            created := created + 1;
+        END IF;
+    END LOOP;
+
+    RETURN created;
+END;
+$$;
+
+-- Удаление секции месяца после архивации (только для прямого подключения, см. archive.py)
+CREATE OR REPLACE FUNCTION drop_insights_partition(p_month DATE)
+RETURNS VOID
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    start_date DATE := date_trunc('month', p_month)::date;
+    end_date DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::date;
+    partition_name TEXT := format('insights_%s', to_char(start_date, 'YYYY_MM'));
+BEGIN
+    DELETE FROM insights_default WHERE created_at >= start_date AND created_at < end_date;
+
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        EXECUTE format('ALTER TABLE insights DETACH PARTITION %I', partition_name);
+        EXECUTE format('DROP TABLE %I', partition_name);
+    END IF;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION create_insights_partition(DATE) FROM PUBLIC;
+REVOKE ALL ON FUNCTION drop_insights_partition(DATE) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION ensure_insights_partitions(INTEGER) TO anon, authenticated;
+
+-- Секции для всех месяцев с данными и на два месяца вперед
+SELECT create_insights_partition(month_start::date)
+FROM generate_series(
+    date_trunc('month', COALESCE((SELECT min(created_at) FROM insights_unpartitioned), now())),
+    date_trunc('month', now()) + INTERVAL '2 months',
+    INTERVAL '1 month'
+) AS month_start;
+
+INSERT INTO insights (id, created_at, theme, description, macro_region, industry, file_id, filename, user_id)
+SELECT id, COALESCE(created_at, now()), theme, description, macro_region, industry, file_id, filename, user_id
+FROM insights_unpartitioned;
+
+DROP TABLE insights_unpartitioned;
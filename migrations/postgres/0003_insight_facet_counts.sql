@@ -0,0 +1,30 @@
+-- Количество инсайтов по значениям поля одним запросом (кнопки регионов и отраслей)
+
+CREATE OR REPLACE FUNCTION insight_facet_counts(
+    p_field TEXT,
+    p_macro_region TEXT DEFAULT NULL,
+    p_industry TEXT DEFAULT NULL,
+    p_user_id BIGINT DEFAULT NULL
+)
+RETURNS TABLE (value TEXT, total BIGINT)
+LANGUAGE plpgsql
+STABLE
+SET search_path = public
+AS $$
+BEGIN
+    IF p_field NOT IN ('macro_region', 'industry', 'user_id') THEN
+        RAISE EXCEPTION 'Unsupported facet field: %', p_field;
+    END IF;
+
+    RETURN QUERY EXECUTE format(
+        'SELECT %I::text, count(*) FROM insights '
+        'WHERE ($1 IS NULL OR macro_region = $1) '
+        'AND ($2 IS NULL OR industry = $2) '
+        'AND ($3 IS NULL OR user_id = $3) '
+        'GROUP BY 1',
+        p_field
+    ) USING p_macro_region, p_industry, p_user_id;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION insight_facet_counts(TEXT, TEXT, TEXT, BIGINT) TO anon, authenticated;
@@ -0,0 +1,138 @@
+-- Готовые агрегаты для /stats (см. stats.py)
+--
+-- Счетчики по дням x регион x отрасль и по авторам обновляются триггером
+-- при каждом изменении insights, поэтому статистика не читает саму таблицу.
+-- Архивированные месяцы (archive.py) в статистике остаются.
+
+CREATE TABLE IF NOT EXISTS insight_stats_daily (
+    day DATE NOT NULL,
+    macro_region VARCHAR(50) NOT NULL,
+    industry VARCHAR(100) NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, macro_region, industry)
+);
+
+CREATE TABLE IF NOT EXISTS insight_stats_users (
+    user_id BIGINT PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0,
+    last_at TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION insight_stats_apply(
+    p_day DATE, p_macro_region TEXT, p_industry TEXT, p_user_id BIGINT, p_delta INTEGER, p_at TIMESTAMP
+)
+RETURNS VOID
+LANGUAGE sql
+SET search_path = public
+AS $$
+    INSERT INTO insight_stats_daily AS s (day, macro_region, industry, total)
+    VALUES (p_day, p_macro_region, p_industry, p_delta)
+    ON CONFLICT (day, macro_region, industry) DO UPDATE SET total = s.total + EXCLUDED.total;
+
+    INSERT INTO insight_stats_users AS u (user_id, total, last_at)
+    VALUES (p_user_id, p_delta, p_at)
+    ON CONFLICT (user_id) DO UPDATE SET total = u.total + EXCLUDED.total,
+                                        last_at = GREATEST(u.last_at, EXCLUDED.last_at);
+$$;
+
+CREATE OR REPLACE FUNCTION insight_stats_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+BEGIN
+    -- Перенос строк между секциями и удаление архивированного месяца - не изменения данных
+    IF current_setting('insights.stats_paused', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM insight_stats_apply(OLD.created_at::date, OLD.macro_region, OLD.industry, OLD.user_id, -1, NULL);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM insight_stats_apply(NEW.created_at::date, NEW.macro_region, NEW.industry, NEW.user_id, 1, NEW.created_at);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS insight_stats ON insights;
+CREATE TRIGGER insight_stats
+AFTER INSERT OR DELETE OR UPDATE OF created_at, macro_region, industry, user_id ON insights
+FOR EACH ROW EXECUTE FUNCTION insight_stats_trigger();
+
+-- Секционирование (0002) с паузой счетчиков на время переноса строк
+CREATE OR REPLACE FUNCTION create_insights_partition(p_month DATE)
+RETURNS TEXT
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    start_date DATE := date_trunc('month', p_month)::date;
+    end_date DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::date;
+    partition_name TEXT := format('insights_%s', to_char(start_date, 'YYYY_MM'));
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM insights_default WHERE created_at >= start_date AND created_at < end_date) THEN
+        PERFORM set_config('insights.stats_paused', 'on', true);
+        EXECUTE format('CREATE TABLE %I (LIKE insights INCLUDING DEFAULTS)', partition_name);
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM insights_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+            'INSERT INTO %I SELECT * FROM moved',
+            start_date, end_date, partition_name
+        );
+        EXECUTE format(
+            'ALTER TABLE insights ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+            partition_name, start_date, end_date
+        );
+        PERFORM set_config('insights.stats_paused', 'off', true);
+    ELSE
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF insights FOR VALUES FROM (%L) TO (%L)',
+            partition_name, start_date, end_date
+        );
+    END IF;
+
+    RETURN partition_name;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION drop_insights_partition(p_month DATE)
+RETURNS VOID
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    start_date DATE := date_trunc('month', p_month)::date;
+    end_date DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::date;
+    partition_name TEXT := format('insights_%s', to_char(start_date, 'YYYY_MM'));
+BEGIN
+    PERFORM set_config('insights.stats_paused', 'on', true);
+    DELETE FROM insights_default WHERE created_at >= start_date AND created_at < end_date;
+    PERFORM set_config('insights.stats_paused', 'off', true);
+
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        EXECUTE format('ALTER TABLE insights DETACH PARTITION %I', partition_name);
+        EXECUTE format('DROP TABLE %I', partition_name);
+    END IF;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION insight_stats_apply(DATE, TEXT, TEXT, BIGINT, INTEGER, TIMESTAMP) FROM PUBLIC;
+GRANT SELECT ON insight_stats_daily, insight_stats_users TO anon, authenticated;
+
+-- Счетчики по уже сохраненным записям
+TRUNCATE insight_stats_daily, insight_stats_users;
+
+INSERT INTO insight_stats_daily (day, macro_region, industry, total)
+SELECT created_at::date, macro_region, industry, count(*)
+FROM insights
+GROUP BY 1, 2, 3;
+
+INSERT INTO insight_stats_users (user_id, total, last_at)
+SELECT user_id, count(*), max(created_at)
+FROM insights
+GROUP BY user_id;
@@ -0,0 +1,92 @@
+-- Журнал изменений insights (см. changes.py)
+--
+-- Каждая вставка, правка и удаление записывается триггером с растущим номером
+-- version. Бот читает журнал с последнего прочитанного номера и сбрасывает
+-- кэши, затронутые изменениями, в том числе сделанными в обход бота
+-- (Supabase Table Editor, SQL). Журнал только дополняется; старые события
+-- удаляет задача по расписанию (CHANGES_RETENTION_DAYS).
+--
+-- В строках - только поля, по которым кэши выбирают записи.
+-- op: I - вставка, U - правка, D - удаление, A - месяц перенесен в архив
+
+CREATE TABLE IF NOT EXISTS insight_changes (
+    version BIGSERIAL PRIMARY KEY,
+    op CHAR(1) NOT NULL,
+    insight_id BIGINT,
+    old_row JSONB,
+    new_row JSONB,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_insight_changes_changed_at ON insight_changes(changed_at);
+
+CREATE OR REPLACE FUNCTION insight_change_row(p_row insights)
+RETURNS JSONB
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT jsonb_build_object(
+        'id', p_row.id, 'created_at', p_row.created_at,
+        'macro_region', p_row.macro_region, 'industry', p_row.industry, 'user_id', p_row.user_id,
+        'file_id', p_row.file_id, 'file_unique_id', p_row.file_unique_id, 'file_hash', p_row.file_hash
+    );
+$$;
+
+CREATE OR REPLACE FUNCTION insight_changes_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+BEGIN
+    -- Перенос строк между секциями - не изменение данных (см. 0007)
+    IF current_setting('insights.stats_paused', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO insight_changes (op, insight_id, new_row) VALUES ('I', NEW.id, insight_change_row(NEW));
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO insight_changes (op, insight_id, old_row, new_row)
+        VALUES ('U', NEW.id, insight_change_row(OLD), insight_change_row(NEW));
+    ELSE
+        INSERT INTO insight_changes (op, insight_id, old_row) VALUES ('D', OLD.id, insight_change_row(OLD));
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Служебные поля вложения (file_type, file_size, file_hash - mirror.py, attachments.py)
+-- в выгрузки и поиск не попадают - их правка в журнал не пишется
+DROP TRIGGER IF EXISTS insight_changes ON insights;
+CREATE TRIGGER insight_changes
+AFTER INSERT OR DELETE OR UPDATE OF created_at, theme, description, macro_region, industry,
+                                    file_id, filename, user_id, file_unique_id ON insights
+FOR EACH ROW EXECUTE FUNCTION insight_changes_trigger();
+
+-- Архивация месяца (archive.py) удаляет секцию целиком, без построчных триггеров -
+-- вместо событий по записям пишется одно событие A
+CREATE OR REPLACE FUNCTION drop_insights_partition(p_month DATE)
+RETURNS VOID
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    start_date DATE := date_trunc('month', p_month)::date;
+    end_date DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::date;
+    partition_name TEXT := format('insights_%s', to_char(start_date, 'YYYY_MM'));
+BEGIN
+    PERFORM set_config('insights.stats_paused', 'on', true);
+    DELETE FROM insights_default WHERE created_at >= start_date AND created_at < end_date;
+    PERFORM set_config('insights.stats_paused', 'off', true);
+
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        EXECUTE format('ALTER TABLE insights DETACH PARTITION %I', partition_name);
+        EXECUTE format('DROP TABLE %I', partition_name);
+    END IF;
+
+    INSERT INTO insight_changes (op, old_row)
+    VALUES ('A', jsonb_build_object('date_from', start_date, 'date_to', end_date));
+END;
+$$;
+
+GRANT SELECT ON insight_changes TO anon, authenticated;
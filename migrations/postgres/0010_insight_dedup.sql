@@ -0,0 +1,62 @@
+-- Поиск повторов при сохранении (см. dedup.py)
+--
+-- content_hash - SHA-1 нормализованных темы и описания: точные повторы.
+-- insight_minhash - корзины LSH MinHash-подписи: кандидаты в почти-повторы
+-- того же региона и отрасли. Обе заполняет бот; записи без content_hash
+-- (старые и измененные в обход бота) он досчитывает в фоне.
+
+ALTER TABLE insights ADD COLUMN IF NOT EXISTS content_hash VARCHAR(40);
+
+CREATE INDEX IF NOT EXISTS idx_content_hash ON insights(macro_region, industry, content_hash)
+    WHERE content_hash IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_unindexed ON insights(id) WHERE content_hash IS NULL;
+
+CREATE TABLE IF NOT EXISTS insight_minhash (
+    macro_region VARCHAR(50) NOT NULL,
+    industry VARCHAR(100) NOT NULL,
+    bucket VARCHAR(24) NOT NULL,
+    insight_id BIGINT NOT NULL,
+    PRIMARY KEY (macro_region, industry, bucket, insight_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_insight_minhash_insight_id ON insight_minhash(insight_id);
+
+-- Измененный текст или раздел: прежние хеш и корзины недействительны,
+-- если сам запрос не записал новый хеш
+CREATE OR REPLACE FUNCTION insight_dedup_reset()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+BEGIN
+    IF NEW.content_hash IS NOT DISTINCT FROM OLD.content_hash
+       AND (NEW.theme, NEW.description, NEW.macro_region, NEW.industry)
+           IS DISTINCT FROM (OLD.theme, OLD.description, OLD.macro_region, OLD.industry) THEN
+        NEW.content_hash := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION insight_dedup_cleanup()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP = 'DELETE' OR NEW.content_hash IS DISTINCT FROM OLD.content_hash THEN
+        DELETE FROM insight_minhash WHERE insight_id = OLD.id;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS insight_dedup_reset ON insights;
+CREATE TRIGGER insight_dedup_reset
+BEFORE UPDATE OF theme, description, macro_region, industry ON insights
+FOR EACH ROW EXECUTE FUNCTION insight_dedup_reset();
+
+DROP TRIGGER IF EXISTS insight_dedup_cleanup ON insights;
+CREATE TRIGGER insight_dedup_cleanup
+AFTER DELETE OR UPDATE OF content_hash, theme, description, macro_region, industry ON insights
+FOR EACH ROW EXECUTE FUNCTION insight_dedup_cleanup();
@@ -0,0 +1,17 @@
+-- Базовая схема таблицы инсайтов для локальной SQLite базы
+
+CREATE TABLE IF NOT EXISTS insights (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    theme VARCHAR(255) NOT NULL,
+    description TEXT NOT NULL,
+    macro_region VARCHAR(50) NOT NULL,
+    industry VARCHAR(100) NOT NULL,
+    file_id VARCHAR(255),
+    filename VARCHAR(255),
+    user_id BIGINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_macro_region ON insights(macro_region);
+CREATE INDEX IF NOT EXISTS idx_industry ON insights(industry);
+CREATE INDEX IF NOT EXISTS idx_user_id ON insights(user_id);
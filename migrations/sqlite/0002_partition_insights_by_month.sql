@@ -0,0 +1,4 @@
+-- В SQLite секционирования нет: помесячные диапазоны обслуживаются индексами по created_at
+
+CREATE INDEX IF NOT EXISTS idx_created_at ON insights(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_region_industry_created_at ON insights(macro_region, industry, created_at DESC);
@@ -0,0 +1,10 @@
+-- Метаданные вложений: тип (способ отправки), размер и постоянный идентификатор файла
+
+ALTER TABLE insights ADD COLUMN file_type VARCHAR(20);
+ALTER TABLE insights ADD COLUMN file_size BIGINT;
+ALTER TABLE insights ADD COLUMN file_unique_id VARCHAR(255);
+
+-- Старые записи: фото сохранялись без имени файла, документы - с именем
+UPDATE insights
+SET file_type = CASE WHEN filename IS NULL THEN 'photo' ELSE 'document' END
+WHERE file_id IS NOT NULL AND file_type IS NULL;
@@ -0,0 +1,7 @@
+-- Локальная копия вложения: SHA-256 содержимого (имя файла в MIRROR_DIR, см. mirror.py)
+
+ALTER TABLE insights ADD COLUMN file_hash VARCHAR(64);
+
+-- Поиск уже скачанной копии того же файла и вложений без копии
+CREATE INDEX IF NOT EXISTS idx_file_unique_id ON insights(file_unique_id) WHERE file_unique_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_unmirrored ON insights(id) WHERE file_id IS NOT NULL AND file_hash IS NULL;
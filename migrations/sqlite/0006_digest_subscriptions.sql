@@ -0,0 +1,8 @@
+-- Подписки на еженедельный дайджест (команда /digest, см. scheduler.py)
+
+CREATE TABLE IF NOT EXISTS digest_subscriptions (
+    user_id BIGINT PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    macro_region VARCHAR(50),
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
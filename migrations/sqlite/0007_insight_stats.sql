@@ -0,0 +1,68 @@
+-- Готовые агрегаты для /stats (см. stats.py)
+--
+-- Счетчики по дням x регион x отрасль и по авторам обновляются триггерами
+-- при каждом изменении insights, поэтому статистика не читает саму таблицу.
+-- Архивированные месяцы (archive.py) в статистике остаются.
+
+CREATE TABLE IF NOT EXISTS insight_stats_daily (
+    day TEXT NOT NULL,
+    macro_region VARCHAR(50) NOT NULL,
+    industry VARCHAR(100) NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, macro_region, industry)
+);
+
+CREATE TABLE IF NOT EXISTS insight_stats_users (
+    user_id BIGINT PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0,
+    last_at TEXT
+);
+
+CREATE TRIGGER IF NOT EXISTS insight_stats_insert AFTER INSERT ON insights
+BEGIN
+    INSERT INTO insight_stats_daily (day, macro_region, industry, total)
+    VALUES (substr(NEW.created_at, 1, 10), NEW.macro_region, NEW.industry, 1)
+    ON CONFLICT (day, macro_region, industry) DO UPDATE SET total = total + 1;
+
+    INSERT INTO insight_stats_users (user_id, total, last_at)
+    VALUES (NEW.user_id, 1, NEW.created_at)
+    ON CONFLICT (user_id) DO UPDATE SET total = total + 1, last_at = max(coalesce(last_at, ''), excluded.last_at);
+END;
+
+CREATE TRIGGER IF NOT EXISTS insight_stats_delete AFTER DELETE ON insights
+BEGIN
+    UPDATE insight_stats_daily SET total = total - 1
+    WHERE day = substr(OLD.created_at, 1, 10) AND macro_region = OLD.macro_region AND industry = OLD.industry;
+
+    UPDATE insight_stats_users SET total = total - 1 WHERE user_id = OLD.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS insight_stats_update AFTER UPDATE OF created_at, macro_region, industry, user_id ON insights
+BEGIN
+    UPDATE insight_stats_daily SET total = total - 1
+    WHERE day = substr(OLD.created_at, 1, 10) AND macro_region = OLD.macro_region AND industry = OLD.industry;
+
+    INSERT INTO insight_stats_daily (day, macro_region, industry, total)
+    VALUES (substr(NEW.created_at, 1, 10), NEW.macro_region, NEW.industry, 1)
+    ON CONFLICT (day, macro_region, industry) DO UPDATE SET total = total + 1;
+
+    UPDATE insight_stats_users SET total = total - 1 WHERE user_id = OLD.user_id;
+
+    INSERT INTO insight_stats_users (user_id, total, last_at)
+    VALUES (NEW.user_id, 1, NEW.created_at)
+    ON CONFLICT (user_id) DO UPDATE SET total = total + 1, last_at = max(coalesce(last_at, ''), excluded.last_at);
+END;
+
+-- Счетчики по уже сохраненным записям
+DELETE FROM insight_stats_daily;
+DELETE FROM insight_stats_users;
+
+INSERT INTO insight_stats_daily (day, macro_region, industry, total)
+SELECT substr(created_at, 1, 10), macro_region, industry, count(*)
+FROM insights
+GROUP BY 1, 2, 3;
+
+INSERT INTO insight_stats_users (user_id, total, last_at)
+SELECT user_id, count(*), max(created_at)
+FROM insights
+GROUP BY user_id;
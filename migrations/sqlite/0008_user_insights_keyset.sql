@@ -0,0 +1,6 @@
+-- "Мои инсайты": записи автора страницами по (created_at, id), новые сначала
+-- (keyset-пагинация). Составной индекс заменяет idx_user_id - его префикс
+-- обслуживает и прежние выборки по user_id
+
+CREATE INDEX IF NOT EXISTS idx_user_created_at ON insights(user_id, created_at DESC, id DESC);
+DROP INDEX IF EXISTS idx_user_id;
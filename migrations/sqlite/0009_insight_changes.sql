@@ -0,0 +1,57 @@
+-- Журнал изменений insights (см. changes.py)
+--
+-- Каждая вставка, правка и удаление записывается триггером с растущим номером
+-- version. Бот читает журнал с последнего прочитанного номера и сбрасывает
+-- кэши, затронутые изменениями, в том числе сделанными в обход бота.
+-- Журнал только дополняется; старые события удаляет задача по расписанию.
+--
+-- В строках (JSON) - только поля, по которым кэши выбирают записи.
+-- op: I - вставка, U - правка, D - удаление (и архивация месяца, archive.py)
+
+CREATE TABLE IF NOT EXISTS insight_changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    insight_id INTEGER,
+    old_row TEXT,
+    new_row TEXT,
+    changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_insight_changes_changed_at ON insight_changes(changed_at);
+
+CREATE TRIGGER IF NOT EXISTS insight_changes_insert AFTER INSERT ON insights
+BEGIN
+    INSERT INTO insight_changes (op, insight_id, new_row)
+    VALUES ('I', NEW.id, json_object(
+        'id', NEW.id, 'created_at', NEW.created_at,
+        'macro_region', NEW.macro_region, 'industry', NEW.industry, 'user_id', NEW.user_id,
+        'file_id', NEW.file_id, 'file_unique_id', NEW.file_unique_id, 'file_hash', NEW.file_hash
+    ));
+END;
+
+-- Служебные поля вложения (file_type, file_size, file_hash) в журнал не пишутся
+CREATE TRIGGER IF NOT EXISTS insight_changes_update
+AFTER UPDATE OF created_at, theme, description, macro_region, industry,
+                file_id, filename, user_id, file_unique_id ON insights
+BEGIN
+    INSERT INTO insight_changes (op, insight_id, old_row, new_row)
+    VALUES ('U', NEW.id, json_object(
+        'id', OLD.id, 'created_at', OLD.created_at,
+        'macro_region', OLD.macro_region, 'industry', OLD.industry, 'user_id', OLD.user_id,
+        'file_id', OLD.file_id, 'file_unique_id', OLD.file_unique_id, 'file_hash', OLD.file_hash
+    ), json_object(
+        'id', NEW.id, 'created_at', NEW.created_at,
+        'macro_region', NEW.macro_region, 'industry', NEW.industry, 'user_id', NEW.user_id,
+        'file_id', NEW.file_id, 'file_unique_id', NEW.file_unique_id, 'file_hash', NEW.file_hash
+    ));
+END;
+
+CREATE TRIGGER IF NOT EXISTS insight_changes_delete AFTER DELETE ON insights
+BEGIN
+    INSERT INTO insight_changes (op, insight_id, old_row)
+    VALUES ('D', OLD.id, json_object(
+        'id', OLD.id, 'created_at', OLD.created_at,
+        'macro_region', OLD.macro_region, 'industry', OLD.industry, 'user_id', OLD.user_id,
+        'file_id', OLD.file_id, 'file_unique_id', OLD.file_unique_id, 'file_hash', OLD.file_hash
+    ));
+END;
@@ -0,0 +1,45 @@
+-- Поиск повторов при сохранении (см. dedup.py)
+--
+-- content_hash - SHA-1 нормализованных темы и описания: точные повторы.
+-- insight_minhash - корзины LSH MinHash-подписи: кандидаты в почти-повторы
+-- того же региона и отрасли. Обе заполняет бот; записи без content_hash
+-- (старые и измененные в обход бота) он досчитывает в фоне.
+
+ALTER TABLE insights ADD COLUMN content_hash VARCHAR(40);
+
+CREATE INDEX IF NOT EXISTS idx_content_hash ON insights(macro_region, industry, content_hash)
+    WHERE content_hash IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_unindexed ON insights(id) WHERE content_hash IS NULL;
+
+CREATE TABLE IF NOT EXISTS insight_minhash (
+    macro_region VARCHAR(50) NOT NULL,
+    industry VARCHAR(100) NOT NULL,
+    bucket VARCHAR(24) NOT NULL,
+    insight_id INTEGER NOT NULL,
+    PRIMARY KEY (macro_region, industry, bucket, insight_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_insight_minhash_insight_id ON insight_minhash(insight_id);
+
+-- Измененный текст или раздел: прежние хеш и корзины недействительны,
+-- если сам запрос не записал новый хеш
+CREATE TRIGGER IF NOT EXISTS insight_dedup_update
+AFTER UPDATE OF theme, description, macro_region, industry ON insights
+WHEN NEW.content_hash IS OLD.content_hash
+     AND (NEW.theme IS NOT OLD.theme OR NEW.description IS NOT OLD.description
+          OR NEW.macro_region IS NOT OLD.macro_region OR NEW.industry IS NOT OLD.industry)
+BEGIN
+    UPDATE insights SET content_hash = NULL WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS insight_dedup_rehash
+AFTER UPDATE OF content_hash ON insights
+WHEN NEW.content_hash IS NOT OLD.content_hash
+BEGIN
+    DELETE FROM insight_minhash WHERE insight_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS insight_dedup_delete AFTER DELETE ON insights
+BEGIN
+    DELETE FROM insight_minhash WHERE insight_id = OLD.id;
+END;
@@ -0,0 +1,237 @@
+"""
+Локальная копия вложений
+
+Вложения хранятся в Telegram как file_id; для экспорта с файлами и бэкапов
+их каждый раз пришлось бы скачивать заново. Здесь каждое вложение скачивается
+один раз в MIRROR_DIR под именем SHA-256 содержимого (один и тот же файл в
+разных инсайтах хранится один раз), а хеш записывается в insights.file_hash.
+
+- ensure_local(bot, insight) - путь к локальной копии, при необходимости скачивает;
+- mirror_attachments(bot) - фоновый проход по вложениям без копии (MIRROR_ENABLED);
+- общий объем ограничен MIRROR_MAX_BYTES: при превышении удаляются файлы,
+  к которым дольше всего не обращались (копия скачается снова при следующем запросе).
+
+Файлы больше MAX_FILE_SIZE (и больше лимита скачивания Bot API) не копируются.
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+import tempfile
+
+from config import MAX_FILE_SIZE, MIRROR_ENABLED, MIRROR_DIR, MIRROR_MAX_BYTES, MIRROR_INTERVAL
+from database import get_insights_page, update_insight
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bot API отдает через getFile только файлы до 20 МБ
+TELEGRAM_DOWNLOAD_LIMIT = 20 * 1024 * 1024
+MAX_MIRRORED_FILE_SIZE = min(MAX_FILE_SIZE, TELEGRAM_DOWNLOAD_LIMIT)
+
+MIRROR_BATCH_SIZE = 50
+
+_locks = {}
+_total_bytes = None
+
+
+def local_path(file_hash: str) -> str:
+    """Путь к копии по хешу: MIRROR_DIR/ab/abcdef..."""
+    return os.path.join(MIRROR_DIR, file_hash[:2], file_hash)
+
+
+def cached_path(insight: dict):
+    """Путь к существующей копии вложения или None"""
+    file_hash = insight.get('file_hash')
+    if not file_hash:
+        return None
+
+    path = local_path(file_hash)
+    try:
+        # Время доступа для вытеснения давно не использованных файлов
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    metrics.increment("mirror.hits")
+    return path
+
+
+class _HashingWriter:
+    """Файл, который по ходу записи считает SHA-256 и размер"""
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        return self.file.write(chunk)
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+
+def _store_size() -> int:
+    global _total_bytes
+    if _total_bytes is None:
+        _total_bytes = sum(size for _, _, size in _stored_files())
+    return _total_bytes
+
+
+def _stored_files() -> list:
+    """(время доступа, путь, размер) для всех копий"""
+    files = []
+    for root, _, names in os.walk(MIRROR_DIR):
+        for name in names:
+            if name.endswith('.part'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, path, stat.st_size))
+    return files
+
+
+def _evict(keep: str = None):
+    """Удаление давно не использованных копий, пока объем больше MIRROR_MAX_BYTES"""
+    global _total_bytes
+    if _store_size() <= MIRROR_MAX_BYTES:
+        return
+
+    for _, path, size in sorted(_stored_files()):
+        if _total_bytes <= MIRROR_MAX_BYTES:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        _total_bytes -= size
+        metrics.increment("mirror.evictions")
+
+    metrics.set_gauge("mirror.bytes", _total_bytes)
+
+
+def _commit(tmp_path: str, file_hash: str, size: int) -> str:
+    """Перенос скачанного файла в хранилище (или удаление, если такой уже есть)"""
+    global _total_bytes
+    path = local_path(file_hash)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        os.utime(path)
+        metrics.increment("mirror.deduplicated")
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _store_size()
+    os.replace(tmp_path, path)
+    _total_bytes += size
+    metrics.set_gauge("mirror.bytes", _total_bytes)
+    _evict(keep=path)
+    return path
+
+
+async def _download(bot, file_id: str) -> tuple:
+    """Скачивание файла во временный файл внутри MIRROR_DIR: (путь, хеш, размер)"""
+    os.makedirs(MIRROR_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=MIRROR_DIR, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            writer = _HashingWriter(file)
+            telegram_file = await bot.get_file(file_id)
+            with metrics.timed("mirror.download"):
+                await bot.download_file(telegram_file.file_path, destination=writer, timeout=120)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, writer.sha256.hexdigest(), writer.size
+
+
+async def _known_hash(insight: dict):
+    """Хеш копии того же файла (по file_unique_id) из другого инсайта"""
+    if not insight.get('file_unique_id'):
+        return None
+    for other in await get_insights_page({"file_unique_id": insight['file_unique_id']}, 10):
+        if other.get('file_hash') and os.path.exists(local_path(other['file_hash'])):
+            return other['file_hash']
+    return None
+
+
+async def ensure_local(bot, insight: dict):
+    """
+    Путь к локальной копии вложения инсайта; при отсутствии - скачивает
+
+    Returns:
+        путь или None (нет вложения, файл слишком большой или недоступен)
+    """
+    if not insight.get('file_id'):
+        return None
+
+    path = cached_path(insight)
+    if path:
+        return path
+
+    size = insight.get('file_size')
+    if size and size > MAX_MIRRORED_FILE_SIZE:
+        logger.info(f"Attachment of insight {insight['id']} is too large to mirror ({size} bytes)")
+        return None
+
+    key = insight.get('file_unique_id') or insight['file_id']
+    lock = _locks.setdefault(key, asyncio.Lock())
+    try:
+        async with lock:
+            file_hash = await _known_hash(insight)
+            if file_hash:
+                os.utime(local_path(file_hash))
+                metrics.increment("mirror.deduplicated")
+            else:
+                tmp_path, file_hash, size = await _download(bot, insight['file_id'])
+                await asyncio.to_thread(_commit, tmp_path, file_hash, size)
+                metrics.increment("mirror.downloads")
+                logger.info(f"Mirrored attachment of insight {insight['id']} ({size} bytes)")
+    except Exception as e:
+        logger.warning(f"Can not mirror attachment of insight {insight['id']}: {e}")
+        metrics.increment("mirror.errors")
+        return None
+    finally:
+        if not lock.locked():
+            _locks.pop(key, None)
+
+    if insight.get('file_hash') != file_hash and await update_insight(insight['id'], {'file_hash': file_hash}):
+        insight['file_hash'] = file_hash
+    return local_path(file_hash)
+
+
+async def mirror_attachments(bot, interval: float = MIRROR_INTERVAL):
+    """Фоновое копирование вложений, у которых еще нет локальной копии"""
+    if not MIRROR_ENABLED:
+        return
+
+    while True:
+        copied = 0
+        # Скопированные выпадают из выборки, а пропущенные (слишком большие,
+        # недоступные) остаются в ней - их обходим смещением
+        offset = 0
+        seen = set()
+        while True:
+            batch = await get_insights_page({"unmirrored": True}, MIRROR_BATCH_SIZE, offset)
+            batch = [insight for insight in batch if insight['id'] not in seen]
+            if not batch:
+                break
+            for insight in batch:
+                seen.add(insight['id'])
+                await ensure_local(bot, insight)
+                if insight.get('file_hash'):
+                    copied += 1
+                else:
+                    offset += 1
+
+        if copied:
+            logger.info(f"Mirrored {copied} attachment(s)")
+        await asyncio.sleep(interval)
@@ -0,0 +1,246 @@
+"""
+Polling с параллельной обработкой обновлений
+
+Свой цикл getUpdates вместо dp.start_polling():
+- long-poll с настраиваемыми timeout/limit и allowed_updates (POLLING_* в config.py);
+- обновления обрабатываются параллельно, не больше POLLING_CONCURRENCY сразу:
+  когда все слоты заняты, следующий getUpdates не запрашивается;
+- обновления одного чата обрабатываются строго по очереди (FSM не гоняется сам с собой);
+- по SIGTERM/SIGINT новые обновления не запрашиваются, начатые дорабатывают
+  до POLLING_DRAIN_TIMEOUT секунд, и Telegram подтверждаются только завершенные.
+
+Подтверждение у Telegram - одно смещение: все до него. Если обработчик не
+успел, смещение останавливается на нем, и завершенные после него обновления
+придут снова. Их номера сохраняются в POLLING_STATE_PATH, и после запуска
+они пропускаются, а не обрабатываются второй раз.
+"""
+
+import os
+import json
+import signal
+import asyncio
+import logging
+import time
+from contextlib import suppress
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiogram.utils.backoff import Backoff, BackoffConfig
+
+from config import (
+    POLLING_TIMEOUT,
+    POLLING_LIMIT,
+    POLLING_ALLOWED_UPDATES,
+    POLLING_CONCURRENCY,
+    POLLING_DRAIN_TIMEOUT,
+    POLLING_STATE_PATH,
+)
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_CONFIG = BackoffConfig(min_delay=1.0, max_delay=5.0, factor=1.3, jitter=0.1)
+
+
+def chat_key(update: Update) -> int:
+    """chat_id обновления (или id пользователя, если чата нет)"""
+    if update.message:
+        return update.message.chat.id
+    if update.callback_query:
+        if update.callback_query.message:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    if update.inline_query:
+        return update.inline_query.from_user.id
+    return update.update_id
+
+
+class PollingRunner:
+    """Цикл getUpdates с ограниченным пулом обработчиков и очередью по чатам"""
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        timeout: int = POLLING_TIMEOUT,
+        limit: int = POLLING_LIMIT,
+        allowed_updates: list = POLLING_ALLOWED_UPDATES,
+        concurrency: int = POLLING_CONCURRENCY,
+        drain_timeout: float = POLLING_DRAIN_TIMEOUT,
+        state_path: str = POLLING_STATE_PATH,
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.timeout = timeout
+        self.limit = limit
+        self.allowed_updates = list(allowed_updates)
+        self.drain_timeout = drain_timeout
+        self.state_path = state_path
+
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._chat_locks = {}
+        self._tasks = {}
+        self._completed = set()  # завершенные номера выше самого раннего незавершенного
+        self._skip = set()       # обработанные до перезапуска (_load_state)
+        self._offset = None
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """Остановка: перестать запрашивать обновления и дождаться начатых"""
+        self._stopping.set()
+
+    async def _handle(self, update: Update, workflow_data: dict):
+        key = chat_key(update)
+        lock = self._chat_locks.setdefault(key, [asyncio.Lock(), 0])
+        lock[1] += 1
+        try:
+            async with lock[0]:
+                with metrics.timed("polling.handle"):
+                    await self.dp.feed_update(self.bot, update, **workflow_data)
+        except Exception as e:
+            logger.exception(f"Error handling update {update.update_id}: {e}")
+            metrics.increment("polling.errors")
+        finally:
+            lock[1] -= 1
+            if not lock[1]:
+                del self._chat_locks[key]
+            self._slots.release()
+
+    def _on_done(self, task: asyncio.Task):
+        update_id = self._tasks.pop(task, None)
+        if not task.cancelled():
+            self._completed.add(update_id)
+
+        if not self._tasks:
+            self._completed.clear()
+        elif len(self._completed) > self.limit:
+            earliest = min(self._tasks.values())
+            self._completed = {done for done in self._completed if done > earliest}
+        metrics.set_gauge("polling.in_flight", len(self._tasks))
+
+    def _load_state(self):
+        """Номера, обработанные прошлым запуском после неподтвержденного обновления"""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                self._skip = set(json.load(f)['completed'])
+            os.remove(self.state_path)
+            logger.info(f"Skipping {len(self._skip)} update(s) already handled before restart")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Polling state {self.state_path} is not readable: {e}")
+
+    def _save_state(self, offset: int, completed: list):
+        if not self.state_path or not completed:
+            return
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'offset': offset, 'completed': completed}, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Polling state {self.state_path} is not writable: {e}")
+
+    async def _get_updates(self) -> list:
+        """Один long-poll запрос; прерывается при остановке"""
+        request = asyncio.ensure_future(self.bot.get_updates(
+            offset=self._offset,
+            limit=self.limit,
+            timeout=self.timeout,
+            allowed_updates=self.allowed_updates,
+            request_timeout=self.timeout + 10,
+        ))
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        try:
+            await asyncio.wait((request, stopping), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stopping.cancel()
+
+        if not request.done():
+            # Необработанные обновления не подтверждены и придут при следующем запуске
+            request.cancel()
+            with suppress(asyncio.CancelledError):
+                await request
+            return []
+        return request.result()
+
+    async def _poll(self, workflow_data: dict):
+        backoff = Backoff(BACKOFF_CONFIG)
+
+        while not self._stopping.is_set():
+            try:
+                started = time.perf_counter()
+                updates = await self._get_updates()
+                metrics.observe("polling.get_updates", time.perf_counter() - started)
+                backoff.reset()
+            except Exception as e:
+                logger.error(f"getUpdates failed: {e}, retrying in {backoff.next_delay:.1f}s")
+                metrics.increment("polling.get_updates_errors")
+                await backoff.asleep()
+                continue
+
+            for update in updates:
+                if update.update_id in self._skip:
+                    # Обработано до перезапуска, но смещение осталось ниже (см. _drain)
+                    self._skip.discard(update.update_id)
+                    self._offset = update.update_id + 1
+                    metrics.increment("polling.skipped")
+                    continue
+
+                # Ждем свободный слот: при перегрузке новые обновления копятся у Telegram
+                await self._slots.acquire()
+                task = asyncio.create_task(self._handle(update, workflow_data))
+                self._tasks[task] = update.update_id
+                task.add_done_callback(self._on_done)
+                self._offset = update.update_id + 1
+                metrics.increment("polling.updates")
+
+            metrics.set_gauge("polling.in_flight", len(self._tasks))
+
+    async def _drain(self):
+        """Ожидание начатых обработчиков, затем подтверждение завершенных обновлений"""
+        if self._tasks:
+            logger.info(f"Waiting for {len(self._tasks)} update(s) to finish")
+            done, pending = await asyncio.wait(list(self._tasks), timeout=self.drain_timeout)
+            if pending:
+                logger.warning(f"Cancelling {len(pending)} update(s) after {self.drain_timeout}s")
+                # Незавершенные не подтверждаем - Telegram пришлет их снова
+                offset = min(self._tasks[task] for task in pending if task in self._tasks)
+                # Завершенные после offset придут снова - при запуске они будут пропущены
+                self._save_state(offset, sorted(done for done in self._completed if done > offset))
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                self._offset = offset
+
+        if self._offset is not None:
+            with suppress(Exception):
+                await self.bot.get_updates(offset=self._offset, limit=1, timeout=0)
+
+    def _install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            # Windows: обработчики сигналов в цикле событий не поддерживаются
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(sig, self.stop)
+
+    async def run(self, **kwargs):
+        """Запуск: startup-хуки, цикл getUpdates до остановки, дренаж, shutdown-хуки"""
+        self._install_signal_handlers()
+
+        workflow_data = {"dispatcher": self.dp, "bots": [self.bot], **self.dp.workflow_data, **kwargs}
+        workflow_data.pop("bot", None)
+
+        self._load_state()
+        await self.dp.emit_startup(bot=self.bot, **workflow_data)
+        user = await self.bot.me()
+        logger.info(
+            f"Polling @{user.username}: timeout={self.timeout}s, limit={self.limit}, "
+            f"allowed_updates={self.allowed_updates}"
+        )
+        try:
+            await self._poll(workflow_data)
+        finally:
+            await self._drain()
+            logger.info("Polling stopped")
+            await self.dp.emit_shutdown(bot=self.bot, **workflow_data)
@@ -0,0 +1,77 @@
+"""
+Кэш заранее подготовленных экранов просмотра инсайтов
+
+После показа инсайта i обработчик в фоне загружает соседей i-1 и i+1 одним
+запросом и готовит для них текст и клавиатуру. Следующее нажатие
+"⬅️ Пред." / "Сл. ➡️" берет экран отсюда и сводится к одной правке сообщения.
+
+Окно хранится на сессию просмотра - сообщение (chat_id, message_id) - и
+действительно только для того же поиска (фильтры и число результатов).
+Изменение или удаление записи сбрасывает окна поисков, где она могла быть.
+"""
+
+import time
+from collections import OrderedDict
+
+from config import RENDER_CACHE_SESSIONS, RENDER_CACHE_SECONDS
+from storage import matches_filters
+import metrics
+
+
+def search_signature(filters: dict, total: int) -> tuple:
+    return tuple(sorted(filters.items())), total
+
+
+class RenderCache:
+    """Окно подготовленных экранов на каждую сессию просмотра (LRU по сессиям)"""
+
+    def __init__(self, max_sessions: int = RENDER_CACHE_SESSIONS, ttl: float = RENDER_CACHE_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+
+    def get(self, session, signature: tuple, index: int):
+        """Экран записи index или None"""
+        window = self._sessions.get(session)
+        if (
+            window is None
+            or window["signature"] != signature
+            or time.monotonic() - window["created"] > self.ttl
+            or index not in window["screens"]
+        ):
+            metrics.increment("render_cache.misses")
+            return None
+
+        self._sessions.move_to_end(session)
+        metrics.increment("render_cache.hits")
+        return window["screens"][index]
+
+    def put(self, session, signature: tuple, screens: dict):
+        """Заменить окно сессии экранами {index: экран}"""
+        self._sessions[session] = {
+            "signature": signature,
+            "created": time.monotonic(),
+            "screens": screens,
+        }
+        self._sessions.move_to_end(session)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def discard(self, session):
+        self._sessions.pop(session, None)
+
+    def invalidate(self, insights: list = None) -> int:
+        """Сброс окон поисков, в результаты которых могли попасть записи (None - всех)"""
+        if insights is None:
+            removed = len(self._sessions)
+            self._sessions.clear()
+            return removed
+
+        stale = [session for session, window in self._sessions.items()
+                 if any(matches_filters(dict(window["signature"][0]), insight) for insight in insights)]
+        for session in stale:
+            del self._sessions[session]
+        return len(stale)
+
+
+render_cache = RenderCache()
@@ -0,0 +1,85 @@
+"""
+Фоновые задачи по расписанию
+
+Без внешних зависимостей: каждая задача - корутина, которая спит до своего
+времени (ежедневно или раз в неделю, локальное время сервера) и выполняет
+работу. Запускаются в on_startup (main.py) вместе с остальными фоновыми
+задачами и отменяются при остановке.
+
+    EXPORT_PREPARE_AT - готовые выгрузки в кэш (export_cache.prepare_exports)
+    DIGEST_AT, DIGEST_WEEKDAY - дайджест подписчикам /digest (DIGEST_ENABLED)
+    EXPORT_PREPARE_AT - удаление событий журнала изменений старше CHANGES_RETENTION_DAYS
+
+В cluster.py задачи выполняет только воркер 0.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from config import (
+    SCHEDULER_ENABLED,
+    EXPORT_PREPARE_AT,
+    DIGEST_ENABLED,
+    DIGEST_WEEKDAY,
+    DIGEST_AT,
+    CHANGES_RETENTION_DAYS,
+)
+from database import prune_changes
+from export_cache import prepare_exports
+from digest import send_digests
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Пауза после выполнения, чтобы задача не запустилась дважды в ту же минуту
+MIN_PAUSE_SECONDS = 60
+
+
+def parse_time(value: str) -> tuple:
+    """'04:30' -> (4, 30)"""
+    hour, minute = value.split(':')
+    return int(hour), int(minute)
+
+
+def seconds_until(at: str, weekday: int = None, now: datetime = None) -> float:
+    """Секунд до ближайшего at (ЧЧ:ММ), с weekday - в этот день недели (0 - понедельник)"""
+    now = now or datetime.now()
+    hour, minute = parse_time(at)
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if weekday is not None:
+        target += timedelta(days=(weekday - now.weekday()) % 7)
+    if target <= now:
+        target += timedelta(days=7 if weekday is not None else 1)
+    return (target - now).total_seconds()
+
+
+async def run_at(name: str, at: str, job, *args, weekday: int = None):
+    """Выполнение job(*args) по расписанию; ошибка одного запуска не останавливает следующие"""
+    while True:
+        delay = seconds_until(at, weekday)
+        logger.info(f"Scheduled job {name}: next run in {delay / 3600:.1f} h")
+        await asyncio.sleep(delay)
+
+        try:
+            with metrics.timed(f"scheduler.{name}"):
+                await job(*args)
+        except Exception as e:
+            logger.error(f"Scheduled job {name} failed: {e}", exc_info=True)
+            metrics.increment("scheduler.errors")
+
+        await asyncio.sleep(MIN_PAUSE_SECONDS)
+
+
+def scheduled_jobs(bot) -> list:
+    """Корутины задач по расписанию для запуска в фоне"""
+    if not SCHEDULER_ENABLED:
+        return []
+
+    jobs = [
+        run_at("prepare_exports", EXPORT_PREPARE_AT, prepare_exports),
+        run_at("prune_changes", EXPORT_PREPARE_AT, prune_changes, CHANGES_RETENTION_DAYS),
+    ]
+    if DIGEST_ENABLED:
+        jobs.append(run_at("digest", DIGEST_AT, send_digests, bot, weekday=DIGEST_WEEKDAY))
+    return jobs
@@ -0,0 +1,241 @@
+"""
+Очередь исходящих запросов к Telegram
+
+Request-middleware сессии бота (см. main.create_bot), через которую идут все
+вызовы API с chat_id: message.answer, edit_text, send_document и т.д.
+
+- Ведра токенов: общее на бота (SEND_GLOBAL_RATE) и на каждый чат
+  (SEND_CHAT_RATE, в группах SEND_GROUP_RATE), вместо ответов 429.
+- Если Telegram все же вернул 429, ведро чата блокируется на retry_after,
+  и запрос повторяется (до SEND_MAX_RETRIES раз).
+- Подряд идущие edit_text одного сообщения склеиваются: пока правка ждет
+  своей очереди, новая правка заменяет ее текст, и уходит только последняя.
+  Вызовы, чья правка была заменена, получают True.
+- Интерактивные ответы идут раньше фоновых. Фоновые запросы (экспорт)
+  помечаются контекстом:
+
+      with bulk_priority():
+          await message.answer_document(...)
+"""
+
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText
+
+from config import (
+    SEND_GLOBAL_RATE,
+    SEND_CHAT_RATE,
+    SEND_CHAT_BURST,
+    SEND_GROUP_RATE,
+    SEND_MAX_RETRIES,
+)
+import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+
+_priority = ContextVar("send_priority", default=INTERACTIVE)
+
+# Сколько ведер чатов держать, прежде чем удалять простаивающие
+MAX_IDLE_CHAT_BUCKETS = 1000
+
+
+@contextmanager
+def bulk_priority():
+    """Запросы внутри блока пропускают интерактивные ответы вперед"""
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Ведро токенов с очередью ожидания по приоритету"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._waiters = []
+        self._order = itertools.count()
+        self._timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return not self._waiters and self.tokens >= self.burst
+
+    def penalize(self, seconds: float):
+        """Не выдавать токены seconds секунд (ответ 429 с retry_after)"""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    async def acquire(self, priority: int = INTERACTIVE):
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self._schedule()
+        await future
+
+    def _schedule(self):
+        if self._timer is None:
+            delay = max(0.0, (1 - self.tokens) / self.rate)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._grant)
+
+    def _grant(self):
+        self._timer = None
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # ожидающий отменен
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+        if self._waiters:
+            self._schedule()
+
+
+class _PendingEdit:
+    """Правка сообщения, ждущая очереди: отправится последний из поставленных текстов"""
+
+    def __init__(self):
+        self.callers = []
+
+    def add(self, method: EditMessageText) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.callers.append((method, future))
+        return future
+
+    @property
+    def method(self) -> EditMessageText:
+        return self.callers[-1][0]
+
+    def drop(self):
+        """Правка не отправлена (ожидание прервано): все ожидающие получают True"""
+        for _, future in self.callers:
+            if not future.done():
+                future.set_result(True)
+
+    def resolve(self, response=None, error: Exception = None):
+        """Результат - вызову с отправленной правкой, остальным - True"""
+        sent = self.method
+        for method, future in self.callers:
+            if future.done():
+                continue
+            if method is not sent:
+                future.set_result(True)
+            elif error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(response)
+
+
+class SendQueue(BaseRequestMiddleware):
+    """Лимиты отправки, повтор после 429 и склейка правок сообщений"""
+
+    def __init__(
+        self,
+        global_rate: float = SEND_GLOBAL_RATE,
+        chat_rate: float = SEND_CHAT_RATE,
+        chat_burst: int = SEND_CHAT_BURST,
+        group_rate: float = SEND_GROUP_RATE,
+        max_retries: int = SEND_MAX_RETRIES,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+        self._edits = {}
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_IDLE_CHAT_BUCKETS:
+                self._chat_buckets = {key: b for key, b in self._chat_buckets.items() if not b.idle}
+            # Группы и каналы (отрицательный id или @username) ограничены сильнее личных чатов
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    async def _wait_turn(self, chat_id):
+        priority = _priority.get()
+        started = time.perf_counter()
+        await self._chat_bucket(chat_id).acquire(priority)
+        await self.global_bucket.acquire(priority)
+        metrics.observe("send.wait", time.perf_counter() - started)
+
+    async def _send(self, make_request, bot, method, chat_id, waited: bool = False):
+        for attempt in range(self.max_retries + 1):
+            if not waited:
+                await self._wait_turn(chat_id)
+            waited = False
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                metrics.increment("send.retry_after")
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"{type(method).__name__} to chat {chat_id}: retry after {e.retry_after}s")
+                self._chat_bucket(chat_id).penalize(e.retry_after)
+
+    async def _edit(self, make_request, bot, method: EditMessageText, chat_id):
+        key = (chat_id, method.message_id)
+        pending = self._edits.get(key)
+        if pending is not None:
+            # Правка этого сообщения уже ждет очереди - отправится только новый текст
+            metrics.increment("send.coalesced")
+            return await pending.add(method)
+
+        pending = self._edits[key] = _PendingEdit()
+        result = pending.add(method)
+        try:
+            await self._wait_turn(chat_id)
+        except BaseException:
+            result.cancel()
+            pending.drop()
+            raise
+        finally:
+            # Правки, пришедшие после этого момента, встают в очередь заново
+            self._edits.pop(key, None)
+
+        try:
+            response = await self._send(make_request, bot, pending.method, chat_id, waited=True)
+        except Exception as e:
+            pending.resolve(error=e)
+        else:
+            pending.resolve(response)
+        return await result
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # getUpdates, answerCallbackQuery, getFile и т.д. не попадают под лимиты отправки
+            return await make_request(bot, method)
+
+        if isinstance(method, EditMessageText) and method.message_id is not None:
+            return await self._edit(make_request, bot, method, chat_id)
+        return await self._send(make_request, bot, method, chat_id)
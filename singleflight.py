@@ -0,0 +1,49 @@
+"""
+Один запуск на ключ (single-flight)
+
+Если одну и ту же долгую работу одновременно запросили несколько
+обработчиков, выполняется она один раз: первый вызов запускает задачу,
+остальные ждут ее результата (или исключения).
+
+    result, shared = await flight.do(key, lambda: build(...))
+
+shared=True - результат получен от чужого запуска. Отмена одного из
+ожидающих не отменяет общую задачу. Работает в пределах процесса.
+"""
+
+import asyncio
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Объединение одновременных вызовов с одинаковым ключом"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+
+    def _done(self, key, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Исключение получат ожидающие; если их не осталось - не предупреждать о непрочитанном
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, factory) -> tuple:
+        """(результат factory(), shared) - factory вызывается, только если ключ не выполняется"""
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            metrics.increment(f"{self.name}.shared")
+            logger.debug(f"{self.name}: joined in-flight call {key}")
+        else:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+            metrics.increment(f"{self.name}.calls")
+
+        return await asyncio.shield(task), shared
@@ -0,0 +1,50 @@
+"""
+Отчет о времени холодного старта
+
+Пример:
+    report = StartupReport()
+    report.mark("imports")
+    with report.phase("init_database"):
+        await init_database()
+    report.log()
+"""
+
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """Длительность этапов запуска воркера"""
+
+    def __init__(self, started_at: float = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self._last = self.started_at
+        self.phases = []
+
+    def mark(self, name: str):
+        """Завершение этапа, начавшегося после предыдущей отметки"""
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str):
+        """Замер этапа внутри блока with"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.phases.append((name, now - started))
+            self._last = now
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def log(self, title: str = "Startup report"):
+        parts = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases)
+        logger.info(f"{title}: {parts}; total {self.total * 1000:.0f} ms")
@@ -0,0 +1,173 @@
+"""
+Статистика для /stats
+
+Счетчики берутся из таблиц insight_stats_* (миграция 0007), которые
+обновляются триггерами при каждом изменении insights, и держатся в памяти
+CACHE_TIMEOUT_MINUTES (CHANGES_CACHE_MINUTES, пока читается журнал
+изменений - changes.py сбрасывает их по событиям, expire). Инсайты,
+сохраненные или удаленные этим процессом, учитываются в памяти сразу
+(record), без перечитывания. Запрос /stats не читает таблицу insights.
+
+    aggregate = await stats.get()
+    aggregate.heatmap(), aggregate.weekly(8), aggregate.top_users(5)
+"""
+
+import html
+import time
+import asyncio
+import logging
+from collections import Counter
+from datetime import date, timedelta
+
+from config import MACRO_REGIONS, INDUSTRIES, CACHE_TIMEOUT_MINUTES
+from database import get_stats
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TREND_WEEKS = 8
+TOP_USERS = 5
+BAR_WIDTH = 12
+
+
+def week_start(day: date) -> date:
+    """Понедельник недели"""
+    return day - timedelta(days=day.weekday())
+
+
+class StatsAggregate:
+    """Счетчики инсайтов в памяти: по (день, регион, отрасль) и по авторам"""
+
+    def __init__(self, ttl: float = CACHE_TIMEOUT_MINUTES * 60):
+        self.ttl = ttl
+        self.cells = Counter()   # (день ISO, регион, отрасль) -> количество
+        self.users = {}          # user_id -> [количество, последний created_at]
+        self._loaded_at = None
+        self._lock = None
+
+    async def get(self) -> "StatsAggregate":
+        """Агрегат, перечитанный из счетчиков БД не раньше чем ttl назад"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+                await self.refresh()
+        return self
+
+    async def refresh(self):
+        with metrics.timed("stats.refresh"):
+            data = await get_stats()
+        if data is None:
+            # Остаются прежние счетчики; срок не продлевается - следующий запрос попробует снова
+            return
+
+        cells = Counter()
+        for row in data["daily"]:
+            cells[(str(row["day"])[:10], row["macro_region"], row["industry"])] += row["total"]
+        self.cells = cells
+        self.users = {row["user_id"]: [row["total"], row.get("last_at")] for row in data["users"]}
+        self._loaded_at = time.monotonic()
+        logger.info(f"Stats loaded: {len(cells)} cell(s), {len(self.users)} author(s)")
+
+    def expire(self):
+        """Перечитать счетчики из БД при следующем запросе (данные изменились в обход процесса)"""
+        self._loaded_at = None
+
+    def record(self, insight: dict, delta: int = 1):
+        """Учесть сохраненный (delta=1) или удаленный (delta=-1) инсайт без перечитывания"""
+        if self._loaded_at is None:
+            return  # в памяти еще ничего нет - счетчики БД учтут запись при загрузке
+
+        created_at = str(insight.get("created_at") or date.today().isoformat())
+        key = (created_at[:10], insight["macro_region"], insight["industry"])
+        self.cells[key] += delta
+        if self.cells[key] <= 0:
+            del self.cells[key]
+
+        user = self.users.setdefault(insight["user_id"], [0, None])
+        user[0] += delta
+        if delta > 0:
+            user[1] = max(filter(None, [user[1], created_at]))
+
+    # ==================== Срезы ====================
+
+    @property
+    def total(self) -> int:
+        return sum(self.cells.values())
+
+    def by_field(self, index: int) -> Counter:
+        """Количество по региону (index=1) или отрасли (index=2)"""
+        counts = Counter()
+        for key, total in self.cells.items():
+            counts[key[index]] += total
+        return counts
+
+    def heatmap(self) -> Counter:
+        """(регион, отрасль) -> количество"""
+        counts = Counter()
+        for (_, region, industry), total in self.cells.items():
+            counts[(region, industry)] += total
+        return counts
+
+    def added_since(self, days: int) -> int:
+        since = (date.today() - timedelta(days=days)).isoformat()
+        return sum(total for (day, _, _), total in self.cells.items() if day >= since)
+
+    def weekly(self, weeks: int = TREND_WEEKS) -> list:
+        """[(понедельник, количество)] за последние weeks недель, старые сначала"""
+        first = week_start(date.today()) - timedelta(weeks=weeks - 1)
+        counts = Counter()
+        for (day, _, _), total in self.cells.items():
+            monday = week_start(date.fromisoformat(day))
+            if monday >= first:
+                counts[monday] += total
+        return [(first + timedelta(weeks=i), counts[first + timedelta(weeks=i)]) for i in range(weeks)]
+
+    def top_users(self, limit: int = TOP_USERS) -> list:
+        """[(user_id, количество)] самых активных авторов"""
+        ranked = sorted(((total, user_id) for user_id, (total, _) in self.users.items() if total > 0), reverse=True)
+        return [(user_id, total) for total, user_id in ranked[:limit]]
+
+
+stats = StatsAggregate()
+
+
+def _bar(value: int, maximum: int) -> str:
+    return "▇" * (round(value * BAR_WIDTH / maximum) if maximum else 0)
+
+
+def format_stats(aggregate: StatsAggregate, user_id: int) -> str:
+    """Текст /stats (HTML): итоги, тепловая карта регион x отрасль, динамика и авторы"""
+    lines = [
+        "📈 <b>Статистика инсайтов</b>",
+        "",
+        f"Всего: <b>{aggregate.total}</b>",
+        f"За 7 дней: +{aggregate.added_since(7)} · за 30 дней: +{aggregate.added_since(30)}",
+        "",
+        "🗺️ <b>Регион × отрасль</b>",
+    ]
+
+    # Таблица моноширинным шрифтом: отрасли - по первым 4 буквам
+    heatmap = aggregate.heatmap()
+    label = max(len(region) for region in MACRO_REGIONS)
+    rows = [" " * label + "".join(f"{industry[:4]:>5}" for industry in INDUSTRIES) + "    Σ"]
+    for region in MACRO_REGIONS:
+        counts = [heatmap[(region, industry)] for industry in INDUSTRIES]
+        rows.append(f"{region:<{label}}" + "".join(f"{count or '·':>5}" for count in counts) + f"{sum(counts):>5}")
+    lines.append(f"<pre>{html.escape(chr(10).join(rows))}</pre>")
+
+    weekly = aggregate.weekly()
+    maximum = max(total for _, total in weekly)
+    lines += ["", f"📅 <b>По неделям</b> (последние {len(weekly)})"]
+    lines += [f"{monday:%d.%m} {_bar(total, maximum)} {total}" for monday, total in weekly]
+
+    top = aggregate.top_users()
+    own = aggregate.users.get(user_id, [0, None])
+    lines += [
+        "",
+        f"👤 <b>Авторы</b>: {sum(1 for total, _ in aggregate.users.values() if total > 0)}",
+        "Самые активные: " + (", ".join(str(total) for _, total in top) or "—"),
+        f"Ваши инсайты: {own[0]}" + (f" (последний {str(own[1])[:10]})" if own[0] and own[1] else ""),
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,674 @@
+"""
+Хранилища инсайтов
+
+InsightRepository - общий интерфейс, через который database.py работает с данными.
+Реализации:
+    SupabaseRepository - Supabase (PostgREST), основной режим
+    SQLiteRepository   - локальный файл SQLite (WAL), офлайн-режим для разработки,
+                         бенчмарков и небольших установок на одном сервере
+
+Выбор - переменная STORAGE_BACKEND (supabase | sqlite).
+
+Фильтры во всех методах - словарь с необязательными ключами:
+    macro_region, industry, user_id, file_unique_id, content_hash - точное совпадение
+    date_from  - created_at >= date_from
+    date_to    - created_at < date_to
+    unmirrored - True: есть вложение, но нет локальной копии (file_hash, см. mirror.py)
+    unindexed  - True: нет хеша текста для поиска повторов (content_hash, см. dedup.py)
+    before     - {created_at, id} последней показанной записи: только записи после нее
+                 в порядке "новые сначала" (keyset-пагинация, без OFFSET)
+"""
+
+import time
+import json
+import asyncio
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decouple import config
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = config('STORAGE_BACKEND', default='supabase')
+SQLITE_PATH = config('SQLITE_PATH', default='insights.db')
+EXPORT_BATCH_SIZE = config('EXPORT_BATCH_SIZE', default=1000, cast=int)
+# Больше строк PostgREST (max-rows в Supabase) за один запрос не отдает
+POSTGREST_MAX_ROWS = 1000
+
+INSIGHT_FIELDS = ('theme', 'description', 'macro_region', 'industry', 'file_id', 'filename',
+                  'file_type', 'file_size', 'file_unique_id', 'file_hash', 'content_hash')
+EQUALITY_FILTERS = ('macro_region', 'industry', 'user_id', 'file_unique_id', 'content_hash')
+FACET_FIELDS = ('macro_region', 'industry', 'user_id')
+
+
+def _iso(value) -> str:
+    """Граница периода в виде ISO-строки"""
+    return value.isoformat() if isinstance(value, (date, datetime)) else str(value)
+
+
+def matches_filters(filters: dict, insight: dict) -> bool:
+    """
+    Может ли запись попадать под фильтры (для сброса кэшей по изменившимся записям)
+
+    Курсор before не проверяется - с ним ответ всегда "может".
+    """
+    filters = filters or {}
+    for field in EQUALITY_FILTERS:
+        if filters.get(field) is not None and str(filters[field]) != str(insight.get(field)):
+            return False
+
+    created_at = insight.get('created_at')
+    if created_at is not None:
+        if filters.get('date_from') is not None and str(created_at) < _iso(filters['date_from']):
+            return False
+        if filters.get('date_to') is not None and str(created_at) >= _iso(filters['date_to']):
+            return False
+
+    if filters.get('unmirrored') and not (insight.get('file_id') and not insight.get('file_hash')):
+        return False
+    if filters.get('unindexed') and insight.get('content_hash'):
+        return False
+    return True
+
+
+def _check_update_fields(fields: dict):
+    unknown = set(fields) - set(INSIGHT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unsupported insight fields: {sorted(unknown)}")
+
+
+def _check_facet_field(field: str):
+    if field not in FACET_FIELDS:
+        raise ValueError(f"Unsupported facet field: {field}")
+
+
+class InsightRepository(ABC):
+    """Интерфейс хранилища инсайтов"""
+
+    # time.monotonic() последнего запроса
+    last_used = 0.0
+
+    @abstractmethod
+    async def save(self, data: dict, user_id: int) -> list:
+        """Сохранение инсайта, возвращает список созданных записей"""
+
+    @abstractmethod
+    async def count(self, filters: dict = None) -> int:
+        """Количество инсайтов по фильтрам"""
+
+    @abstractmethod
+    async def facet_counts(self, field: str, filters: dict = None) -> dict:
+        """Количество инсайтов по значениям поля: {значение: количество}"""
+
+    @abstractmethod
+    async def filtered_page(self, filters: dict = None, limit: int = None, offset: int = 0) -> list:
+        """Страница инсайтов по фильтрам, новые сначала (limit=None - все)"""
+
+    @abstractmethod
+    async def get_by_id(self, insight_id: int):
+        """Инсайт по ID или None"""
+
+    @abstractmethod
+    async def update(self, insight_id: int, fields: dict, user_id: int = None) -> bool:
+        """Изменение полей инсайта (только владельцем, если задан user_id)"""
+
+    @abstractmethod
+    async def delete(self, insight_id: int, user_id: int) -> bool:
+        """Удаление инсайта владельцем"""
+
+    @abstractmethod
+    def export_stream(self, filters: dict = None, batch_size: int = EXPORT_BATCH_SIZE):
+        """Асинхронный генератор пачек инсайтов по фильтрам, новые сначала"""
+
+    @abstractmethod
+    async def daily_stats(self) -> list:
+        """Счетчики по дням, регионам и отраслям (миграция 0007): day, macro_region, industry, total"""
+
+    @abstractmethod
+    async def user_stats(self) -> list:
+        """Счетчики по авторам: user_id, total, last_at"""
+
+    @abstractmethod
+    async def subscribe(self, user_id: int, chat_id: int, macro_region: str = None):
+        """Подписка на дайджест (повторная - заменяет регион)"""
+
+    @abstractmethod
+    async def unsubscribe(self, user_id: int) -> bool:
+        """Отписка от дайджеста"""
+
+    @abstractmethod
+    async def subscriptions(self) -> list:
+        """Все подписки на дайджест"""
+
+    @abstractmethod
+    async def save_minhash(self, insight: dict, buckets: list):
+        """Корзины LSH инсайта (миграция 0010)"""
+
+    @abstractmethod
+    async def minhash_candidates(self, macro_region: str, industry: str, buckets: list, limit: int) -> list:
+        """ID инсайтов региона и отрасли с общими корзинами, больше совпадений - раньше"""
+
+    @abstractmethod
+    async def changes(self, after: int, limit: int) -> list:
+        """События журнала изменений (миграция 0009) с version > after по возрастанию"""
+
+    @abstractmethod
+    async def last_change_version(self) -> int:
+        """Номер последнего события журнала (0 - журнал пуст)"""
+
+    @abstractmethod
+    async def prune_changes(self, before) -> int:
+        """Удаление событий журнала старше before"""
+
+    async def ensure_partitions(self, months_ahead: int = 2) -> int:
+        """Создание помесячных секций (если хранилище их поддерживает)"""
+        return 0
+
+    async def ping(self):
+        """Дешевый запрос для прогрева соединений"""
+
+    @property
+    def idle_seconds(self) -> float:
+        """Сколько секунд не было запросов (для периодического прогрева)"""
+        return time.monotonic() - self.last_used
+
+    async def close(self):
+        """Освобождение ресурсов"""
+
+
+# ==================== Supabase ====================
+
+# Пул HTTP-соединений к PostgREST, общий для всех запросов процесса
+DB_POOL_MAX_CONNECTIONS = config('DB_POOL_MAX_CONNECTIONS', default=10, cast=int)
+DB_POOL_MAX_KEEPALIVE = config('DB_POOL_MAX_KEEPALIVE', default=10, cast=int)
+DB_POOL_KEEPALIVE_SECONDS = config('DB_POOL_KEEPALIVE_SECONDS', default=300, cast=float)
+DB_HTTP2 = config('DB_HTTP2', default=True, cast=bool)
+DB_TIMEOUT_SECONDS = config('DB_TIMEOUT_SECONDS', default=10, cast=float)
+
+
+class SupabaseRepository(InsightRepository):
+    """
+    Хранилище в Supabase через PostgREST
+
+    Клиент supabase-py синхронный, поэтому запросы выполняются в отдельном пуле
+    потоков размером DB_POOL_MAX_CONNECTIONS и не блокируют обработку обновлений.
+    HTTP-сессия PostgREST заменяется на httpx-клиент с настроенным пулом
+    keep-alive соединений (и HTTP/2, если установлен h2). Ожидание свободного
+    слота пула пишется в метрику db.pool_wait.
+    """
+
+    def __init__(self, url: str = None, key: str = None):
+        from supabase import create_client
+
+        self.client = create_client(url or config('SUPABASE_URL'), key or config('SUPABASE_KEY'))
+        self._session = None
+        self._semaphore = None
+        self._executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX_CONNECTIONS, thread_name_prefix='supabase')
+        self.last_used = 0.0
+
+    def _create_session(self, postgrest):
+        """httpx-клиент PostgREST с настроенным пулом соединений"""
+        import httpx
+        from postgrest.utils import SyncClient
+
+        old = postgrest.session
+        try:
+            import h2  # noqa: F401
+            http2 = DB_HTTP2
+        except ImportError:
+            http2 = False
+
+        session = SyncClient(
+            base_url=old.base_url,
+            headers=old.headers,
+            timeout=httpx.Timeout(DB_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=DB_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=DB_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=DB_POOL_KEEPALIVE_SECONDS,
+            ),
+            follow_redirects=True,
+            http2=http2,
+        )
+        old.close()
+        logger.info(f"Supabase HTTP pool: max {DB_POOL_MAX_CONNECTIONS} connections, "
+                    f"keep-alive {DB_POOL_KEEPALIVE_SECONDS:.0f}s, http2={http2}")
+        return session
+
+    def _rest(self):
+        """PostgREST-клиент с общей HTTP-сессией (supabase-py пересоздает его при смене авторизации)"""
+        postgrest = self.client.postgrest
+        if self._session is None:
+            self._session = self._create_session(postgrest)
+        if postgrest.session is not self._session:
+            postgrest.session.close()
+            postgrest.session = self._session
+        return postgrest
+
+    def _table(self):
+        return self._rest().from_('insights')
+
+    async def _execute(self, query):
+        """Выполнение запроса в пуле потоков с учетом ожидания свободного соединения"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(DB_POOL_MAX_CONNECTIONS)
+
+        waiting_since = time.perf_counter()
+        async with self._semaphore:
+            started = time.perf_counter()
+            metrics.observe("db.pool_wait", started - waiting_since)
+            metrics.increment("db.queries")
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._executor, query.execute)
+            except Exception:
+                metrics.increment("db.errors")
+                raise
+            finally:
+                metrics.observe("db.query", time.perf_counter() - started)
+                self.last_used = time.monotonic()
+
+    def _apply_filters(self, query, filters: dict = None):
+        filters = filters or {}
+
+        for field in EQUALITY_FILTERS:
+            if filters.get(field) is not None:
+                query = query.eq(field, filters[field])
+
+        if filters.get('date_from') is not None:
+            query = query.gte('created_at', _iso(filters['date_from']))
+
+        if filters.get('date_to') is not None:
+            query = query.lt('created_at', _iso(filters['date_to']))
+
+        if filters.get('unmirrored'):
+            query = query.not_.is_('file_id', 'null').is_('file_hash', 'null')
+
+        if filters.get('unindexed'):
+            query = query.is_('content_hash', 'null')
+
+        if filters.get('before') is not None:
+            created_at, insight_id = f'"{filters["before"]["created_at"]}"', filters['before']['id']
+            query = query.or_(f"created_at.lt.{created_at},and(created_at.eq.{created_at},id.lt.{insight_id})")
+
+        return query
+
+    async def save(self, data: dict, user_id: int) -> list:
+        row = {field: data.get(field) for field in INSIGHT_FIELDS}
+        row['user_id'] = user_id
+        response = await self._execute(self._table().insert(row))
+        return response.data
+
+    async def count(self, filters: dict = None) -> int:
+        # Количество берется из Content-Range; limit(1) - чтобы не тянуть сами строки
+        # (head=True в postgrest-py 0.17 теряет count на пустом теле ответа)
+        query = self._table().select('id', count='exact').limit(1)
+        response = await self._execute(self._apply_filters(query, filters))
+        return response.count or 0
+
+    async def facet_counts(self, field: str, filters: dict = None) -> dict:
+        _check_facet_field(field)
+        filters = filters or {}
+
+        # Группировка на стороне БД (миграция 0003); без нее - одна выборка поля
+        try:
+            response = await self._execute(self._rest().rpc('insight_facet_counts', {
+                'p_field': field,
+                'p_macro_region': filters.get('macro_region'),
+                'p_industry': filters.get('industry'),
+                'p_user_id': filters.get('user_id'),
+            }))
+            return {row['value']: row['total'] for row in response.data}
+        except Exception as e:
+            logger.warning(f"insight_facet_counts RPC failed, counting on the client: {e}")
+
+        rows = await self._select_pages(
+            lambda: self._apply_filters(self._table().select(f'id,{field}'), filters).order('id'))
+        counts = {}
+        for row in rows:
+            counts[str(row[field])] = counts.get(str(row[field]), 0) + 1
+        return counts
+
+    async def filtered_page(self, filters: dict = None, limit: int = None, offset: int = 0) -> list:
+        return await self._select_pages(
+            lambda: self._apply_filters(self._table().select('*'), filters)
+            .order('created_at', desc=True).order('id', desc=True),
+            offset, limit)
+
+    async def _select_pages(self, build, offset: int = 0, limit: int = None) -> list:
+        """
+        Строки запроса страницами по POSTGREST_MAX_ROWS, иначе ответ молча обрезается
+
+        build() - новый запрос с фильтрами и однозначным порядком; limit=None - все строки
+        """
+        rows = []
+        while limit is None or len(rows) < limit:
+            size = POSTGREST_MAX_ROWS if limit is None else min(POSTGREST_MAX_ROWS, limit - len(rows))
+            start = offset + len(rows)
+            batch = (await self._execute(build().range(start, start + size - 1))).data
+            rows += batch
+            if len(batch) < size:
+                break
+        return rows
+
+    async def get_by_id(self, insight_id: int):
+        response = await self._execute(self._table().select('*').eq('id', insight_id).limit(1))
+        return response.data[0] if response.data else None
+
+    async def update(self, insight_id: int, fields: dict, user_id: int = None) -> bool:
+        _check_update_fields(fields)
+        query = self._table().update(fields).eq('id', insight_id)
+        if user_id is not None:
+            query = query.eq('user_id', user_id)
+        response = await self._execute(query)
+        return bool(response.data)
+
+    async def delete(self, insight_id: int, user_id: int) -> bool:
+        response = await self._execute(self._table().delete().eq('id', insight_id).eq('user_id', user_id))
+        return bool(response.data)
+
+    async def export_stream(self, filters: dict = None, batch_size: int = EXPORT_BATCH_SIZE):
+        # Keyset-пагинация по (created_at, id): каждая пачка - индексный диапазон без OFFSET
+        filters = dict(filters or {})
+        while True:
+            batch = await self.filtered_page(filters, limit=batch_size)
+            if not batch:
+                return
+
+            yield batch
+
+            if len(batch) < batch_size:
+                return
+            filters['before'] = batch[-1]
+
+    async def _select_all(self, table: str, *order: str) -> list:
+        """Все строки небольшой служебной таблицы; order - столбцы первичного ключа"""
+        def build():
+            query = self._rest().from_(table).select('*').gt('total', 0)
+            for column in order:
+                query = query.order(column)
+            return query
+
+        return await self._select_pages(build)
+
+    async def daily_stats(self) -> list:
+        return await self._select_all('insight_stats_daily', 'day', 'macro_region', 'industry')
+
+    async def user_stats(self) -> list:
+        return await self._select_all('insight_stats_users', 'user_id')
+
+    async def subscribe(self, user_id: int, chat_id: int, macro_region: str = None):
+        await self._execute(self._rest().from_('digest_subscriptions').upsert(
+            {'user_id': user_id, 'chat_id': chat_id, 'macro_region': macro_region}
+        ))
+
+    async def unsubscribe(self, user_id: int) -> bool:
+        response = await self._execute(self._rest().from_('digest_subscriptions').delete().eq('user_id', user_id))
+        return bool(response.data)
+
+    async def subscriptions(self) -> list:
+        return (await self._execute(self._rest().from_('digest_subscriptions').select('*'))).data
+
+    async def save_minhash(self, insight: dict, buckets: list):
+        rows = [{'macro_region': insight['macro_region'], 'industry': insight['industry'],
+                 'bucket': bucket, 'insight_id': insight['id']} for bucket in buckets]
+        await self._execute(self._rest().from_('insight_minhash').upsert(rows, ignore_duplicates=True))
+
+    async def minhash_candidates(self, macro_region: str, industry: str, buckets: list, limit: int) -> list:
+        query = (self._rest().from_('insight_minhash').select('insight_id')
+                 .eq('macro_region', macro_region).eq('industry', industry).in_('bucket', buckets))
+        counts = {}
+        for row in (await self._execute(query)).data:
+            counts[row['insight_id']] = counts.get(row['insight_id'], 0) + 1
+        return sorted(counts, key=counts.get, reverse=True)[:limit]
+
+    async def changes(self, after: int, limit: int) -> list:
+        query = self._rest().from_('insight_changes').select('*').gt('version', after).order('version').limit(limit)
+        return (await self._execute(query)).data
+
+    async def last_change_version(self) -> int:
+        query = self._rest().from_('insight_changes').select('version').order('version', desc=True).limit(1)
+        response = await self._execute(query)
+        return response.data[0]['version'] if response.data else 0
+
+    async def prune_changes(self, before) -> int:
+        response = await self._execute(self._rest().from_('insight_changes').delete().lt('changed_at', _iso(before)))
+        return len(response.data)
+
+    async def ensure_partitions(self, months_ahead: int = 2) -> int:
+        response = await self._execute(self._rest().rpc('ensure_insights_partitions', {'months_ahead': months_ahead}))
+        return response.data or 0
+
+    async def ping(self):
+        await self._execute(self._table().select('id').limit(1))
+
+    async def close(self):
+        if self._session is not None:
+            self._session.close()
+        self._executor.shutdown(wait=False)
+
+
+# ==================== SQLite ====================
+
+class SQLiteRepository(InsightRepository):
+    """
+    Локальное хранилище в SQLite
+
+    Одно соединение в режиме WAL, запросы выполняются в отдельном потоке
+    под блокировкой. Все запросы параметризованы и берутся из кэша
+    подготовленных выражений sqlite3. Схема создается миграциями migrations/sqlite.
+    """
+
+    def __init__(self, path: str = SQLITE_PATH):
+        from migrate import migrate
+
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, cached_statements=256)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("PRAGMA temp_store = MEMORY")
+        migrate(self.conn, 'sqlite')
+
+    def _query(self, sql: str, args: tuple = ()) -> list:
+        with self._lock:
+            self.last_used = time.monotonic()
+            return [dict(row) for row in self.conn.execute(sql, args).fetchall()]
+
+    def _execute(self, sql: str, args: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            self.last_used = time.monotonic()
+            return self.conn.execute(sql, args)
+
+    @staticmethod
+    def _where(filters: dict = None) -> tuple:
+        filters = filters or {}
+        clauses, args = [], []
+
+        for field in EQUALITY_FILTERS:
+            if filters.get(field) is not None:
+                clauses.append(f"{field} = ?")
+                args.append(filters[field])
+
+        if filters.get('date_from') is not None:
+            clauses.append("created_at >= ?")
+            args.append(_iso(filters['date_from']))
+
+        if filters.get('date_to') is not None:
+            clauses.append("created_at < ?")
+            args.append(_iso(filters['date_to']))
+
+        if filters.get('unmirrored'):
+            clauses.append("file_id IS NOT NULL AND file_hash IS NULL")
+
+        if filters.get('unindexed'):
+            clauses.append("content_hash IS NULL")
+
+        if filters.get('before') is not None:
+            clauses.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            args += [filters['before']['created_at'], filters['before']['created_at'], filters['before']['id']]
+
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, args
+
+    async def save(self, data: dict, user_id: int) -> list:
+        def insert():
+            with self._lock:
+                cursor = self.conn.execute(
+                    f"INSERT INTO insights ({', '.join(INSIGHT_FIELDS)}, user_id) "
+                    f"VALUES ({', '.join('?' * (len(INSIGHT_FIELDS) + 1))}) RETURNING *",
+                    tuple(data.get(field) for field in INSIGHT_FIELDS) + (user_id,)
+                )
+                return [dict(row) for row in cursor.fetchall()]
+
+        return await asyncio.to_thread(insert)
+
+    async def count(self, filters: dict = None) -> int:
+        where, args = self._where(filters)
+        rows = await asyncio.to_thread(self._query, f"SELECT count(*) AS total FROM insights{where}", tuple(args))
+        return rows[0]['total']
+
+    async def facet_counts(self, field: str, filters: dict = None) -> dict:
+        _check_facet_field(field)
+        where, args = self._where(filters)
+        rows = await asyncio.to_thread(
+            self._query,
+            f"SELECT {field} AS value, count(*) AS total FROM insights{where} GROUP BY {field}",
+            tuple(args)
+        )
+        return {str(row['value']): row['total'] for row in rows}
+
+    async def filtered_page(self, filters: dict = None, limit: int = None, offset: int = 0) -> list:
+        where, args = self._where(filters)
+        sql = f"SELECT * FROM insights{where} ORDER BY created_at DESC, id DESC"
+
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            args += [limit, offset]
+
+        return await asyncio.to_thread(self._query, sql, tuple(args))
+
+    async def get_by_id(self, insight_id: int):
+        rows = await asyncio.to_thread(self._query, "SELECT * FROM insights WHERE id = ?", (insight_id,))
+        return rows[0] if rows else None
+
+    async def update(self, insight_id: int, fields: dict, user_id: int = None) -> bool:
+        _check_update_fields(fields)
+        sql = f"UPDATE insights SET {', '.join(f'{field} = ?' for field in fields)} WHERE id = ?"
+        args = [*fields.values(), insight_id]
+        if user_id is not None:
+            sql += " AND user_id = ?"
+            args.append(user_id)
+        cursor = await asyncio.to_thread(self._execute, sql, tuple(args))
+        return cursor.rowcount > 0
+
+    async def delete(self, insight_id: int, user_id: int) -> bool:
+        cursor = await asyncio.to_thread(
+            self._execute, "DELETE FROM insights WHERE id = ? AND user_id = ?", (insight_id, user_id)
+        )
+        return cursor.rowcount > 0
+
+    async def export_stream(self, filters: dict = None, batch_size: int = EXPORT_BATCH_SIZE):
+        filters = dict(filters or {})
+        while True:
+            batch = await self.filtered_page(filters, limit=batch_size)
+            if not batch:
+                return
+
+            yield batch
+
+            if len(batch) < batch_size:
+                return
+            filters['before'] = batch[-1]
+
+    async def daily_stats(self) -> list:
+        return await asyncio.to_thread(
+            self._query, "SELECT day, macro_region, industry, total FROM insight_stats_daily WHERE total > 0"
+        )
+
+    async def user_stats(self) -> list:
+        return await asyncio.to_thread(
+            self._query, "SELECT user_id, total, last_at FROM insight_stats_users WHERE total > 0"
+        )
+
+    async def subscribe(self, user_id: int, chat_id: int, macro_region: str = None):
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO digest_subscriptions (user_id, chat_id, macro_region) VALUES (?, ?, ?)",
+            (user_id, chat_id, macro_region)
+        )
+
+    async def unsubscribe(self, user_id: int) -> bool:
+        cursor = await asyncio.to_thread(
+            self._execute, "DELETE FROM digest_subscriptions WHERE user_id = ?", (user_id,)
+        )
+        return cursor.rowcount > 0
+
+    async def subscriptions(self) -> list:
+        return await asyncio.to_thread(self._query, "SELECT * FROM digest_subscriptions")
+
+    async def save_minhash(self, insight: dict, buckets: list):
+        def insert():
+            with self._lock:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO insight_minhash (macro_region, industry, bucket, insight_id) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(insight['macro_region'], insight['industry'], bucket, insight['id']) for bucket in buckets]
+                )
+
+        await asyncio.to_thread(insert)
+
+    async def minhash_candidates(self, macro_region: str, industry: str, buckets: list, limit: int) -> list:
+        rows = await asyncio.to_thread(
+            self._query,
+            f"SELECT insight_id, count(*) AS shared FROM insight_minhash "
+            f"WHERE macro_region = ? AND industry = ? AND bucket IN ({', '.join('?' * len(buckets))}) "
+            f"GROUP BY insight_id ORDER BY shared DESC LIMIT ?",
+            (macro_region, industry, *buckets, limit)
+        )
+        return [row['insight_id'] for row in rows]
+
+    async def changes(self, after: int, limit: int) -> list:
+        rows = await asyncio.to_thread(
+            self._query, "SELECT * FROM insight_changes WHERE version > ? ORDER BY version LIMIT ?", (after, limit)
+        )
+        for row in rows:
+            for field in ('old_row', 'new_row'):
+                row[field] = json.loads(row[field]) if row[field] else None
+        return rows
+
+    async def last_change_version(self) -> int:
+        rows = await asyncio.to_thread(self._query, "SELECT coalesce(max(version), 0) AS version FROM insight_changes")
+        return rows[0]['version']
+
+    async def prune_changes(self, before) -> int:
+        cursor = await asyncio.to_thread(
+            self._execute, "DELETE FROM insight_changes WHERE changed_at < ?", (_iso(before),)
+        )
+        return cursor.rowcount
+
+    async def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+BACKENDS = {
+    'supabase': SupabaseRepository,
+    'sqlite': SQLiteRepository,
+}
+
+
+def create_repository(backend: str = STORAGE_BACKEND) -> InsightRepository:
+    """Создание хранилища по имени бэкенда"""
+    try:
+        repository_class = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend} (expected one of {', '.join(BACKENDS)})")
+
+    logger.info(f"Using {backend} storage backend")
+    return repository_class()